@@ -0,0 +1,14 @@
+#!/bin/bash
+
+# Ensure we are executing at the buildroot.
+cd "$(git rev-parse --show-toplevel)"
+
+# Times each stage of the perl6 pipeline over a synthetic repo, and flags regressions against the
+# recorded baseline. This fails if there is no baseline, or if it was recorded with different
+# options: record a new one with --write-baseline=build-support/bench/baseline.json.
+BASELINE=build-support/bench/baseline.json
+
+./pants run pants-plugins/upstreamable/bench:pipeline-benchmark -- \
+        --buildroot="$(pwd)" \
+        --baseline="$BASELINE" \
+        "$@"
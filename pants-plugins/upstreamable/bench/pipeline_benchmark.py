@@ -0,0 +1,358 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import argparse
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from pants.util.dirutil import safe_mkdir, safe_rmtree
+from upstreamable.subsystems.rakudo_moar import RakudoMoar
+from upstreamable.subsystems.zef import Zef
+from upstreamable.util.json_files import read_json, write_json_atomic
+
+
+# Each stage of the pipeline, and the workunits (by path, as in the run tracker's stats) which
+# time it.
+STAGES = (
+  ('toolchain',
+   re.compile(r'(^|:)({}|zef)$'.format(re.escape(RakudoMoar.toolchain_workunit_name)))),
+  ('zef_resolve', re.compile(r'(^|:)resolve:requirements$')),
+  ('gather_sources', re.compile(r'(^|:)perl6-prep:sources$')),
+  ('collect_env', re.compile(r'(^|:)perl6-prep:perl6-env$')),
+  ('run', re.compile(r'(^|:)run:perl6$')),
+)
+TOOLCHAIN_STAGE = 'toolchain'
+
+
+def stage_timings(cumulative_timings):
+  """Attribute the workunit timings of a pants run to the stages of the pipeline.
+
+  The toolchain is bootstrapped inside whichever task first needs it, so its time is taken out of
+  that task's stage.
+
+  :param cumulative_timings: The 'cumulative_timings' of the run tracker's stats: a list of
+                             {'label': workunit path, 'timing': seconds}.
+  :returns: A dict of stage name -> seconds, for each stage which ran.
+  """
+  timings = {}
+  for entry in cumulative_timings:
+    timings[entry['label']] = timings.get(entry['label'], 0) + entry['timing']
+
+  stage_labels = {}
+  for label in timings:
+    for stage, pattern in STAGES:
+      if pattern.search(label):
+        stage_labels.setdefault(stage, []).append(label)
+        break
+
+  def nested_in(label, ancestors):
+    return any(label.startswith(ancestor + ':') for ancestor in ancestors)
+
+  toolchain_labels = stage_labels.get(TOOLCHAIN_STAGE, [])
+  toolchain_labels = [l for l in toolchain_labels if not nested_in(l, toolchain_labels)]
+  result = {}
+  for stage, labels in stage_labels.items():
+    if stage == TOOLCHAIN_STAGE:
+      labels = toolchain_labels
+    seconds = sum(timings[label] for label in labels)
+    if stage != TOOLCHAIN_STAGE:
+      seconds -= sum(timings[t] for t in toolchain_labels if nested_in(t, labels))
+    result[stage] = max(seconds, 0)
+  return result
+
+
+def compare_to_baseline(results, baseline, threshold, min_seconds):
+  """Return a description of each stage which got slower than in `baseline`.
+
+  A stage regresses when it takes more than `threshold` (a fraction) longer than in the baseline,
+  and more than `min_seconds` longer, so that noise in very fast stages isn't flagged.
+  """
+  regressions = []
+  for mode, measured in sorted(results['modes'].items()):
+    baseline_stages = baseline.get('modes', {}).get(mode, {}).get('stages', {})
+    for stage, seconds in sorted(measured['stages'].items()):
+      before = baseline_stages.get(stage)
+      if before is None:
+        continue
+      if seconds > before * (1 + threshold) and seconds - before > min_seconds:
+        regressions.append('{} {}: {:.3f}s -> {:.3f}s ({:+.0%})'.format(
+          mode, stage, before, seconds, (seconds - before) / before if before else float('inf')))
+  return regressions
+
+
+def baseline_mismatch(baseline, config):
+  """Return why `baseline` can't be compared against results measured with `config`, or None."""
+  if baseline is None:
+    return 'there is no baseline there'
+  if baseline.get('config') != config:
+    return 'it was measured with {}, not {}'.format(baseline.get('config'), config)
+  return None
+
+
+def _median(values):
+  values = sorted(values)
+  middle = len(values) // 2
+  return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+
+class SyntheticRepo(object):
+  """A buildroot of generated perl6 libraries, resolving zef requirements from a local mirror.
+
+  Library i depends on libraries i - 1 and i // 2, and on one of the generated distributions,
+  each of which depends on the one before it. A single binary uses every module.
+  """
+
+  def __init__(self, root_dir, num_libraries, modules_per_library, num_dists):
+    self.root_dir = root_dir
+    self.num_libraries = num_libraries
+    self.modules_per_library = modules_per_library
+    self.num_dists = num_dists
+
+  binary_spec = 'bin:bench'
+
+  @property
+  def mirror_dir(self):
+    return os.path.join(self.root_dir, 'zef-mirror')
+
+  @property
+  def workdir(self):
+    return os.path.join(self.root_dir, '.pants.d')
+
+  def _write(self, relpath, content):
+    path = os.path.join(self.root_dir, relpath)
+    safe_mkdir(os.path.dirname(path))
+    with io.open(path, 'w', encoding='utf-8') as f:
+      f.write(content)
+
+  @staticmethod
+  def _dist_name(k):
+    return 'Bench::Dist{}'.format(k)
+
+  @staticmethod
+  def _module_name(i, j):
+    return 'BenchL{:04d}M{}'.format(i, j)
+
+  def _library_dependencies(self, i):
+    return sorted(set(d for d in (i - 1, i // 2) if 0 <= d < i))
+
+  def generate(self, buildroot, pants_version):
+    """Write the repo, using the plugin and pants script of the buildroot at `buildroot`."""
+    safe_mkdir(self.root_dir)
+    shutil.copy(os.path.join(buildroot, 'pants'), os.path.join(self.root_dir, 'pants'))
+    self._write('pants.ini', '\n'.join([
+      '[GLOBAL]',
+      'pants_version: {}'.format(pants_version),
+      "pythonpath: +['{}']".format(os.path.join(buildroot, 'pants-plugins')),
+      "backend_packages: +['upstreamable']",
+      '',
+      '[zef]',
+      'mirror_dir: {}'.format(self.mirror_dir),
+      '',
+    ]))
+
+    dists_dir = os.path.join(self.root_dir, 'dists')
+    dist_dirs = []
+    for k in range(self.num_dists):
+      name = self._dist_name(k)
+      dist_dir = os.path.join(dists_dir, name.replace('::', '-'))
+      module_relpath = 'lib/{}.pm6'.format(name.replace('::', '/'))
+      self._write(os.path.join(dist_dir, 'META6.json'), json.dumps({
+        'perl': '6.c',
+        'name': name,
+        'version': '0.0.1',
+        'depends': [self._dist_name(k - 1)] if k > 0 else [],
+        'provides': {name: module_relpath},
+        'source-url': '',
+      }, indent=2, sort_keys=True))
+      self._write(os.path.join(dist_dir, module_relpath),
+                  'unit module {};\n\nsub dist-{}() is export {{ {} }}\n'.format(name, k, k))
+      dist_dirs.append(dist_dir)
+    Zef.add_dists_to_mirror(dist_dirs, self.mirror_dir)
+
+    self._write('3rdparty/perl6/BUILD', ''.join(
+      "zef_requirement_library(\n"
+      "  name='dist{k}',\n"
+      "  requirements=[\n"
+      "    zef_requirement('{name}', '0.0.1'),\n"
+      "  ],\n"
+      ")\n\n".format(k=k, name=self._dist_name(k))
+      for k in range(self.num_dists)))
+
+    for i in range(self.num_libraries):
+      dependencies = ["'libs/l{:04d}'".format(d) for d in self._library_dependencies(i)]
+      if self.num_dists:
+        dependencies.append("'3rdparty/perl6:dist{}'".format(i % self.num_dists))
+      self._write('libs/l{:04d}/BUILD'.format(i), 'perl6_library(\n  dependencies=[\n{}  ],\n)\n'
+                  .format(''.join('    {},\n'.format(d) for d in dependencies)))
+      for j in range(self.modules_per_library):
+        uses = [self._module_name(d, 0) for d in self._library_dependencies(i)]
+        if j > 0:
+          uses.append(self._module_name(i, j - 1))
+        lines = ['use {};'.format(u) for u in uses]
+        if self.num_dists:
+          lines.append('use {};'.format(self._dist_name(i % self.num_dists)))
+        module_name = self._module_name(i, j)
+        lines.extend([
+          '',
+          'module {} {{'.format(module_name),
+          '  our sub value() {{ {} }}'.format(i * self.modules_per_library + j),
+          '}',
+          '',
+          'class {}::Thing {{'.format(module_name),
+          '  has $.count = 0;',
+          '  method bump() { $!count++ }',
+          '}',
+          '',
+        ])
+        self._write('libs/l{:04d}/{}.pm6'.format(i, module_name), '\n'.join(lines))
+
+    all_modules = [self._module_name(i, j)
+                   for i in range(self.num_libraries) for j in range(self.modules_per_library)]
+    self._write('bin/main.p6', ''.join('use {};\n'.format(m) for m in all_modules) +
+                "\nsay 'loaded {} modules';\n".format(len(all_modules)))
+    self._write('bin/BUILD', "perl6_binary(\n  name='bench',\n  dependencies=[\n{}  ],\n"
+                             "  script='main.p6',\n)\n"
+                .format(''.join("    'libs/l{:04d}',\n".format(i)
+                                for i in range(self.num_libraries))))
+
+  def run_pants(self, args, bootstrap_dir=None):
+    """Run `./pants args` in the repo, and return (wall clock seconds, stage timings)."""
+    stats_path = os.path.join(self.root_dir, 'stats.json')
+    if os.path.exists(stats_path):
+      os.unlink(stats_path)
+    argv = ['./pants', '--run-tracker-stats-local-json-file={}'.format(stats_path)]
+    if bootstrap_dir:
+      argv.append('--pants-bootstrapdir={}'.format(bootstrap_dir))
+    # NB: Don't let the environment of a pants run (or a pex) this may be running in leak into the
+    # repo's pants runs.
+    env = {k: v for k, v in os.environ.items()
+           if not (k.startswith('PEX') or (k.startswith('PANTS_') and k != 'PANTS_HOME'))}
+    start = time.time()
+    subprocess.check_call(argv + list(args), cwd=self.root_dir, env=env)
+    wall_seconds = time.time() - start
+    stats = read_json(stats_path) or {}
+    return wall_seconds, stage_timings(stats.get('cumulative_timings', []))
+
+
+def _pants_version(buildroot):
+  with io.open(os.path.join(buildroot, 'pants.ini'), 'r', encoding='utf-8') as f:
+    match = re.search(r'^pants_version:\s*(\S+)', f.read(), re.MULTILINE)
+  if not match:
+    raise Exception('No pants_version in {}.'.format(os.path.join(buildroot, 'pants.ini')))
+  return match.group(1)
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+    description='Time each stage of the perl6 pipeline, cold and warm, over a synthetic repo, '
+                'and print the results as json.')
+  parser.add_argument('--buildroot', default=os.getcwd(),
+                      help='The buildroot whose plugin and pants version are benchmarked.')
+  parser.add_argument('--libraries', type=int, default=20)
+  parser.add_argument('--modules-per-library', type=int, default=5)
+  parser.add_argument('--dists', type=int, default=3,
+                      help='The number of generated distributions in the local zef mirror.')
+  parser.add_argument('--repeats', type=int, default=3,
+                      help='Take the median of this many cold and warm runs.')
+  parser.add_argument('--cold-toolchain', action='store_true',
+                      help='Also bootstrap the toolchain from scratch in each cold run, in a fresh '
+                           'bootstrap dir. This clones rakudobrew, so it needs the network, and '
+                           'builds rakudo unless --prebuilt-archive-dir has an archive of it. '
+                           'Otherwise the toolchain in the usual bootstrap dir is reused.')
+  parser.add_argument('--prebuilt-archive-dir', default=None,
+                      help='Use the prebuilt toolchain archives here when bootstrapping cold.')
+  parser.add_argument('--output', default=None, help='Also write the results to this file.')
+  parser.add_argument('--baseline', default=None,
+                      help='Compare against the results in this file, and exit non-zero if any '
+                           'stage regressed, or if the file is missing or was measured with a '
+                           'different configuration (unless --write-baseline is given).')
+  parser.add_argument('--write-baseline', default=None,
+                      help='Write the results to this file as the new baseline.')
+  parser.add_argument('--threshold', type=float, default=0.2,
+                      help='Flag stages which take this fraction longer than the baseline.')
+  parser.add_argument('--min-seconds', type=float, default=0.25,
+                      help='Never flag stages which take less than this much longer than the '
+                           'baseline.')
+  parser.add_argument('--keep-repo', action='store_true')
+  args = parser.parse_args(argv)
+  buildroot = os.path.realpath(args.buildroot)
+  config = {
+    'libraries': args.libraries,
+    'modules_per_library': args.modules_per_library,
+    'dists': args.dists,
+    'repeats': args.repeats,
+    'cold_toolchain': args.cold_toolchain,
+  }
+
+  # NB: Check the baseline before spending minutes on the runs. A missing or mismatched baseline
+  # is an error, so that a typo or a changed option can't make a regression check pass silently.
+  baseline = None
+  if args.baseline:
+    baseline = read_json(args.baseline)
+    mismatch = baseline_mismatch(baseline, config)
+    if mismatch:
+      baseline = None
+      if not args.write_baseline:
+        print("Can't compare against the baseline at {}: {}. Record one with --write-baseline."
+              .format(args.baseline, mismatch), file=sys.stderr)
+        sys.exit(1)
+      print("Not comparing against the baseline at {}: {}. Writing a new one to {}."
+            .format(args.baseline, mismatch, args.write_baseline), file=sys.stderr)
+
+  scratch_dir = tempfile.mkdtemp(prefix='perl6-pipeline-benchmark.')
+  repo = SyntheticRepo(os.path.join(scratch_dir, 'repo'), args.libraries,
+                       args.modules_per_library, args.dists)
+  repo.generate(buildroot, _pants_version(buildroot))
+  pants_args = ['run', SyntheticRepo.binary_spec]
+  if args.prebuilt_archive_dir:
+    pants_args.insert(0, '--rakudo-moar-prebuilt-archive-dir={}'.format(
+      os.path.realpath(args.prebuilt_archive_dir)))
+
+  samples = {'cold': [], 'warm': []}
+  try:
+    for i in range(args.repeats):
+      safe_rmtree(repo.workdir)
+      bootstrap_dir = None
+      if args.cold_toolchain:
+        bootstrap_dir = os.path.join(scratch_dir, 'bootstrap-{}'.format(i))
+      samples['cold'].append(repo.run_pants(pants_args, bootstrap_dir=bootstrap_dir))
+      samples['warm'].append(repo.run_pants(pants_args, bootstrap_dir=bootstrap_dir))
+      if bootstrap_dir:
+        safe_rmtree(bootstrap_dir)
+  finally:
+    if args.keep_repo:
+      print('The synthetic repo is at {}.'.format(repo.root_dir), file=sys.stderr)
+    else:
+      safe_rmtree(scratch_dir)
+
+  results = {'config': config, 'modes': {}}
+  for mode, runs in samples.items():
+    stages = sorted(set(stage for _, timings in runs for stage in timings))
+    results['modes'][mode] = {
+      'wall_s': _median([wall for wall, _ in runs]),
+      'stages': {stage: _median([timings.get(stage, 0) for _, timings in runs])
+                 for stage in stages},
+    }
+
+  print(json.dumps(results, indent=2, sort_keys=True))
+  for path in (args.output, args.write_baseline):
+    if path:
+      write_json_atomic(path, results)
+
+  if baseline is not None:
+    regressions = compare_to_baseline(results, baseline, args.threshold, args.min_seconds)
+    for regression in regressions:
+      print('REGRESSION: {}'.format(regression), file=sys.stderr)
+    if regressions:
+      sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
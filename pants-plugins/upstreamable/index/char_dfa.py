@@ -0,0 +1,328 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import re
+from bisect import bisect_right
+
+from builtins import chr
+
+
+class PatternSyntaxError(Exception): pass
+
+
+_MAX_CHAR = 0x10FFFF
+
+
+def _normalize(ranges):
+  """Sort and merge inclusive (lo, hi) codepoint ranges."""
+  merged = []
+  for lo, hi in sorted(ranges):
+    if merged and lo <= merged[-1][1] + 1:
+      merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+    else:
+      merged.append((lo, hi))
+  return tuple(merged)
+
+
+def _complement(ranges):
+  result = []
+  prev = 0
+  for lo, hi in _normalize(ranges):
+    if lo > prev:
+      result.append((prev, lo - 1))
+    prev = hi + 1
+  if prev <= _MAX_CHAR:
+    result.append((prev, _MAX_CHAR))
+  return tuple(result)
+
+
+def _contains(ranges, codepoint):
+  return any(lo <= codepoint <= hi for lo, hi in ranges)
+
+
+_DIGIT = ((0x30, 0x39),)
+_SPACE = ((0x09, 0x0D), (0x20, 0x20), (0x85, 0x85), (0xA0, 0xA0), (0x2028, 0x2029),
+          (0x3000, 0x3000))
+# NB: Non-ascii characters are word characters unless they're in one of the common blocks of
+# punctuation and symbols, which is close enough for lexing identifiers.
+_WORD = _normalize(_DIGIT + (
+  (0x41, 0x5A), (0x5F, 0x5F), (0x61, 0x7A),
+  (0xAA, 0xAA), (0xB5, 0xB5), (0xBA, 0xBA), (0xC0, 0xD6), (0xD8, 0xF6), (0xF8, 0x1FFF),
+  (0x2070, 0x218F), (0x2C00, 0x2DFF), (0x3040, 0xFDFF), (0xFE70, 0xFEFF), (0xFF10, 0x10FFFF),
+))
+_CLASS_ESCAPES = {
+  'd': _DIGIT,
+  'D': _complement(_DIGIT),
+  's': _normalize(_SPACE),
+  'S': _complement(_SPACE),
+  'w': _WORD,
+  'W': _complement(_WORD),
+}
+_CHAR_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'f': '\f', 'v': '\v', '0': '\0'}
+
+
+class Nfa(object):
+  """A Thompson NFA over unicode characters, with edges labelled by codepoint ranges."""
+
+  def __init__(self):
+    self.epsilon = []
+    self.edges = []
+    self.accepts = {}
+
+  def new_state(self):
+    self.epsilon.append([])
+    self.edges.append([])
+    return len(self.epsilon) - 1
+
+
+class _PatternParser(object):
+  """Parses a pattern into a fragment (start state, end state) of an Nfa.
+
+  Patterns are a subset of python regular expression syntax: literals, escapes (including \\d,
+  \\s, \\w and their negations, and \\xHH / \\uHHHH), character classes, `.` (anything but a
+  newline), groups (`(...)` and `(?:...)`, which both only group), `|`, `*`, `+` and `?`. There
+  are no anchors, backreferences or counted repetitions: `{` and `}` are literals.
+  """
+
+  def __init__(self, nfa, pattern):
+    self._nfa = nfa
+    self._pattern = pattern
+    self._pos = 0
+
+  def _error(self, message):
+    return PatternSyntaxError('{} at offset {} of {!r}.'.format(message, self._pos, self._pattern))
+
+  def _peek(self):
+    return self._pattern[self._pos] if self._pos < len(self._pattern) else None
+
+  def _take(self):
+    char = self._peek()
+    if char is None:
+      raise self._error('Unexpected end of pattern')
+    self._pos += 1
+    return char
+
+  def parse(self):
+    fragment = self._alternation()
+    if self._peek() is not None:
+      raise self._error('Unexpected {!r}'.format(self._peek()))
+    return fragment
+
+  def _alternation(self):
+    fragments = [self._sequence()]
+    while self._peek() == '|':
+      self._take()
+      fragments.append(self._sequence())
+    if len(fragments) == 1:
+      return fragments[0]
+    start, end = self._nfa.new_state(), self._nfa.new_state()
+    for frag_start, frag_end in fragments:
+      self._nfa.epsilon[start].append(frag_start)
+      self._nfa.epsilon[frag_end].append(end)
+    return start, end
+
+  def _sequence(self):
+    start = end = self._nfa.new_state()
+    while self._peek() not in (None, '|', ')'):
+      frag_start, frag_end = self._postfix()
+      self._nfa.epsilon[end].append(frag_start)
+      end = frag_end
+    return start, end
+
+  def _postfix(self):
+    start, end = self._atom()
+    while self._peek() in ('*', '+', '?'):
+      op = self._take()
+      new_start, new_end = self._nfa.new_state(), self._nfa.new_state()
+      self._nfa.epsilon[new_start].append(start)
+      self._nfa.epsilon[end].append(new_end)
+      if op in ('*', '?'):
+        self._nfa.epsilon[new_start].append(new_end)
+      if op in ('*', '+'):
+        self._nfa.epsilon[end].append(start)
+      start, end = new_start, new_end
+    return start, end
+
+  def _edge(self, ranges):
+    start, end = self._nfa.new_state(), self._nfa.new_state()
+    self._nfa.edges[start].append((ranges, end))
+    return start, end
+
+  def _atom(self):
+    char = self._take()
+    if char == '(':
+      if self._pattern.startswith('?:', self._pos):
+        self._pos += 2
+      fragment = self._alternation()
+      if self._peek() != ')':
+        raise self._error('Unbalanced parentheses')
+      self._take()
+      return fragment
+    elif char == '[':
+      return self._edge(self._char_class())
+    elif char == '.':
+      return self._edge(_complement([(0x0A, 0x0A)]))
+    elif char == '\\':
+      return self._edge(self._escape())
+    elif char in ('*', '+', '?', ')'):
+      raise self._error('Unexpected {!r}'.format(char))
+    return self._edge(((ord(char), ord(char)),))
+
+  def _escape(self):
+    char = self._take()
+    if char in _CLASS_ESCAPES:
+      return _CLASS_ESCAPES[char]
+    elif char in ('x', 'u'):
+      digits = self._pattern[self._pos:self._pos + (2 if char == 'x' else 4)]
+      if not re.match(r'^[0-9a-fA-F]+$', digits) or len(digits) != (2 if char == 'x' else 4):
+        raise self._error('Invalid \\{} escape'.format(char))
+      self._pos += len(digits)
+      codepoint = int(digits, 16)
+      return ((codepoint, codepoint),)
+    codepoint = ord(_CHAR_ESCAPES.get(char, char))
+    return ((codepoint, codepoint),)
+
+  def _char_class(self):
+    negated = self._peek() == '^'
+    if negated:
+      self._take()
+    ranges = []
+    first = True
+    while first or self._peek() != ']':
+      first = False
+      char = self._take()
+      if char == '\\':
+        escaped = self._escape()
+        if len(escaped) != 1 or escaped[0][0] != escaped[0][1]:
+          ranges.extend(escaped)
+          continue
+        lo = escaped[0][0]
+      else:
+        lo = ord(char)
+      hi = lo
+      if self._peek() == '-' and self._pattern[self._pos + 1:self._pos + 2] not in ('', ']'):
+        self._take()
+        char = self._take()
+        hi = self._escape()[0][0] if char == '\\' else ord(char)
+        if hi < lo:
+          raise self._error('Invalid character range')
+      ranges.append((lo, hi))
+    self._take()
+    return _complement(ranges) if negated else _normalize(ranges)
+
+
+class Dfa(object):
+  """A DFA over unicode characters, as flat transition tables indexed by character class.
+
+  Characters are first mapped to classes, the ranges of codepoints which every pattern treats the
+  same, so the table has a column per class rather than per character: state `s` moves to
+  `transitions[s * num_classes + class]`, or to -1 when no pattern can continue.
+
+  A state which loops back to itself on most characters is "accelerated": `accelerators[s]` is a
+  compiled regex finding the next character which leaves it, so scanning through a long string
+  or comment is a single search rather than a step per character.
+  """
+
+  DEAD = -1
+
+  def __init__(self, nfa, start_states):
+    self._nfa = nfa
+    self._boundaries = self._class_boundaries(nfa)
+    self.num_classes = len(self._boundaries)
+    self.ascii_classes = [self.char_class(c) for c in range(128)]
+
+    state_ids = {}
+    states = []
+    self.transitions = []
+    self.accepts = []
+
+    def add_state(nfa_states):
+      state_id = state_ids.get(nfa_states)
+      if state_id is None:
+        state_id = len(states)
+        state_ids[nfa_states] = state_id
+        states.append(nfa_states)
+        accepted = [nfa.accepts[s] for s in nfa_states if s in nfa.accepts]
+        self.accepts.append(min(accepted) if accepted else -1)
+      return state_id
+
+    self.starts = [add_state(self._closure(s)) for s in start_states]
+    representatives = self._boundaries
+    i = 0
+    while i < len(states):
+      row = []
+      for codepoint in representatives:
+        targets = [end for s in states[i] for ranges, end in nfa.edges[s]
+                   if _contains(ranges, codepoint)]
+        row.append(add_state(self._closure(targets)) if targets else self.DEAD)
+      self.transitions.extend(row)
+      i += 1
+    self.accelerators = [self._accelerator(s) for s in range(len(states))]
+
+  @property
+  def num_states(self):
+    return len(self.accepts)
+
+  def _closure(self, states):
+    closure = set(states)
+    stack = list(states)
+    while stack:
+      for nxt in self._nfa.epsilon[stack.pop()]:
+        if nxt not in closure:
+          closure.add(nxt)
+          stack.append(nxt)
+    return frozenset(closure)
+
+  @staticmethod
+  def _class_boundaries(nfa):
+    """The first codepoint of each character class."""
+    boundaries = set([0])
+    for edges in nfa.edges:
+      for ranges, _ in edges:
+        for lo, hi in ranges:
+          boundaries.add(lo)
+          if hi < _MAX_CHAR:
+            boundaries.add(hi + 1)
+    return sorted(boundaries)
+
+  def char_class(self, codepoint):
+    return bisect_right(self._boundaries, codepoint) - 1
+
+  def _class_ranges(self, class_id):
+    hi = (self._boundaries[class_id + 1] - 1 if class_id + 1 < self.num_classes else _MAX_CHAR)
+    return self._boundaries[class_id], hi
+
+  def _accelerator(self, state):
+    row = self.transitions[state * self.num_classes:(state + 1) * self.num_classes]
+    loops = [k for k, nxt in enumerate(row) if nxt == state]
+    # Only worth it when the state loops on a good part of ascii, as in \w*, [^"]* or [^\n]*.
+    if sum(1 for c in self.ascii_classes if row[c] == state) < 32:
+      return None
+    exits = _complement([self._class_ranges(k) for k in loops])
+    if not exits:
+      return re.compile(r'\Z')
+    return re.compile('[{}]'.format(''.join(
+      re.escape(chr(lo)) if lo == hi else '{}-{}'.format(re.escape(chr(lo)),
+                                                            re.escape(chr(hi)))
+      for lo, hi in exits)), re.UNICODE)
+
+
+def compile_patterns(patterns_by_start):
+  """Compile lists of patterns into a Dfa with a start state per list.
+
+  :param patterns_by_start: A list of lists of (pattern, value) pairs, where each value is a
+                            non-negative int. Where a string matches several patterns, the one
+                            with the least value wins.
+  :returns: A Dfa whose `accepts[state]` is the least value of the patterns matching at that state
+            (or -1), and whose `starts` has a start state per list.
+  """
+  nfa = Nfa()
+  start_states = []
+  for patterns in patterns_by_start:
+    starts = []
+    for pattern, value in patterns:
+      start, end = _PatternParser(nfa, pattern).parse()
+      nfa.accepts[end] = value
+      starts.append(start)
+    start_states.append(starts)
+  return Dfa(nfa, start_states)
@@ -0,0 +1,200 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import heapq
+import json
+import os
+from collections import namedtuple
+
+from upstreamable.index.symbol_index import SymbolIndex, SymbolQueries, write_symbol_index
+
+
+class LayeredSymbolIndex(SymbolQueries):
+  """A base index, minus the files it has stale entries for, plus a delta index of newer files."""
+
+  def __init__(self, base, delta, tombstones):
+    self._base = base
+    self._delta = delta
+    self._tombstones = frozenset(tombstones)
+
+  def close(self):
+    for index in (self._base, self._delta):
+      if index is not None:
+        index.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def lookup(self, name):
+    base_postings = []
+    if self._base is not None:
+      base_postings = [p for p in self._base.lookup(name) if p.path not in self._tombstones]
+    delta_postings = self._delta.lookup(name) if self._delta is not None else []
+    if not delta_postings:
+      return base_postings
+    return sorted(base_postings + delta_postings, key=lambda p: (p.path, p.line, p.col))
+
+  def names_with_prefix(self, prefix, limit=None):
+    """Yield the names starting with `prefix` which have postings in some live file, in order."""
+    layers = [index.names_with_prefix(prefix) for index in (self._base, self._delta)
+              if index is not None]
+    last_name = None
+    count = 0
+    for name in heapq.merge(*layers):
+      if limit is not None and count >= limit:
+        break
+      if name == last_name:
+        continue
+      last_name = name
+      if self._tombstones and not self.lookup(name):
+        continue
+      count += 1
+      yield name
+
+
+class IncrementalSymbolIndex(object):
+  """A symbol index in a directory, updated in proportion to the files which changed.
+
+  The directory contains:
+  - `segments/`: the symbols of each file, keyed by the fingerprint of its content, so a file is
+    only ever lexed once for each distinct content.
+  - `base-<generation>.idx`: an index of many files, as of the last compaction.
+  - `delta-<generation>.idx`: an index of just the files added or changed since then.
+  - `manifest.json`: the names of the current base and delta indices, the content fingerprint of
+    the files in each, and the "tombstones": files whose entries in the base index are stale,
+    because they changed or were removed. Index files are never modified once written, and the
+    manifest is replaced atomically, so readers always see a consistent generation.
+
+  Each update rewrites the delta index, which is proportional to the changes since the last
+  compaction. Once the delta grows past a fraction of the base, the base is rewritten from the
+  segments (without lexing anything) and the delta starts again empty.
+  """
+
+  class UpdateStats(namedtuple('UpdateStats', ['lexed', 'changed', 'removed', 'compacted'])):
+    pass
+
+  _manifest_filename = 'manifest.json'
+
+  def __init__(self, index_dir):
+    self._index_dir = index_dir
+
+  def _path(self, *components):
+    return os.path.join(self._index_dir, *components)
+
+  def _segment_path(self, content_hash):
+    return self._path('segments', content_hash[:2], '{}.json'.format(content_hash))
+
+  def _read_manifest(self):
+    try:
+      with open(self._path(self._manifest_filename), 'r') as f:
+        return json.load(f)
+    except (IOError, OSError, ValueError):
+      return {'generation': 0, 'base_file': None, 'base': {}, 'delta_file': None, 'delta': {},
+              'tombstones': []}
+
+  def _write_json_atomic(self, path, obj):
+    parent = os.path.dirname(path)
+    if not os.path.isdir(parent):
+      os.makedirs(parent)
+    tmp_path = '{}.tmp-{}'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+      json.dump(obj, f, sort_keys=True)
+    os.rename(tmp_path, path)
+
+  def content_hashes(self):
+    """Return the content fingerprint of each file currently in the index."""
+    manifest = self._read_manifest()
+    tombstones = frozenset(manifest['tombstones'])
+    live = {p: h for p, h in manifest['base'].items() if p not in tombstones}
+    live.update(manifest['delta'])
+    return live
+
+  def _read_segment(self, content_hash):
+    with open(self._segment_path(content_hash), 'r') as f:
+      return json.load(f)
+
+  def _symbols_by_file(self, files):
+    for path in sorted(files):
+      yield path, self._read_segment(files[path])
+
+  def update(self, content_hashes, lex_file, compact_ratio=0.25):
+    """Bring the index up to date with the files in `content_hashes`.
+
+    :param dict content_hashes: The content fingerprint of every file which should be indexed.
+    :param lex_file: A function from a file path to its symbols, called only for files with a
+                     content fingerprint which hasn't been seen before.
+    :param float compact_ratio: Rewrite the base index once the delta covers more than this
+                                fraction of the number of files in it.
+    :rtype: :class:`IncrementalSymbolIndex.UpdateStats`
+    """
+    if not os.path.isdir(self._index_dir):
+      os.makedirs(self._index_dir)
+    manifest = self._read_manifest()
+    live = self.content_hashes()
+    changed = sorted(p for p, h in content_hashes.items() if live.get(p) != h)
+    removed = sorted(p for p in live if p not in content_hashes)
+
+    lexed = 0
+    for path in changed:
+      segment_path = self._segment_path(content_hashes[path])
+      if not os.path.exists(segment_path):
+        self._write_json_atomic(segment_path, [list(s) for s in lex_file(path)])
+        lexed += 1
+
+    base = manifest['base']
+    delta = {p: h for p, h in content_hashes.items() if base.get(p) != h}
+    tombstones = sorted(p for p, h in base.items() if content_hashes.get(p) != h)
+    compact = (manifest['base_file'] is None or
+               len(delta) + len(tombstones) > compact_ratio * max(len(base), 1))
+
+    if not (changed or removed or compact):
+      return self.UpdateStats(lexed=0, changed=0, removed=0, compacted=False)
+
+    generation = manifest['generation'] + 1
+    base_file = manifest['base_file']
+    if compact:
+      base_file = 'base-{}.idx'.format(generation)
+      write_symbol_index(self._path(base_file), self._symbols_by_file(content_hashes))
+      base, delta, tombstones = dict(content_hashes), {}, []
+    delta_file = 'delta-{}.idx'.format(generation)
+    write_symbol_index(self._path(delta_file), self._symbols_by_file(delta))
+    self._write_json_atomic(self._path(self._manifest_filename), {
+      'generation': generation,
+      'base_file': base_file,
+      'base': base,
+      'delta_file': delta_file,
+      'delta': delta,
+      'tombstones': tombstones,
+    })
+
+    self._remove_unused_indices(frozenset([base_file, delta_file]))
+    if compact:
+      self._remove_unused_segments(frozenset(content_hashes.values()))
+    return self.UpdateStats(lexed=lexed, changed=len(changed), removed=len(removed),
+                            compacted=compact)
+
+  def _remove_unused_indices(self, used_filenames):
+    # NB: Processes which already have a previous generation mmapped can keep using it.
+    for filename in os.listdir(self._index_dir):
+      if filename.endswith('.idx') and filename not in used_filenames:
+        os.unlink(self._path(filename))
+
+  def _remove_unused_segments(self, used_hashes):
+    segments_dir = self._path('segments')
+    if not os.path.isdir(segments_dir):
+      return
+    for dirpath, _, filenames in os.walk(segments_dir):
+      for filename in filenames:
+        content_hash, ext = os.path.splitext(filename)
+        if ext == '.json' and content_hash not in used_hashes:
+          os.unlink(os.path.join(dirpath, filename))
+
+  def open(self):
+    """Return a LayeredSymbolIndex of the current generation of the index."""
+    manifest = self._read_manifest()
+    base, delta = [SymbolIndex.open(self._path(filename)) if filename else None
+                   for filename in (manifest['base_file'], manifest['delta_file'])]
+    return LayeredSymbolIndex(base, delta, manifest['tombstones'])
@@ -0,0 +1,64 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import argparse
+import glob
+import io
+import json
+import os
+import time
+
+from upstreamable.index import perl6_lexer
+from upstreamable.index.lexer_grammar import LexerGrammar
+
+
+def _best_throughput(tokenize, text, repeats):
+  """Return (MB/s of the fastest of `repeats` runs of `tokenize` over `text`, token count)."""
+  num_bytes = len(text.encode('utf-8'))
+  best = None
+  for _ in range(repeats):
+    start = time.time()
+    num_tokens = sum(1 for _ in tokenize(text))
+    elapsed = time.time() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return num_bytes / (1024 * 1024) / best, num_tokens
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+    description='Measure the throughput of the compiled perl6 lexer grammar against the regex '
+                'alternation lexer, and print it as json.')
+  parser.add_argument('paths', nargs='*',
+                      help='Source files to lex. Defaults to the perl6 sources under cli/.')
+  parser.add_argument('--megabytes', type=float, default=4,
+                      help='Repeat the sources until they amount to this much text.')
+  parser.add_argument('--repeats', type=int, default=3)
+  args = parser.parse_args(argv)
+  paths = args.paths or sorted(glob.glob(os.path.join('cli', '*.pm6')) +
+                               glob.glob(os.path.join('cli', '*.p6')))
+  if not paths:
+    parser.error('No sources to lex.')
+
+  sources = []
+  for path in paths:
+    with io.open(path, 'r', encoding='utf-8') as f:
+      sources.append(f.read())
+  corpus = '\n'.join(sources) + '\n'
+  text = corpus * max(1, int(args.megabytes * 1024 * 1024 / len(corpus.encode('utf-8'))))
+
+  start = time.time()
+  grammar = LexerGrammar.bundled('perl6')
+  compile_seconds = time.time() - start
+
+  report = {'input_mb': len(text.encode('utf-8')) / (1024 * 1024)}
+  for name, tokenize in (('grammar_dfa', grammar.tokenize),
+                         ('regex_alternation', perl6_lexer.tokenize)):
+    mb_per_s, num_tokens = _best_throughput(tokenize, text, args.repeats)
+    report[name] = {'mb_per_s': mb_per_s, 'tokens': num_tokens}
+  report['grammar_dfa']['compile_s'] = compile_seconds
+  report['grammar_dfa']['dfa_states'] = grammar.num_dfa_states
+  print(json.dumps(report, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+  main()
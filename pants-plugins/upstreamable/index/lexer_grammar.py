@@ -0,0 +1,310 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import json
+import os
+import pkgutil
+import re
+
+from upstreamable.index.char_dfa import PatternSyntaxError, compile_patterns
+from upstreamable.index.perl6_lexer import Token, tokenize
+
+
+class LexerGrammarError(Exception): pass
+
+
+BUNDLED_GRAMMARS = ('perl6',)
+
+
+class _Rule(object):
+  """A token rule of a lexer state, after includes are expanded."""
+
+  def __init__(self, kind, pattern, bol, push, pop, goto, heredoc):
+    self.kind = kind
+    self.pattern = pattern
+    self.bol = bol
+    self.push = push
+    self.pop = pop
+    self.goto = goto
+    self.heredoc = heredoc
+
+
+class _LexerState(object):
+  """The rules of one lexer state, compiled into a single Dfa.
+
+  The Dfa has two start states: one for the start of a line, at which rules anchored with `^`
+  apply too, and one for everywhere else.
+  """
+
+  def __init__(self, name, rules, skip):
+    self.name = name
+    self.rules = rules
+    try:
+      dfa = compile_patterns([
+        [(rule.pattern, i) for i, rule in enumerate(rules)],
+        [(rule.pattern, i) for i, rule in enumerate(rules) if not rule.bol],
+      ])
+    except PatternSyntaxError as e:
+      raise LexerGrammarError('In lexer state {!r}: {}'.format(name, e))
+    self.num_dfa_states = dfa.num_states
+
+    # NB: Tokenizing spends most of its time stepping through these tables, so states are stored
+    # as their offsets into the transition table, and everything tokenize needs per state is
+    # indexed by that offset too.
+    num_classes = dfa.num_classes
+    transitions = [t * num_classes if t >= 0 else t for t in dfa.transitions]
+    accept_at = [-1] * len(transitions)
+    accelerator_at = [None] * len(transitions)
+    for state in range(dfa.num_states):
+      accept_at[state * num_classes] = dfa.accepts[state]
+      accelerator_at[state * num_classes] = dfa.accelerators[state]
+    bol_start, start = dfa.starts
+    self.tables = (
+      transitions, accept_at, accelerator_at, dfa.ascii_classes, dfa.char_class,
+      bol_start * num_classes, start * num_classes,
+      [rule.kind for rule in rules],
+      [rule.kind in skip for rule in rules],
+      [(rule.heredoc, rule.pop, rule.goto, rule.push)
+       if rule.heredoc or rule.pop or rule.goto or rule.push else None
+       for rule in rules],
+    )
+
+
+class LexerGrammar(object):
+  r"""A lexer compiled from a declarative json grammar.
+
+  A grammar names the lexer states (modes) it moves between, e.g. code, the inside of a string
+  and the inside of a regex, and lists each state's token rules:
+
+    {
+      "name": "perl6",
+      "file_extensions": [".pm6", ".p6"],
+      "start": "code",
+      "skip": ["ws"],
+      "definitions": {"IDENT": "[^\\W\\d]\\w*"},
+      "states": {
+        "code": [
+          {"match": "\\s+", "kind": "ws"},
+          {"match": "\"", "kind": "str", "push": "string"},
+          {"match": "{IDENT}", "kind": "word"},
+          {"match": "[\\s\\S]", "kind": "punct"}
+        ],
+        "string": [
+          {"match": "\"", "kind": "str", "pop": true},
+          {"include": "escapes"},
+          {"match": "[^\"\\\\]+", "kind": "str"}
+        ],
+        "escapes": [
+          {"match": "\\\\[\\s\\S]", "kind": "str"}
+        ]
+      }
+    }
+
+  Patterns use the syntax described in upstreamable.index.char_dfa, plus `{NAME}` to splice in a
+  definition and a leading `^` to only match at the start of a line. At each position the longest
+  match of the current state's rules wins, and ties go to the rule listed first. A rule may then
+  "push" a state, "pop" back to the previous one, or "goto" another in place of the current one.
+  A rule with a "heredoc" pattern starts a heredoc: the pattern's first group, matched against the
+  token, is the terminator, and from the end of the current line up to and including the first
+  line consisting of the terminator becomes a single "heredoc" token.
+
+  Each state compiles into a single table-driven DFA (see upstreamable.index.char_dfa.Dfa).
+  """
+
+  _RULE_KEYS = frozenset(['match', 'kind', 'push', 'pop', 'goto', 'heredoc'])
+  _DEFINITION_RE = re.compile(r'(?<!\\)\{([A-Z][A-Z0-9_]*)\}')
+
+  HEREDOC_KIND = 'heredoc'
+  ERROR_KIND = 'error'
+
+  _bundled = {}
+
+  @classmethod
+  def bundled(cls, name):
+    """Return one of the BUNDLED_GRAMMARS, which is only compiled once."""
+    if name not in BUNDLED_GRAMMARS:
+      raise LexerGrammarError('No bundled grammar named {!r}.'.format(name))
+    grammar = cls._bundled.get(name)
+    if grammar is None:
+      data = pkgutil.get_data(__name__, 'grammars/{}.json'.format(name))
+      grammar = cls._bundled[name] = cls.from_json(json.loads(data.decode('utf-8')))
+    return grammar
+
+  @classmethod
+  def load(cls, path):
+    with open(path, 'rb') as f:
+      return cls.from_json(json.loads(f.read().decode('utf-8')))
+
+  @classmethod
+  def for_path(cls, path):
+    """Return the bundled grammar for the file at `path`, by its extension, or None."""
+    extension = os.path.splitext(path)[1]
+    for name in BUNDLED_GRAMMARS:
+      grammar = cls.bundled(name)
+      if extension in grammar.file_extensions:
+        return grammar
+    return None
+
+  @classmethod
+  def from_json(cls, obj):
+    try:
+      name = obj['name']
+      start = obj['start']
+      states = obj['states']
+    except KeyError as e:
+      raise LexerGrammarError('A grammar must have a {}.'.format(e))
+    if start not in states:
+      raise LexerGrammarError('Start state {!r} of grammar {!r} is not defined.'
+                              .format(start, name))
+    definitions = obj.get('definitions', {})
+
+    def expand(pattern, depth=0):
+      if depth > len(definitions):
+        raise LexerGrammarError('Definitions in grammar {!r} are recursive.'.format(name))
+
+      def replace(match):
+        if match.group(1) not in definitions:
+          raise LexerGrammarError('Undefined {} in grammar {!r}.'.format(match.group(0), name))
+        return '(?:{})'.format(expand(definitions[match.group(1)], depth + 1))
+      return cls._DEFINITION_RE.sub(replace, pattern)
+
+    def rules_of(state_name, including):
+      if state_name not in states:
+        raise LexerGrammarError('Lexer state {!r} of grammar {!r} is not defined.'
+                                .format(state_name, name))
+      if state_name in including:
+        raise LexerGrammarError('Lexer state {!r} of grammar {!r} includes itself.'
+                                .format(state_name, name))
+      rules = []
+      for spec in states[state_name]:
+        if 'include' in spec:
+          rules.extend(rules_of(spec['include'], including + (state_name,)))
+          continue
+        unknown = set(spec) - cls._RULE_KEYS
+        if unknown or 'match' not in spec or 'kind' not in spec:
+          raise LexerGrammarError('Invalid rule {!r} in lexer state {!r} of grammar {!r}.'
+                                  .format(spec, state_name, name))
+        for target in (spec.get('push'), spec.get('goto')):
+          if target is not None and target not in states:
+            raise LexerGrammarError('Rule {!r} in grammar {!r} moves to undefined state {!r}.'
+                                    .format(spec, name, target))
+        pattern = spec['match']
+        bol = pattern.startswith('^')
+        heredoc = spec.get('heredoc')
+        rules.append(_Rule(kind=spec['kind'],
+                           pattern=expand(pattern[1:] if bol else pattern),
+                           bol=bol,
+                           push=spec.get('push'),
+                           pop=bool(spec.get('pop')),
+                           goto=spec.get('goto'),
+                           heredoc=re.compile(heredoc, re.UNICODE) if heredoc else None))
+      return rules
+
+    skip = frozenset(obj.get('skip', []))
+    lexer_states = {state_name: _LexerState(state_name, rules_of(state_name, ()), skip)
+                    for state_name in states}
+    return cls(name=name,
+               file_extensions=obj.get('file_extensions', []),
+               start=start,
+               skip=skip,
+               states=lexer_states)
+
+  def __init__(self, name, file_extensions, start, skip, states):
+    self.name = name
+    self.file_extensions = frozenset(file_extensions)
+    self._start = start
+    self._skip = frozenset(skip)
+    self._states = states
+
+  @property
+  def num_dfa_states(self):
+    return sum(state.num_dfa_states for state in self._states.values())
+
+  def tokenize(self, text, keep_skipped=False):
+    """Yield the Tokens of `text`, with the same kinds, lines and columns as perl6_lexer.tokenize.
+
+    Characters no rule matches become single-character "error" tokens.
+    """
+    states = self._states
+    stack = [states[self._start]]
+    (transitions, accept_at, accelerator_at, ascii_classes, char_class, bol_start, start,
+     kinds, skipped, actions) = stack[-1].tables
+    pending_heredocs = []
+    pos = 0
+    n = len(text)
+    line = 1
+    line_start = 0
+    while pos < n:
+      # Find the longest match of the current lexer state's rules, and the first rule listed which
+      # matches that much.
+      state = bol_start if pos == 0 or text[pos - 1] == '\n' else start
+      rule_index = -1
+      end = i = pos
+      while i < n:
+        codepoint = ord(text[i])
+        state = transitions[state + (
+          ascii_classes[codepoint] if codepoint < 128 else char_class(codepoint))]
+        if state < 0:
+          break
+        i += 1
+        accelerator = accelerator_at[state]
+        if accelerator is not None:
+          found = accelerator.search(text, i)
+          i = found.start() if found else n
+        if accept_at[state] >= 0:
+          rule_index = accept_at[state]
+          end = i
+
+      if rule_index < 0:
+        kind, skip, action = self.ERROR_KIND, False, None
+        end = pos + 1
+      else:
+        kind, skip, action = kinds[rule_index], skipped[rule_index], actions[rule_index]
+      if pending_heredocs:
+        # A heredoc's body starts on the line after the one which introduced it.
+        newline = text.find('\n', pos, end)
+        if newline >= 0:
+          end = newline + 1
+      if keep_skipped or not skip:
+        yield Token(kind, text[pos:end], line, pos - line_start)
+      newline = text.rfind('\n', pos, end)
+      if newline >= 0:
+        line += text.count('\n', pos, end)
+        line_start = newline + 1
+
+      if action is not None:
+        heredoc, pop, goto, push = action
+        if heredoc is not None:
+          terminator = heredoc.search(text, pos, end)
+          if terminator:
+            pending_heredocs.append(terminator.group(1))
+        if pop and len(stack) > 1:
+          stack.pop()
+        if goto is not None:
+          stack[-1] = states[goto]
+        if push is not None:
+          stack.append(states[push])
+        (transitions, accept_at, accelerator_at, ascii_classes, char_class, bol_start, start,
+         kinds, skipped, actions) = stack[-1].tables
+      pos = end
+
+      if pending_heredocs and text[pos - 1] == '\n':
+        for terminator in pending_heredocs:
+          found = re.compile(r'^[ \t]*{}[ \t]*$'.format(re.escape(terminator)),
+                             re.MULTILINE).search(text, pos)
+          end = found.end() if found else n
+          if end > pos and (keep_skipped or self.HEREDOC_KIND not in self._skip):
+            yield Token(self.HEREDOC_KIND, text[pos:end], line, 0)
+          newline = text.rfind('\n', pos, end)
+          if newline >= 0:
+            line += text.count('\n', pos, end)
+            line_start = newline + 1
+          pos = end
+        pending_heredocs = []
+
+
+def tokenize_path(path, text):
+  """Yield the Tokens of `text`, the contents of the file at `path`, with the bundled grammar for
+  its extension, or with perl6_lexer.tokenize if there is none."""
+  grammar = LexerGrammar.for_path(path)
+  return grammar.tokenize(text) if grammar is not None else tokenize(text)
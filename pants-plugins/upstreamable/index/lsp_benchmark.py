@@ -0,0 +1,119 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from itertools import islice
+
+from future.moves.urllib.parse import quote
+from upstreamable.index.incremental_index import IncrementalSymbolIndex
+from upstreamable.index.lsp_server import read_message, write_message
+
+
+def percentile(sorted_values, q):
+  return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+class LspBenchmarkClient(object):
+  """Drives a language server subprocess over stdio, one request at a time."""
+
+  def __init__(self, server_argv):
+    env = os.environ.copy()
+    env['PYTHONPATH'] = os.pathsep.join(p for p in sys.path if p)
+    self._process = subprocess.Popen(server_argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     env=env)
+    self._next_id = 0
+
+  def request(self, method, params):
+    """Send a request and return (seconds until its response, response)."""
+    self._next_id += 1
+    request_id = self._next_id
+    start = time.time()
+    write_message(self._process.stdin,
+                  {'jsonrpc': '2.0', 'id': request_id, 'method': method, 'params': params})
+    while True:
+      response = read_message(self._process.stdout)
+      if response is None:
+        raise Exception('The server exited while answering {} request {}.'
+                        .format(method, request_id))
+      if response.get('id') == request_id:
+        return time.time() - start, response
+
+  def close(self):
+    self.request('shutdown', None)
+    write_message(self._process.stdin, {'jsonrpc': '2.0', 'method': 'exit'})
+    self._process.stdin.close()
+    self._process.wait()
+
+
+def _benchmark_requests(root_dir, index_dir, num_requests, rng):
+  """Return (method, params) requests for the definitions, references and names in the index."""
+  with IncrementalSymbolIndex(index_dir).open() as index:
+    names = list(islice(index.names_with_prefix(''), 100000))
+    postings = []
+    for name in rng.sample(names, min(len(names), num_requests)):
+      postings.extend((name, p) for p in index.lookup(name)[:1])
+
+  def text_document_position(posting):
+    uri = 'file://{}'.format(quote(os.path.join(root_dir, posting.path)))
+    return {'textDocument': {'uri': uri},
+            'position': {'line': posting.line - 1, 'character': posting.col}}
+
+  requests = []
+  for i in range(num_requests):
+    name, posting = postings[i % len(postings)]
+    if i % 3 == 0:
+      requests.append(('textDocument/definition', text_document_position(posting)))
+    elif i % 3 == 1:
+      params = text_document_position(posting)
+      params['context'] = {'includeDeclaration': True}
+      requests.append(('textDocument/references', params))
+    else:
+      requests.append(('workspace/symbol', {'query': name[:2]}))
+  return requests
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+    description='Measure the latency of the perl6 language server, and print it as json.')
+  parser.add_argument('--root', default=os.getcwd())
+  parser.add_argument('--index-dir', default=None)
+  parser.add_argument('--requests', type=int, default=1000)
+  parser.add_argument('--seed', type=int, default=0)
+  args = parser.parse_args(argv)
+  root_dir = os.path.realpath(args.root)
+  index_dir = args.index_dir or os.path.join(root_dir, '.pants.d', 'index', 'perl6', 'index')
+
+  requests = _benchmark_requests(root_dir, index_dir, args.requests, random.Random(args.seed))
+  client = LspBenchmarkClient([sys.executable, '-m', 'upstreamable.index.lsp_server',
+                               '--root', root_dir, '--index-dir', index_dir])
+  try:
+    client.request('initialize', {'rootUri': 'file://{}'.format(quote(root_dir))})
+    # Wait for the index to load before measuring anything.
+    client.request('workspace/symbol', {'query': ''})
+    latencies = {}
+    for method, params in requests:
+      seconds, _ = client.request(method, params)
+      latencies.setdefault(method, []).append(seconds * 1000)
+  finally:
+    client.close()
+
+  report = {}
+  for method, millis in sorted(latencies.items()):
+    millis.sort()
+    report[method] = {
+      'count': len(millis),
+      'p50_ms': percentile(millis, 0.5),
+      'p99_ms': percentile(millis, 0.99),
+      'max_ms': millis[-1],
+    }
+  print(json.dumps(report, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+  main()
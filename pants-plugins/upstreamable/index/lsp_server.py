@@ -0,0 +1,344 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
+from future.moves.urllib.parse import quote, unquote, urlparse
+from upstreamable.index.incremental_index import IncrementalSymbolIndex
+from upstreamable.index.perl6_lexer import tokenize
+
+logger = logging.getLogger(__name__)
+
+
+def read_message(stream):
+  """Read one JSON-RPC message with LSP base protocol framing, or return None at EOF."""
+  headers = {}
+  while True:
+    line = stream.readline()
+    if not line:
+      return None
+    line = line.strip()
+    if not line:
+      break
+    key, _, value = line.decode('ascii').partition(':')
+    headers[key.strip().lower()] = value.strip()
+  body = stream.read(int(headers['content-length']))
+  return json.loads(body.decode('utf-8'))
+
+
+def write_message(stream, message):
+  body = json.dumps(message).encode('utf-8')
+  stream.write('Content-Length: {}\r\n\r\n'.format(len(body)).encode('ascii'))
+  stream.write(body)
+  stream.flush()
+
+
+class LspError(Exception):
+
+  # See https://github.com/Microsoft/language-server-protocol/blob/master/versions/protocol-2-x.md.
+  METHOD_NOT_FOUND = -32601
+  INTERNAL_ERROR = -32603
+  REQUEST_CANCELLED = -32800
+
+  def __init__(self, code, message):
+    super(LspError, self).__init__(message)
+    self.code = code
+
+
+class _Generation(object):
+  """A loaded generation of the index, and the number of holders of it: the _IndexHolder while it
+  is the latest generation, and each request using it."""
+
+  def __init__(self, index, mtime):
+    self.index = index
+    self.mtime = mtime
+    self.refs = 1
+
+
+class _IndexHolder(object):
+  """The most recently loaded generation of the index, which is reloaded in the background.
+
+  Queries keep being answered from the previous generation while a newer one loads. A generation is
+  closed once it has been replaced and no request is still using it, so that the files of the
+  index which were replaced since don't stay mapped (and on disk) for the life of the server.
+  """
+
+  def __init__(self, index_dir):
+    self._incremental_index = IncrementalSymbolIndex(index_dir)
+    self._manifest_path = os.path.join(index_dir, 'manifest.json')
+    self._lock = threading.Lock()
+    self._loaded = threading.Event()
+    self._generation = None
+    self._loading = False
+
+  def _manifest_mtime(self):
+    try:
+      return os.stat(self._manifest_path).st_mtime
+    except OSError:
+      return None
+
+  def maybe_reload(self):
+    mtime = self._manifest_mtime()
+    with self._lock:
+      if self._loading or (self._generation is not None and mtime == self._generation.mtime):
+        return
+      self._loading = True
+    thread = threading.Thread(target=self._load, args=(mtime,))
+    thread.daemon = True
+    thread.start()
+
+  def _load(self, mtime):
+    try:
+      generation = _Generation(self._incremental_index.open(), mtime)
+      with self._lock:
+        previous, self._generation = self._generation, generation
+      if previous is not None:
+        self._release(previous)
+      self._loaded.set()
+    except Exception as e:
+      logger.error('Failed to load the symbol index: {}'.format(e))
+    finally:
+      with self._lock:
+        self._loading = False
+
+  def _release(self, generation):
+    with self._lock:
+      generation.refs -= 1
+      unused = generation.refs == 0
+    if unused:
+      generation.index.close()
+
+  @contextmanager
+  def get(self, timeout):
+    """Yield the latest generation of the index, which stays open until the block exits."""
+    self.maybe_reload()
+    if not self._loaded.wait(timeout):
+      raise LspError(LspError.INTERNAL_ERROR, 'The symbol index is still loading.')
+    with self._lock:
+      generation = self._generation
+      generation.refs += 1
+    try:
+      yield generation.index
+    finally:
+      self._release(generation)
+
+  def close(self):
+    with self._lock:
+      generation, self._generation = self._generation, None
+    if generation is not None:
+      self._release(generation)
+
+
+class LspServer(object):
+  """Answers definition, references and workspace symbol requests from the lexical symbol index.
+
+  Messages are read on the calling thread and every request is answered from a pool of worker
+  threads, so a slow request (e.g. waiting for the index to load) never holds up the others, and
+  `$/cancelRequest` can reach requests which are queued or running.
+  """
+
+  # LSP SymbolKind values, by the kind of definition recorded in the index.
+  _SYMBOL_KINDS = {
+    'module': 2, 'package': 4, 'class': 5, 'grammar': 5, 'subset': 5, 'method': 6, 'submethod': 6,
+    'has': 7, 'enum': 10, 'role': 11, 'sub': 12, 'token': 12, 'rule': 12, 'regex': 12, 'my': 13,
+    'our': 13, 'state': 13, 'constant': 14,
+  }
+  _VARIABLE_SYMBOL_KIND = 13
+
+  def __init__(self, root_dir, index_dir, in_stream, out_stream, num_workers=4,
+               index_load_timeout=30.0, max_workspace_symbols=200):
+    self._root_dir = os.path.realpath(root_dir)
+    self._index = _IndexHolder(index_dir)
+    self._in = in_stream
+    self._out = out_stream
+    self._out_lock = threading.Lock()
+    self._pool = ThreadPool(processes=num_workers)
+    # The ids of the requests which haven't been answered yet, and those of them to cancel.
+    self._pending = set()
+    self._cancelled = set()
+    self._cancelled_lock = threading.Lock()
+    self._index_load_timeout = index_load_timeout
+    self._max_workspace_symbols = max_workspace_symbols
+    self._handlers = {
+      'initialize': self._initialize,
+      'shutdown': lambda params: None,
+      'textDocument/definition': self._definition,
+      'textDocument/references': self._references,
+      'workspace/symbol': self._workspace_symbol,
+    }
+
+  def serve(self):
+    self._index.maybe_reload()
+    try:
+      while True:
+        message = read_message(self._in)
+        if message is None or message.get('method') == 'exit':
+          break
+        self._dispatch(message)
+    finally:
+      self._pool.close()
+      self._pool.join()
+      self._index.close()
+
+  def _send(self, message):
+    message['jsonrpc'] = '2.0'
+    with self._out_lock:
+      write_message(self._out, message)
+
+  def _dispatch(self, message):
+    method = message.get('method')
+    if method == '$/cancelRequest':
+      request_id = message['params']['id']
+      with self._cancelled_lock:
+        # NB: A cancellation can arrive after its request has been answered.
+        if request_id in self._pending:
+          self._cancelled.add(request_id)
+    elif 'id' in message:
+      with self._cancelled_lock:
+        self._pending.add(message['id'])
+      self._pool.apply_async(self._answer, (message,))
+    # Other notifications (e.g. `initialized`, `textDocument/didOpen`) need no action: the index is
+    # kept up to date by `./pants index`, and documents are read from disk.
+
+  def _take_cancelled(self, request_id):
+    with self._cancelled_lock:
+      if request_id in self._cancelled:
+        self._cancelled.discard(request_id)
+        return True
+      return False
+
+  def _answer(self, message):
+    try:
+      self._answer_request(message)
+    finally:
+      with self._cancelled_lock:
+        self._pending.discard(message['id'])
+        self._cancelled.discard(message['id'])
+
+  def _answer_request(self, message):
+    request_id = message['id']
+    try:
+      if self._take_cancelled(request_id):
+        raise LspError(LspError.REQUEST_CANCELLED, 'Request cancelled.')
+      handler = self._handlers.get(message['method'])
+      if handler is None:
+        raise LspError(LspError.METHOD_NOT_FOUND, 'Unknown method {}.'.format(message['method']))
+      result = handler(message.get('params') or {})
+      if self._take_cancelled(request_id):
+        raise LspError(LspError.REQUEST_CANCELLED, 'Request cancelled.')
+      self._send({'id': request_id, 'result': result})
+    except LspError as e:
+      self._send({'id': request_id, 'error': {'code': e.code, 'message': str(e)}})
+    except Exception as e:
+      logger.exception('Error answering {!r}'.format(message))
+      self._send({'id': request_id,
+                  'error': {'code': LspError.INTERNAL_ERROR, 'message': str(e)}})
+
+  def _initialize(self, params):
+    return {
+      'capabilities': {
+        'textDocumentSync': 0,
+        'definitionProvider': True,
+        'referencesProvider': True,
+        'workspaceSymbolProvider': True,
+      },
+    }
+
+  def _path_for_uri(self, uri):
+    return unquote(urlparse(uri).path)
+
+  def _uri_for_path(self, relpath):
+    return 'file://{}'.format(quote(os.path.join(self._root_dir, relpath)))
+
+  def _location(self, posting, name):
+    start = {'line': posting.line - 1, 'character': posting.col}
+    end = {'line': posting.line - 1, 'character': posting.col + len(name)}
+    return {'uri': self._uri_for_path(posting.path), 'range': {'start': start, 'end': end}}
+
+  def _name_at(self, params):
+    path = self._path_for_uri(params['textDocument']['uri'])
+    position = params['position']
+    with io.open(path, 'r', encoding='utf-8', errors='replace') as f:
+      for line_number, line in enumerate(f):
+        if line_number == position['line']:
+          for token in tokenize(line):
+            if (token.kind in ('word', 'var') and
+                token.col <= position['character'] < token.col + len(token.text)):
+              return token.text
+          break
+    return None
+
+  def _definitions(self, index, name):
+    definitions = index.definitions(name)
+    # NB: `class Bar` within `class Foo` is referred to as `Foo::Bar` elsewhere, but the index is
+    # lexical, so fall back to the unqualified name.
+    if not definitions and '::' in name:
+      name = name.rsplit('::', 1)[1]
+      definitions = index.definitions(name)
+    return name, definitions
+
+  def _definition(self, params):
+    name = self._name_at(params)
+    if name is None:
+      return []
+    with self._index.get(self._index_load_timeout) as index:
+      name, definitions = self._definitions(index, name)
+    return [self._location(p, name) for p in definitions]
+
+  def _references(self, params):
+    name = self._name_at(params)
+    if name is None:
+      return []
+    with self._index.get(self._index_load_timeout) as index:
+      postings = index.references(name)
+      if params.get('context', {}).get('includeDeclaration'):
+        postings = self._definitions(index, name)[1] + postings
+    return [self._location(p, name) for p in postings]
+
+  def _workspace_symbol(self, params):
+    symbols = []
+    with self._index.get(self._index_load_timeout) as index:
+      for name in index.names_with_prefix(params.get('query', '')):
+        for posting in index.definitions(name):
+          symbols.append({
+            'name': name,
+            'kind': self._SYMBOL_KINDS.get(posting.kind, self._VARIABLE_SYMBOL_KIND),
+            'location': self._location(posting, name),
+          })
+        if len(symbols) >= self._max_workspace_symbols:
+          break
+    return symbols[:self._max_workspace_symbols]
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+    description='A language server for perl6 sources, answering from the index written by '
+                '`./pants index`.')
+  parser.add_argument('--root', default=os.getcwd(),
+                      help='The buildroot, which the paths in the index are relative to.')
+  parser.add_argument('--index-dir', default=None,
+                      help='The index dir (default: .pants.d/index/perl6/index under --root).')
+  parser.add_argument('--workers', type=int, default=4,
+                      help='Answer at most this many requests concurrently.')
+  args = parser.parse_args(argv)
+  index_dir = args.index_dir or os.path.join(args.root, '.pants.d', 'index', 'perl6', 'index')
+
+  # NB: stdout carries the protocol, so logs go to stderr.
+  logging.basicConfig(stream=sys.stderr, level=logging.INFO)
+  server = LspServer(args.root, index_dir,
+                     getattr(sys.stdin, 'buffer', sys.stdin),
+                     getattr(sys.stdout, 'buffer', sys.stdout),
+                     num_workers=args.workers)
+  server.serve()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,180 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import re
+from collections import namedtuple
+
+
+class Token(namedtuple('Token', ['kind', 'text', 'line', 'col'])):
+  """A lexical token, at a 1-based line and 0-based column (in characters)."""
+
+
+class Symbol(namedtuple('Symbol', ['name', 'kind', 'line', 'col'])):
+  """A definition, reference or import of a name, at the position of the name."""
+
+  # Each kind other than these marks a definition, and is the keyword which declared it.
+  REFERENCE = 'reference'
+  IMPORT = 'import'
+
+  @property
+  def is_definition(self):
+    return self.kind not in (self.REFERENCE, self.IMPORT)
+
+
+_IDENT = r"[^\W\d]\w*(?:['-][^\W\d]\w*)*"
+_NAME = r"{ident}(?:::{ident})*".format(ident=_IDENT)
+
+# The order matters: the first alternative matching at a position wins.
+_TOKEN_PATTERNS = [
+  ('pod', r'^=begin[ \t]+(?P<pod_name>\S+)[\s\S]*?^=end[ \t]+(?P=pod_name)[^\n]*'),
+  ('pod', r'^=(?:pod|head\d*|item\d*|para|comment|for)\b[^\n]*'),
+  ('comment', r'#`(?:\([^)]*\)|\[[^\]]*\]|\{[^}]*\}|<[^>]*>)'),
+  ('comment', r'#[^\n]*'),
+  ('ws', r'\s+'),
+  ('str', r'"(?:[^"\\]|\\[\s\S])*"'),
+  ('str', r"'(?:[^'\\]|\\[\s\S])*'"),
+  ('var', r'[$@%&][.!*?^:]?{name}'.format(name=_NAME)),
+  ('num', r'\d[\d_]*(?:\.\d[\d_]*)?(?:[eE][+-]?\d+)?'),
+  ('word', _NAME),
+  ('punct', r'[\s\S]'),
+]
+
+_SKIPPED_KINDS = frozenset(['pod', 'comment', 'ws'])
+
+
+def _compile_token_pattern():
+  alternatives = []
+  for i, (kind, pattern) in enumerate(_TOKEN_PATTERNS):
+    alternatives.append('(?P<{}__{}>{})'.format(kind, i, pattern))
+  return re.compile('|'.join(alternatives), re.MULTILINE | re.UNICODE)
+
+
+_TOKEN_RE = _compile_token_pattern()
+
+
+def tokenize(text, keep_skipped=False):
+  """Yield the Tokens of the perl 6 source `text`.
+
+  This is a lexical approximation, which is all that indexing needs: it understands comments, pod,
+  quoted strings (without looking inside them), numbers, variables and (possibly qualified)
+  identifiers, and treats every other character as punctuation.
+  """
+  line = 1
+  line_start = 0
+  for match in _TOKEN_RE.finditer(text):
+    kind = match.lastgroup.split('__', 1)[0]
+    token_text = match.group(0)
+    start = match.start()
+    if keep_skipped or kind not in _SKIPPED_KINDS:
+      yield Token(kind, token_text, line, start - line_start)
+    newlines = token_text.count('\n')
+    if newlines:
+      line += newlines
+      line_start = start + token_text.rindex('\n') + 1
+
+
+_PACKAGE_DECLARATORS = frozenset([
+  'class', 'role', 'grammar', 'module', 'package', 'enum', 'subset',
+])
+_ROUTINE_DECLARATORS = frozenset([
+  'sub', 'method', 'submethod', 'token', 'rule', 'regex',
+])
+_MULTI_PREFIXES = frozenset(['multi', 'proto', 'only'])
+_VARIABLE_DECLARATORS = frozenset(['my', 'our', 'has', 'state', 'constant'])
+_IMPORTERS = frozenset(['use', 'need', 'require'])
+
+_KEYWORDS = (_PACKAGE_DECLARATORS | _ROUTINE_DECLARATORS | _MULTI_PREFIXES |
+             _VARIABLE_DECLARATORS | _IMPORTERS | frozenset([
+               'if', 'elsif', 'else', 'unless', 'with', 'orwith', 'without', 'for', 'while',
+               'until', 'loop', 'repeat', 'given', 'when', 'default', 'return', 'last', 'next',
+               'redo', 'do', 'gather', 'take', 'try', 'CATCH', 'CONTROL', 'die', 'fail',
+               'is', 'does', 'but', 'of', 'returns', 'where', 'and', 'or', 'not', 'xor', 'let',
+               'temp', 'self', 'unit', 'BEGIN', 'END', 'INIT', 'ENTER', 'LEAVE', 'KEEP', 'UNDO',
+               'PRE', 'POST', 'FIRST', 'NEXT', 'LAST', 'start', 'supply', 'react', 'whenever',
+               'emit', 'done', 'eq', 'ne', 'lt', 'le', 'gt', 'ge', 'leg', 'cmp', 'x', 'xx',
+             ]))
+
+_VERSION_RE = re.compile(r'^v\d')
+
+# `use` of these changes how the file is compiled, rather than importing a module.
+_PRAGMAS = frozenset([
+  'lib', 'nqp', 'strict', 'soft', 'fatal', 'isms', 'worries', 'variables', 'invocant',
+  'parameters', 'attributes', 'precompilation', 'newline', 'trace', 'dynamic-scope',
+  'MONKEY', 'MONKEY-GUTS', 'MONKEY-SEE-NO-EVAL', 'MONKEY-TYPING', 'MONKEY-BARS', 'MONKEY-BRAINS',
+])
+
+
+def extract_symbols(tokens):
+  """Yield the Symbols defined, referenced and imported by `tokens` (which must not be skipped)."""
+  tokens = list(tokens)
+  i = 0
+  num_tokens = len(tokens)
+
+  def token_at(j):
+    return tokens[j] if j < num_tokens else None
+
+  while i < num_tokens:
+    tok = tokens[i]
+    if tok.kind == 'word':
+      word = tok.text
+      # `multi foo` and `proto foo` declare subs.
+      if word in _MULTI_PREFIXES:
+        nxt = token_at(i + 1)
+        if nxt is not None and nxt.kind == 'word' and nxt.text not in _KEYWORDS:
+          yield Symbol(nxt.text, 'sub', nxt.line, nxt.col)
+          i += 2
+          continue
+      elif word in _PACKAGE_DECLARATORS or word in _ROUTINE_DECLARATORS:
+        j = i + 1
+        # Private and meta methods: `method !foo`, `method ^foo`.
+        nxt = token_at(j)
+        if word in _ROUTINE_DECLARATORS and nxt is not None and nxt.text in ('!', '^'):
+          j += 1
+        nxt = token_at(j)
+        if nxt is not None and nxt.kind == 'word' and nxt.text not in _KEYWORDS:
+          yield Symbol(nxt.text, word, nxt.line, nxt.col)
+          i = j + 1
+          continue
+      elif word in _VARIABLE_DECLARATORS:
+        j = i + 1
+        # Skip a type constraint, as in `my Int $x`.
+        nxt = token_at(j)
+        if nxt is not None and nxt.kind == 'word' and nxt.text not in _KEYWORDS:
+          after = token_at(j + 1)
+          if after is not None and (after.kind == 'var' or after.text == '('):
+            j += 1
+          elif word == 'constant':
+            yield Symbol(nxt.text, word, nxt.line, nxt.col)
+            i = j + 1
+            continue
+        nxt = token_at(j)
+        if nxt is not None and nxt.kind == 'var':
+          yield Symbol(nxt.text, word, nxt.line, nxt.col)
+          i = j + 1
+          continue
+        elif nxt is not None and nxt.text == '(':
+          # `my ($a, $b)`.
+          j += 1
+          while j < num_tokens and tokens[j].text != ')':
+            if tokens[j].kind == 'var':
+              yield Symbol(tokens[j].text, word, tokens[j].line, tokens[j].col)
+            j += 1
+          i = j + 1
+          continue
+      elif word in _IMPORTERS:
+        nxt = token_at(i + 1)
+        if nxt is not None and nxt.kind == 'word':
+          if not (_VERSION_RE.match(nxt.text) or nxt.text in _PRAGMAS):
+            yield Symbol(nxt.text, Symbol.IMPORT, nxt.line, nxt.col)
+          i += 2
+          continue
+      elif word not in _KEYWORDS:
+        yield Symbol(word, Symbol.REFERENCE, tok.line, tok.col)
+    elif tok.kind == 'var':
+      yield Symbol(tok.text, Symbol.REFERENCE, tok.line, tok.col)
+    i += 1
+
+
+def lex_symbols(text):
+  """Return the Symbols of the perl 6 source `text`."""
+  return list(extract_symbols(tokenize(text)))
@@ -0,0 +1,234 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import abc
+import mmap
+import os
+import struct
+from collections import namedtuple
+
+from future.utils import with_metaclass
+
+
+class Posting(namedtuple('Posting', ['path', 'line', 'col', 'kind'])):
+  """An occurrence of a symbol in the index."""
+
+
+class SymbolIndexError(Exception): pass
+
+
+# The layout of an index file, all little-endian:
+# - the header.
+# - the file table: for each file, the offset and length of its path in the string table.
+# - the symbol table, sorted by the utf-8 bytes of the name: the offset and length of the name in
+#   the string table, and the index and count of its postings in the postings table.
+# - the postings table, grouped by symbol: file id, line, column, kind id and a flags byte.
+# - the kind table: the offset and length of each kind's name in the string table.
+# - the string table, of utf-8 bytes.
+# Every table is an array of fixed-size records, so a lookup is a binary search over the symbol
+# table which touches only the pages it needs, without reading or unpacking the rest of the file.
+_MAGIC = b'LQSX'
+_VERSION = 1
+_HEADER = struct.Struct(str('<4sIIIIII'))
+_STRING_REF = struct.Struct(str('<II'))
+_SYMBOL = struct.Struct(str('<IIII'))
+_POSTING = struct.Struct(str('<IIHBB'))
+
+_MAX_COL = (1 << 16) - 1
+
+# The kinds of postings which don't define their symbol (see upstreamable.index.perl6_lexer.Symbol).
+_REFERENCE_KIND = 'reference'
+_IMPORT_KIND = 'import'
+
+
+class _StringTable(object):
+
+  def __init__(self):
+    self._offsets = {}
+    self._chunks = []
+    self._size = 0
+
+  def add(self, text):
+    data = text.encode('utf-8')
+    offset = self._offsets.get(data)
+    if offset is None:
+      offset = self._size
+      self._offsets[data] = offset
+      self._chunks.append(data)
+      self._size += len(data)
+    return offset, len(data)
+
+  def to_bytes(self):
+    return b''.join(self._chunks)
+
+
+def write_symbol_index(path, symbols_by_file):
+  """Write an index of `symbols_by_file`, an iterable of (file path, iterable of symbols).
+
+  Each symbol is a (name, kind, line, col) tuple, such as a perl6_lexer.Symbol.
+
+  The index is written to a temporary file which is renamed into place, so that readers which
+  have the previous index mmapped keep a consistent view of it.
+  """
+  strings = _StringTable()
+  file_refs = []
+  kinds = []
+  kind_ids = {}
+  postings_by_name = {}
+  for file_id, (file_path, symbols) in enumerate(symbols_by_file):
+    file_refs.append(strings.add(file_path))
+    for name, kind, line, col in symbols:
+      kind_id = kind_ids.get(kind)
+      if kind_id is None:
+        kind_id = kind_ids[kind] = len(kinds)
+        kinds.append(kind)
+      postings_by_name.setdefault(name.encode('utf-8'), []).append(
+        (file_id, line, min(col, _MAX_COL), kind_id, 0))
+
+  symbol_records = []
+  posting_records = []
+  for name in sorted(postings_by_name):
+    postings = postings_by_name[name]
+    name_offset, name_len = strings.add(name.decode('utf-8'))
+    symbol_records.append(_SYMBOL.pack(name_offset, name_len, len(posting_records), len(postings)))
+    posting_records.extend(_POSTING.pack(*p) for p in postings)
+  kind_refs = [strings.add(kind) for kind in kinds]
+
+  tmp_path = '{}.tmp-{}'.format(path, os.getpid())
+  with open(tmp_path, 'wb') as f:
+    f.write(_HEADER.pack(_MAGIC, _VERSION, len(file_refs), len(symbol_records),
+                         len(posting_records), len(kind_refs), 0))
+    for offset, length in file_refs:
+      f.write(_STRING_REF.pack(offset, length))
+    f.write(b''.join(symbol_records))
+    f.write(b''.join(posting_records))
+    for offset, length in kind_refs:
+      f.write(_STRING_REF.pack(offset, length))
+    f.write(strings.to_bytes())
+  os.rename(tmp_path, path)
+
+
+class SymbolQueries(with_metaclass(abc.ABCMeta, object)):
+  """Queries in terms of `lookup()`, for each kind of index."""
+
+  @abc.abstractmethod
+  def lookup(self, name):
+    """Return every Posting of exactly `name`, in order of file and then position."""
+
+  def definitions(self, name):
+    return [p for p in self.lookup(name) if p.kind not in (_REFERENCE_KIND, _IMPORT_KIND)]
+
+  def references(self, name):
+    return [p for p in self.lookup(name) if p.kind == _REFERENCE_KIND]
+
+
+class SymbolIndex(SymbolQueries):
+  """A read-only view of an index file written by `write_symbol_index`, via mmap."""
+
+  @classmethod
+  def open(cls, path):
+    with open(path, 'rb') as f:
+      size = os.fstat(f.fileno()).st_size
+      if size < _HEADER.size:
+        raise SymbolIndexError("'{}' is too small to be a symbol index.".format(path))
+      # NB: The mapping stays valid after the file is closed (or replaced by a newer index).
+      mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return cls(path, mm)
+
+  def __init__(self, path, mm):
+    self._path = path
+    self._mm = mm
+    (magic, version, self._num_files, self._num_symbols, self._num_postings, self._num_kinds,
+     _) = _HEADER.unpack_from(mm, 0)
+    if magic != _MAGIC or version != _VERSION:
+      raise SymbolIndexError("'{}' is not a version {} symbol index.".format(path, _VERSION))
+    self._files_offset = _HEADER.size
+    self._symbols_offset = self._files_offset + self._num_files * _STRING_REF.size
+    self._postings_offset = self._symbols_offset + self._num_symbols * _SYMBOL.size
+    self._kinds_offset = self._postings_offset + self._num_postings * _POSTING.size
+    self._strings_offset = self._kinds_offset + self._num_kinds * _STRING_REF.size
+    self._kinds = [
+      self._string(*_STRING_REF.unpack_from(mm, self._kinds_offset + i * _STRING_REF.size))
+      for i in range(self._num_kinds)
+    ]
+    self._file_paths = {}
+
+  def close(self):
+    self._mm.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  @property
+  def path(self):
+    return self._path
+
+  @property
+  def num_files(self):
+    return self._num_files
+
+  @property
+  def num_symbols(self):
+    return self._num_symbols
+
+  def _string_bytes(self, offset, length):
+    start = self._strings_offset + offset
+    return self._mm[start:start + length]
+
+  def _string(self, offset, length):
+    return self._string_bytes(offset, length).decode('utf-8')
+
+  def _file_path(self, file_id):
+    file_path = self._file_paths.get(file_id)
+    if file_path is None:
+      file_path = self._string(
+        *_STRING_REF.unpack_from(self._mm, self._files_offset + file_id * _STRING_REF.size))
+      self._file_paths[file_id] = file_path
+    return file_path
+
+  def _symbol(self, i):
+    return _SYMBOL.unpack_from(self._mm, self._symbols_offset + i * _SYMBOL.size)
+
+  def _symbol_name_bytes(self, i):
+    name_offset, name_len, _, _ = self._symbol(i)
+    return self._string_bytes(name_offset, name_len)
+
+  def _lower_bound(self, name_bytes):
+    lo, hi = 0, self._num_symbols
+    while lo < hi:
+      mid = (lo + hi) // 2
+      if self._symbol_name_bytes(mid) < name_bytes:
+        lo = mid + 1
+      else:
+        hi = mid
+    return lo
+
+  def _postings(self, i):
+    _, _, first_posting, num_postings = self._symbol(i)
+    for p in range(first_posting, first_posting + num_postings):
+      file_id, line, col, kind_id, _ = _POSTING.unpack_from(
+        self._mm, self._postings_offset + p * _POSTING.size)
+      yield Posting(self._file_path(file_id), line, col, self._kinds[kind_id])
+
+  def lookup(self, name):
+    name_bytes = name.encode('utf-8')
+    i = self._lower_bound(name_bytes)
+    if i < self._num_symbols and self._symbol_name_bytes(i) == name_bytes:
+      return list(self._postings(i))
+    return []
+
+  def names_with_prefix(self, prefix, limit=None):
+    """Yield the indexed names starting with `prefix`, in sorted order."""
+    prefix_bytes = prefix.encode('utf-8')
+    i = self._lower_bound(prefix_bytes)
+    count = 0
+    while i < self._num_symbols and (limit is None or count < limit):
+      name_bytes = self._symbol_name_bytes(i)
+      if not name_bytes.startswith(prefix_bytes):
+        break
+      yield name_bytes.decode('utf-8')
+      count += 1
+      i += 1
@@ -0,0 +1,311 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import re
+from collections import namedtuple
+
+
+class TokenQuerySyntaxError(Exception): pass
+
+
+class Match(namedtuple('Match', ['query', 'start', 'end'])):
+  """The shortest match of the query named `query` ending at a token, over indices [start, end)."""
+
+
+# The query language is a regular expression over tokens:
+# - `class` or "class": a token with exactly that text (bare words which aren't a token class are
+#   also literals).
+# - IDENT, VAR, STR, NUM, PUNCT: any token of that kind; ANY or _: any token at all.
+# - ...: any sequence of tokens (shorthand for ANY*).
+# - a b: a followed by b; a | b: either; (a): grouping; a*, a+, a?: repetition.
+_TOKEN_CLASSES = {
+  'IDENT': 'word',
+  'VAR': 'var',
+  'STR': 'str',
+  'NUM': 'num',
+  'PUNCT': 'punct',
+}
+_ANY_CLASSES = frozenset(['ANY', '_'])
+
+_QUERY_TOKEN_RE = re.compile(r'\s*(\.\.\.|[()|*+?]|`[^`]*`|"[^"]*"|[^\s()|*+?"`]+)')
+
+
+def _lex_query(query):
+  pos = 0
+  parts = []
+  query = query.strip()
+  while pos < len(query):
+    match = _QUERY_TOKEN_RE.match(query, pos)
+    if not match:
+      raise TokenQuerySyntaxError('Unexpected input at offset {} of {!r}.'.format(pos, query))
+    parts.append(match.group(1))
+    pos = match.end()
+  return parts
+
+
+class _Nfa(object):
+  """A Thompson NFA, with edges labelled by token predicates: ('lit', text), ('kind', kind) or
+  ('any',)."""
+
+  def __init__(self):
+    self.epsilon = []
+    self.edges = []
+    self.accepts = {}
+
+  def new_state(self):
+    self.epsilon.append([])
+    self.edges.append([])
+    return len(self.epsilon) - 1
+
+
+class _QueryParser(object):
+  """Parses a query into a fragment (start state, end state) of an NFA."""
+
+  def __init__(self, nfa, query):
+    self._nfa = nfa
+    self._query = query
+    self._parts = _lex_query(query)
+    self._pos = 0
+    self.literals = set()
+
+  def _peek(self):
+    return self._parts[self._pos] if self._pos < len(self._parts) else None
+
+  def _take(self):
+    part = self._peek()
+    self._pos += 1
+    return part
+
+  def parse(self):
+    if not self._parts:
+      raise TokenQuerySyntaxError('Empty query.')
+    fragment = self._alternation()
+    if self._peek() is not None:
+      raise TokenQuerySyntaxError('Unexpected {!r} in {!r}.'.format(self._peek(), self._query))
+    if self._matches_empty(fragment):
+      raise TokenQuerySyntaxError(
+        '{!r} matches an empty sequence of tokens, so it would match everywhere.'
+        .format(self._query))
+    return fragment
+
+  def _matches_empty(self, fragment):
+    start, end = fragment
+    reached = {start}
+    stack = [start]
+    while stack:
+      for nxt in self._nfa.epsilon[stack.pop()]:
+        if nxt not in reached:
+          reached.add(nxt)
+          stack.append(nxt)
+    return end in reached
+
+  def _alternation(self):
+    fragments = [self._sequence()]
+    while self._peek() == '|':
+      self._take()
+      fragments.append(self._sequence())
+    if len(fragments) == 1:
+      return fragments[0]
+    start, end = self._nfa.new_state(), self._nfa.new_state()
+    for frag_start, frag_end in fragments:
+      self._nfa.epsilon[start].append(frag_start)
+      self._nfa.epsilon[frag_end].append(end)
+    return start, end
+
+  def _sequence(self):
+    fragments = []
+    while self._peek() not in (None, '|', ')'):
+      fragments.append(self._postfix())
+    if not fragments:
+      raise TokenQuerySyntaxError('Empty alternative in {!r}.'.format(self._query))
+    for (_, prev_end), (next_start, _) in zip(fragments, fragments[1:]):
+      self._nfa.epsilon[prev_end].append(next_start)
+    return fragments[0][0], fragments[-1][1]
+
+  def _postfix(self):
+    start, end = self._atom()
+    while self._peek() in ('*', '+', '?'):
+      op = self._take()
+      new_start, new_end = self._nfa.new_state(), self._nfa.new_state()
+      self._nfa.epsilon[new_start].append(start)
+      self._nfa.epsilon[end].append(new_end)
+      if op in ('*', '?'):
+        self._nfa.epsilon[new_start].append(new_end)
+      if op in ('*', '+'):
+        self._nfa.epsilon[end].append(start)
+      start, end = new_start, new_end
+    return start, end
+
+  def _edge(self, predicate):
+    start, end = self._nfa.new_state(), self._nfa.new_state()
+    self._nfa.edges[start].append((predicate, end))
+    return start, end
+
+  def _atom(self):
+    part = self._take()
+    if part == '(':
+      fragment = self._alternation()
+      if self._take() != ')':
+        raise TokenQuerySyntaxError('Unbalanced parentheses in {!r}.'.format(self._query))
+      return fragment
+    elif part == '...':
+      start, end = self._edge(('any',))
+      loop_start = self._nfa.new_state()
+      self._nfa.epsilon[loop_start].extend([start, end])
+      self._nfa.epsilon[end].append(start)
+      return loop_start, end
+    elif part in _ANY_CLASSES:
+      return self._edge(('any',))
+    elif part in _TOKEN_CLASSES:
+      return self._edge(('kind', _TOKEN_CLASSES[part]))
+    elif part is None or part in (')', '|', '*', '+', '?'):
+      raise TokenQuerySyntaxError('Expected a token pattern in {!r}.'.format(self._query))
+    if part[0] in ('`', '"'):
+      part = part[1:-1]
+    self.literals.add(part)
+    return self._edge(('lit', part))
+
+
+def _predicate_matches(predicate, symbol):
+  if predicate[0] == 'lit':
+    return symbol[0] == predicate[1]
+  elif predicate[0] == 'kind':
+    return symbol[1] == predicate[1]
+  return True
+
+
+class _LazyDfa(object):
+  """A tagged DFA over token symbols, built from an NFA one transition at a time as it's needed.
+
+  Each DFA state is a tuple of NFA states: those reached by consuming the last token, then those of
+  the start closure which weren't, since every token may also begin a new match. Each transition is
+  only computed the first time some token takes it, so the work per token is a dict lookup once
+  the automaton is warm, however many queries it contains.
+
+  To find where matches begin in the same pass, a search keeps a "tag" for each NFA state of the
+  current DFA state: the index of the nearest token at which a match reaching that NFA state could
+  have begun. Alongside the next state, each transition records which NFA states of the current one
+  lead to each NFA state of the next, so the next tags are the maximum of those.
+  """
+
+  def __init__(self, nfa, start_states):
+    self._nfa = nfa
+    self._start_closure = self._closure(start_states)
+    self._state_ids = {}
+    self._states = []
+    self._num_consumed = []
+    self._accepts = []
+    self._restarts = []
+    self._transitions = []
+    self.start = self._add_state((), tuple(sorted(self._start_closure)))
+
+  def _closure(self, states):
+    closure = set(states)
+    stack = list(states)
+    while stack:
+      for nxt in self._nfa.epsilon[stack.pop()]:
+        if nxt not in closure:
+          closure.add(nxt)
+          stack.append(nxt)
+    return frozenset(closure)
+
+  def _add_state(self, consumed, fresh):
+    key = (consumed, fresh)
+    state_id = self._state_ids.get(key)
+    if state_id is None:
+      state_id = len(self._states)
+      self._state_ids[key] = state_id
+      nfa_states = consumed + fresh
+      self._states.append(nfa_states)
+      self._num_consumed.append(len(consumed))
+      # NB: Queries which match the empty sequence are rejected when parsed, so only consumed NFA
+      # states accept.
+      self._accepts.append(tuple(sorted(
+        (self._nfa.accepts[s], i) for i, s in enumerate(consumed) if s in self._nfa.accepts)))
+      # Consumed NFA states which are also in the start closure may begin a match at the next token
+      # too, which is nearer than any tag they were reached with.
+      self._restarts.append(tuple(i for i, s in enumerate(consumed) if s in self._start_closure))
+      self._transitions.append({})
+    return state_id
+
+  def accepts(self, state_id):
+    """The (query, index of its accepting NFA state) of each query a state accepts."""
+    return self._accepts[state_id]
+
+  def restarts(self, state_id):
+    return self._restarts[state_id]
+
+  def num_fresh(self, state_id):
+    return len(self._states[state_id]) - self._num_consumed[state_id]
+
+  def step(self, state_id, symbol):
+    """Return the next state, and for each of its consumed NFA states, the indices of the NFA
+    states of `state_id` which lead to it."""
+    transition = self._transitions[state_id].get(symbol)
+    if transition is None:
+      predecessors = {}
+      for i, s in enumerate(self._states[state_id]):
+        for predicate, end in self._nfa.edges[s]:
+          if _predicate_matches(predicate, symbol):
+            for target in self._closure([end]):
+              predecessors.setdefault(target, set()).add(i)
+      consumed = tuple(sorted(predecessors))
+      fresh = tuple(sorted(self._start_closure.difference(predecessors)))
+      transition = (self._add_state(consumed, fresh),
+                    tuple(tuple(sorted(predecessors[s])) for s in consumed))
+      self._transitions[state_id][symbol] = transition
+    return transition
+
+  @property
+  def num_states(self):
+    return len(self._states)
+
+
+class CompiledTokenQueries(object):
+  """A set of named token queries, all evaluated together in a single pass over a token stream.
+
+  A tagged automaton of every query finds where matches end, and where the shortest match ending
+  there begins, in one pass however many queries there are: for "`class` IDENT ... `method`
+  IDENT", each match begins at the closest preceding class rather than the first one in the file.
+  A search costs time linear in the number of tokens.
+  """
+
+  def __init__(self, named_queries):
+    """
+    :param named_queries: An iterable of (name, query string).
+    """
+    self._names = []
+    nfa = _Nfa()
+    starts = []
+    self._literals = set()
+    for name, query in named_queries:
+      parser = _QueryParser(nfa, query)
+      start, end = parser.parse()
+      nfa.accepts[end] = len(self._names)
+      self._names.append(name)
+      starts.append(start)
+      self._literals.update(parser.literals)
+    self._dfa = _LazyDfa(nfa, starts)
+
+  @property
+  def names(self):
+    return list(self._names)
+
+  def _symbol(self, token):
+    """The equivalence class of `token`: tokens with the same symbol match the same predicates."""
+    return (token.text if token.text in self._literals else None, token.kind)
+
+  def search(self, tokens):
+    """Yield a Match for each position in `tokens` at which some query matches, in order."""
+    dfa = self._dfa
+    state = dfa.start
+    tags = [0] * dfa.num_fresh(state)
+    for i, token in enumerate(tokens):
+      state, predecessors = dfa.step(state, self._symbol(token))
+      consumed_tags = [max(tags[k] for k in ks) for ks in predecessors]
+      end = i + 1
+      for query_id, index in dfa.accepts(state):
+        yield Match(self._names[query_id], consumed_tags[index], end)
+      for index in dfa.restarts(state):
+        consumed_tags[index] = end
+      tags = consumed_tags + [end] * dfa.num_fresh(state)
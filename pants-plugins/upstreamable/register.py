@@ -6,13 +6,21 @@ from pants.goal.task_registrar import TaskRegistrar as task
 from upstreamable.targets.pants_all_requirements import PantsAllRequirements
 from upstreamable.targets.perl6_binary import Perl6Binary
 from upstreamable.targets.perl6_library import Perl6Library
+from upstreamable.targets.perl6_test import Perl6Test
 from upstreamable.targets.zef_requirement_library import (ZefRequirement,
                                                           ZefRequirementLibrary)
 from upstreamable.tasks.collect_perl6_env import CollectPerl6Env
 from upstreamable.tasks.gather_perl6_source_lib_entries import \
     GatherPerl6SourceLibEntries
+from upstreamable.tasks.perl6_compile_check import Perl6CompileCheck
+from upstreamable.tasks.perl6_consolidate_repo import Perl6ConsolidateRepo
+from upstreamable.tasks.perl6_index import Perl6Index
+from upstreamable.tasks.perl6_precompile import Perl6Precompile
+from upstreamable.tasks.perl6_query import Perl6Query
 from upstreamable.tasks.perl6_repl import Perl6Repl
 from upstreamable.tasks.perl6_run import Perl6Run
+from upstreamable.tasks.perl6_test_run import Perl6TestRun
+from upstreamable.tasks.zef_prefetch import ZefPrefetch
 from upstreamable.tasks.zef_resolve import ZefResolve
 
 
@@ -27,6 +35,7 @@ def build_file_aliases():
     targets={
       Perl6Binary.alias(): Perl6Binary,
       Perl6Library.alias(): Perl6Library,
+      Perl6Test.alias(): Perl6Test,
       ZefRequirementLibrary.alias(): ZefRequirementLibrary,
     },
   )
@@ -35,6 +44,13 @@ def build_file_aliases():
 def register_goals():
   task(name='perl6', action=Perl6Repl).install('repl')
   task(name='requirements', action=ZefResolve).install('resolve')
+  task(name='zef', action=ZefPrefetch).install('mirror')
   task(name='sources', action=GatherPerl6SourceLibEntries).install('perl6-prep')
+  task(name='precompile', action=Perl6Precompile).install('perl6-prep')
+  task(name='consolidate', action=Perl6ConsolidateRepo).install('perl6-prep')
   task(name='perl6-env', action=CollectPerl6Env).install('perl6-prep')
   task(name='perl6', action=Perl6Run).install('run')
+  task(name='perl6', action=Perl6TestRun).install('test')
+  task(name='perl6', action=Perl6CompileCheck).install('lint')
+  task(name='perl6', action=Perl6Index).install('index')
+  task(name='perl6', action=Perl6Query).install('query')
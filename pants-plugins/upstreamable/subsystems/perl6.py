@@ -3,13 +3,24 @@ from __future__ import (absolute_import, division, generators, nested_scopes,
 
 import logging
 import os
+import sys
+import threading
+from collections import OrderedDict
 
+from future.utils import text_type
+from pants.base.hash_utils import stable_json_hash
 from pants.subsystem.subsystem import Subsystem
 from pants.util.memo import memoized_property
+from pants.util.objects import datatype
 from pants.util.process_handler import subprocess
 from pants.util.strutil import (create_path_env_var, ensure_binary,
                                 safe_shlex_join)
+from upstreamable.subsystems.perl6_worker import Perl6Worker, Perl6WorkerError
 from upstreamable.subsystems.rakudo_moar import RakudoMoar
+from upstreamable.subsystems.subprocess_trace import SubprocessTrace
+from upstreamable.targets.zef_requirement_library import \
+    PERL6_INSTALL_DIR_PREFIX
+from upstreamable.util.parallel import parallel_map
 
 logger = logging.getLogger(__name__)
 
@@ -19,13 +30,25 @@ class Perl6(Subsystem):
 
   class Perl6InvocationError(Exception):
 
-    def __init__(self, msg, exit_code=None, *args, **kwargs):
-      self.exit_code = exit_code
+    def __init__(self, msg, *args, **kwargs):
+      # NB: `exit_code` is keyword-only, so the causing exception can be passed positionally.
+      self.exit_code = kwargs.pop('exit_code', None)
       super(Perl6.Perl6InvocationError, self).__init__(msg, *args, **kwargs)
 
+  @classmethod
+  def register_options(cls, register):
+    super(Perl6, cls).register_options(register)
+    register('--worker', type=bool, default=False,
+             help='Run perl6 scripts in a persistent perl6 process which has already loaded the '
+                  "project's modules, instead of starting a new one each time. The worker is "
+                  'restarted whenever PERL6LIB or the first-party sources change, but it keeps '
+                  'the environment variables it was started with.')
+    register('--worker-connect-timeout', type=float, default=60.0, advanced=True,
+             help='Seconds to wait for a new worker to start listening, or to accept a script.')
+
   @classmethod
   def subsystem_dependencies(cls):
-    return super(Perl6, cls).subsystem_dependencies() + (RakudoMoar.scoped(cls),)
+    return super(Perl6, cls).subsystem_dependencies() + (RakudoMoar.scoped(cls), SubprocessTrace)
 
   @memoized_property
   def _rakudo_moar(self):
@@ -34,14 +57,19 @@ class Perl6(Subsystem):
   # NB: For PERL5LIB on perl 5, this is ':', but perl 6 uses a comma.
   PERL6LIB_SEP = ','
 
-  def _get_perl6_subproc_os_env(self, perl6_env):
+  def lib_entries(self, perl6_env):
+    """The entries of PERL6LIB for `perl6_env`, in order."""
     # NB: These source file containing directory paths are assumed to have been de-duped.
     source_lib_containing_dirs = list(perl6_env.source_lib_entries.containing_lib_dirs)
-    zef_install_specs = [r.install_spec for r in perl6_env.zef_resolve_results]
+    zef_install_specs = [spec
+                         for install_result in perl6_env.zef_resolve_results
+                         for spec in install_result.install_specs]
 
     # NB: put the thirdparty resolve at the end.
-    all_lib_entries = source_lib_containing_dirs + zef_install_specs
-    perl6lib_joined = ensure_binary(self.PERL6LIB_SEP.join(map(ensure_binary, all_lib_entries)))
+    return source_lib_containing_dirs + zef_install_specs
+
+  def _get_perl6_subproc_os_env(self, lib_entries):
+    perl6lib_joined = ensure_binary(self.PERL6LIB_SEP.join(map(ensure_binary, lib_entries)))
 
     full_path_var = create_path_env_var(self._rakudo_moar.path_entries, os.environ.copy(),
                                         prepend=True)
@@ -58,8 +86,13 @@ class Perl6(Subsystem):
   _perl6_exe_filename = 'perl6'
 
   def invoke_perl6(self, argv, perl6_env, workunit_factory=None):
+    return self.invoke_perl6_with_lib_entries(
+      argv, self.lib_entries(perl6_env), workunit_factory=workunit_factory)
+
+  def invoke_perl6_with_lib_entries(self, argv, lib_entries, workunit_factory=None):
+    """Run perl6 with exactly `lib_entries` in PERL6LIB, for tasks which build a Perl6Env."""
     full_argv = [self._perl6_exe_filename] + list(argv)
-    subproc_env = self._get_perl6_subproc_os_env(perl6_env)
+    subproc_env = self._get_perl6_subproc_os_env(lib_entries)
 
     pretty_printed_argv = safe_shlex_join(full_argv)
     try:
@@ -67,15 +100,132 @@ class Perl6(Subsystem):
       if workunit_factory:
         with workunit_factory(cmd=pretty_printed_argv) as workunit:
           # TODO: should we be catching KeyboardInterrupt or something?
-          return subprocess.check_call(
+          return SubprocessTrace.global_instance().check_call(
             full_argv,
+            'perl6',
             env=subproc_env,
             stdout=workunit.output('stdout'),
             stderr=workunit.output('stderr'))
       else:
-        return subprocess.check_call(full_argv, env=subproc_env)
+        return SubprocessTrace.global_instance().check_call(full_argv, 'perl6', env=subproc_env)
     except (OSError, subprocess.CalledProcessError) as e:
       raise self.Perl6InvocationError(
         "Error with perl6 command '{}': {}".format(pretty_printed_argv, e),
         e,
-        exit_code=e.returncode)
+        # NB: An OSError (e.g. perl6 isn't on the PATH) has no returncode, but is still a failure.
+        exit_code=getattr(e, 'returncode', None) or 1)
+
+  _module_file_extensions = frozenset(['.pm6', '.pm'])
+
+  def _first_party_modules(self, lib_entries):
+    """Return the (module name, source path) of each module directly within a source lib dir."""
+    modules = []
+    for entry in lib_entries:
+      if entry.startswith(PERL6_INSTALL_DIR_PREFIX) or not os.path.isdir(entry):
+        continue
+      for filename in sorted(os.listdir(entry)):
+        module_name, ext = os.path.splitext(filename)
+        if ext in self._module_file_extensions:
+          modules.append((module_name, os.path.join(entry, filename)))
+    return modules
+
+  def _worker_for(self, lib_entries, first_party_modules):
+    # NB: Source lib dirs which aren't precompilation stores have the same path after an edit, so
+    # the modification times of their modules are part of the fingerprint too.
+    fingerprint = stable_json_hash({
+      'lib_entries': list(lib_entries),
+      'modules': [(path, os.stat(path).st_mtime) for _, path in first_party_modules],
+      'toolchain': self._rakudo_moar.version(),
+      'worker': stable_json_hash(Perl6Worker.worker_script_content().decode('utf-8')),
+    })
+    workers_dir = os.path.join(self.get_options().pants_workdir, 'perl6-workers')
+    return Perl6Worker(workers_dir, fingerprint, self.get_options().worker_connect_timeout)
+
+  def run_script(self, script_path, args, perl6_env, interpreter_args=(), workunit_factory=None):
+    """Run the perl6 script at `script_path` with `args`, in a warm worker if --worker is set.
+
+    :return: the exit code of the script.
+    """
+    lib_entries = self.lib_entries(perl6_env)
+    # NB: The worker is already running, so it can't take any arguments for the interpreter.
+    if not self.get_options().worker or interpreter_args:
+      return self.invoke_perl6_with_lib_entries(
+        list(interpreter_args) + [script_path] + list(args), lib_entries,
+        workunit_factory=workunit_factory)
+
+    first_party_modules = self._first_party_modules(lib_entries)
+    worker = self._worker_for(lib_entries, first_party_modules)
+    try:
+      port = worker.ensure_started([self._perl6_exe_filename],
+                                   self._get_perl6_subproc_os_env(lib_entries),
+                                   [name for name, _ in first_party_modules])
+      if workunit_factory:
+        with workunit_factory(cmd=safe_shlex_join([script_path] + list(args))) as workunit:
+          exit_code = worker.run_script(port, script_path, args, os.getcwd(),
+                                        workunit.output('stdout'), workunit.output('stderr'))
+      else:
+        exit_code = worker.run_script(port, script_path, args, os.getcwd(),
+                                      sys.stdout, sys.stderr)
+    except (IOError, OSError, Perl6WorkerError) as e:
+      raise self.Perl6InvocationError(
+        "Error running perl6 script '{}' in a worker: {}".format(script_path, e),
+        e,
+        exit_code=1)
+    if exit_code != 0:
+      raise self.Perl6InvocationError(
+        "perl6 script '{}' exited non-zero ({}) in a worker.".format(script_path, exit_code),
+        exit_code=exit_code)
+    return exit_code
+
+  class ScriptRun(datatype([
+      ('name', text_type),
+      ('script_path', text_type),
+      ('args', tuple),
+      'perl6_env',
+      ('interpreter_args', tuple),
+  ])):
+    """A perl6 script for `run_scripts_concurrently()`, with a name to prefix its output with."""
+
+    def __new__(cls, name, script_path, args, perl6_env, interpreter_args=()):
+      return super(Perl6.ScriptRun, cls).__new__(
+        cls, text_type(name), text_type(script_path), tuple(args), perl6_env,
+        tuple(interpreter_args))
+
+  def run_scripts_concurrently(self, script_runs, parallelism, output):
+    """Run each of `script_runs` in its own perl6 process, at most `parallelism` at a time.
+
+    Each line a script writes to stdout or stderr is written to `output` as soon as it is complete,
+    prefixed with the name of its ScriptRun, so the output of concurrent scripts interleaves by
+    line. Scripts are never run in a worker, which could only run one of them at a time.
+
+    :param output: A binary stream, shared by every script.
+    :return: An OrderedDict of the exit code of each script, by name, in the order of
+             `script_runs`. A script killed by a signal has the negated signal number.
+    """
+    output_lock = threading.Lock()
+    subprocess_trace = SubprocessTrace.global_instance()
+
+    def run(script_run):
+      prefix = ensure_binary('[{}] '.format(script_run.name))
+
+      def on_line(line):
+        if not line.endswith(b'\n'):
+          line += b'\n'
+        with output_lock:
+          output.write(prefix + line)
+          output.flush()
+
+      argv = ([self._perl6_exe_filename] + list(script_run.interpreter_args) +
+              [script_run.script_path] + list(script_run.args))
+      subproc_env = self._get_perl6_subproc_os_env(self.lib_entries(script_run.perl6_env))
+      try:
+        return subprocess_trace.stream(argv, 'perl6', None, on_line=on_line, env=subproc_env)
+      except OSError as e:
+        raise self.Perl6InvocationError(
+          "Error with perl6 command '{}': {}".format(safe_shlex_join(argv), e),
+          e,
+          exit_code=1)
+
+    exit_codes = parallel_map(run, script_runs, parallelism)
+    return OrderedDict((script_run.name, exit_code)
+                       for script_run, exit_code in zip(script_runs, exit_codes))
@@ -0,0 +1,199 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import binascii
+import errno
+import json
+import logging
+import os
+import pkgutil
+import signal
+import socket
+import time
+
+from pants.util.dirutil import safe_mkdir, safe_rmtree
+from pants.util.process_handler import subprocess
+from pants.util.strutil import ensure_binary
+
+logger = logging.getLogger(__name__)
+
+
+class Perl6WorkerError(Exception):
+  """Raised when a warm worker can't be started or dies while running a script."""
+
+
+class Perl6Worker(object):
+  """A persistent perl6 process, listening on a loopback port, which runs scripts sent to it.
+
+  Each worker is specific to one fingerprint of its environment (PERL6LIB, toolchain, and the
+  first-party sources it has loaded), and records its pid and port in a dir named by that
+  fingerprint, so that later pants runs can find it. Starting a worker for a new fingerprint stops
+  the workers for any other fingerprint.
+
+  NB: This uses TCP on 127.0.0.1 rather than a unix domain socket, because rakudo's
+  IO::Socket::INET doesn't support AF_UNIX. Any local user can connect to the port, so each worker
+  has a random secret, readable only by its owner in the worker dir, which must be sent with every
+  request.
+  """
+
+  _worker_script_name = 'perl6_worker.p6'
+
+  @classmethod
+  def worker_script_content(cls):
+    return pkgutil.get_data(__name__, cls._worker_script_name)
+
+  def __init__(self, workers_dir, fingerprint, connect_timeout):
+    self._workers_dir = workers_dir
+    self._fingerprint = fingerprint
+    self._connect_timeout = connect_timeout
+    self._worker_dir = os.path.join(workers_dir, fingerprint)
+
+  def _metadata_path(self, name):
+    return os.path.join(self._worker_dir, name)
+
+  def _read_metadata(self, name, worker_dir=None):
+    path = os.path.join(worker_dir or self._worker_dir, name)
+    try:
+      with open(path, 'r') as f:
+        return int(f.read().strip())
+    except (IOError, OSError, ValueError):
+      return None
+
+  @staticmethod
+  def _is_alive(pid):
+    try:
+      os.kill(pid, 0)
+      return True
+    except OSError as e:
+      return e.errno == errno.EPERM
+
+  def _connect(self, port, timeout):
+    return socket.create_connection(('127.0.0.1', port), timeout=timeout)
+
+  def _live_port(self):
+    pid = self._read_metadata('pid')
+    port = self._read_metadata('port')
+    if pid is None or port is None or not self._is_alive(pid) or not self._read_secret():
+      return None
+    return port
+
+  def _stop_worker_in(self, worker_dir, remove_dir=True):
+    pid = self._read_metadata('pid', worker_dir=worker_dir)
+    if pid is not None and self._is_alive(pid):
+      logger.debug('stopping perl6 worker {} in {}'.format(pid, worker_dir))
+      try:
+        os.killpg(pid, signal.SIGTERM)
+      except OSError:
+        pass
+    if remove_dir:
+      safe_rmtree(worker_dir)
+
+  def _stop_stale_workers(self):
+    if not os.path.isdir(self._workers_dir):
+      return
+    for name in os.listdir(self._workers_dir):
+      if name != self._fingerprint:
+        self._stop_worker_in(os.path.join(self._workers_dir, name))
+
+  @staticmethod
+  def _pick_free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+      sock.bind(('127.0.0.1', 0))
+      return sock.getsockname()[1]
+    finally:
+      sock.close()
+
+  def ensure_started(self, perl6_argv_prefix, subproc_env, preload_modules):
+    """Return the port of a live worker for this fingerprint, starting one if necessary."""
+    port = self._live_port()
+    if port is not None:
+      return port
+
+    self._stop_stale_workers()
+    self._stop_worker_in(self._worker_dir)
+    safe_mkdir(self._worker_dir)
+    os.chmod(self._worker_dir, 0o700)
+
+    script_path = self._metadata_path(self._worker_script_name)
+    with open(script_path, 'wb') as f:
+      f.write(self.worker_script_content())
+
+    port = self._pick_free_port()
+    argv = list(perl6_argv_prefix) + [
+      script_path,
+      '--port={}'.format(port),
+      # NB: The secret itself isn't passed on the command line, where other users could see it.
+      '--secret-file={}'.format(self._write_secret()),
+      '--preload={}'.format(','.join(preload_modules)),
+    ]
+    logger.debug('starting perl6 worker with {!r}'.format(argv))
+    with open(os.devnull, 'rb') as devnull, open(self._metadata_path('worker.log'), 'ab') as log:
+      # NB: The worker gets its own session, so it outlives this pants run and isn't sent the
+      # control-c meant for pants.
+      proc = subprocess.Popen(argv, env=subproc_env, stdin=devnull, stdout=log, stderr=log,
+                              close_fds=True, preexec_fn=os.setsid)
+    self._write_metadata('pid', proc.pid)
+    self._write_metadata('port', port)
+
+    deadline = time.time() + self._connect_timeout
+    while True:
+      if proc.poll() is not None:
+        raise Perl6WorkerError('perl6 worker exited with code {} on startup: see {}.'
+                               .format(proc.returncode, self._metadata_path('worker.log')))
+      try:
+        self._connect(port, timeout=1).close()
+        return port
+      except (IOError, OSError):
+        if time.time() > deadline:
+          self._stop_worker_in(self._worker_dir)
+          raise Perl6WorkerError('perl6 worker did not start listening on port {} within {}s.'
+                                 .format(port, self._connect_timeout))
+        time.sleep(0.05)
+
+  _secret_filename = 'secret'
+
+  def _write_secret(self):
+    secret = binascii.hexlify(os.urandom(32)).decode('ascii')
+    path = self._metadata_path(self._secret_filename)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'w') as f:
+      f.write('{}\n'.format(secret))
+    return path
+
+  def _read_secret(self):
+    try:
+      with open(self._metadata_path(self._secret_filename), 'r') as f:
+        return f.read().strip()
+    except (IOError, OSError):
+      return None
+
+  def _write_metadata(self, name, value):
+    with open(self._metadata_path(name), 'w') as f:
+      f.write('{}\n'.format(value))
+
+  def run_script(self, port, script_path, args, cwd, stdout, stderr):
+    """Run `script_path` in the worker listening on `port`, and return its exit code."""
+    secret = self._read_secret()
+    if not secret:
+      raise Perl6WorkerError('perl6 worker in {} has no secret.'.format(self._worker_dir))
+    request = {'secret': secret, 'script': script_path, 'args': list(args), 'cwd': cwd}
+    outputs = {'stdout': stdout, 'stderr': stderr}
+    # NB: Scripts may run for arbitrarily long, so only connecting has a timeout.
+    conn = self._connect(port, timeout=self._connect_timeout)
+    try:
+      conn.settimeout(None)
+      conn.sendall(ensure_binary(json.dumps(request)) + b'\n')
+      for line in conn.makefile('rb'):
+        frame = json.loads(line.decode('utf-8'))
+        if 'exit' in frame:
+          return frame['exit']
+        output = outputs[frame['stream']]
+        getattr(output, 'buffer', output).write(ensure_binary(frame['data']))
+        output.flush()
+    finally:
+      conn.close()
+    # The script took the worker down with it (e.g. with a segfault), so start afresh next time.
+    self._stop_worker_in(self._worker_dir, remove_dir=False)
+    raise Perl6WorkerError('perl6 worker exited while running {}: see {}.'
+                           .format(script_path, self._metadata_path('worker.log')))
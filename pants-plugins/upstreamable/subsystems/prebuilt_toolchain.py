@@ -0,0 +1,117 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import json
+import os
+import stat
+import tarfile
+
+from pants.util.dirutil import safe_mkdir, safe_rmtree
+from pants.util.strutil import ensure_binary
+
+
+class PrebuiltToolchainArchive(object):
+  """A relocatable archive of toolchain dirs built from source on some other machine or path.
+
+  Builds of rakudo and friends embed the absolute path they were installed to, e.g. in the shell
+  script wrappers in `install/bin` and in the rpath of `moar`. The archive records that path, and
+  every occurrence of it is rewritten when extracting somewhere else. Text files can be rewritten
+  freely, but binary files can only be relocated to a path of exactly the same length: their
+  strings aren't all NUL-terminated (e.g. MoarVM bytecode has length-prefixed string heaps), so
+  there is no safe way to shorten or pad them. Extracting to a path of any other length fails, and
+  the toolchain is built from source instead.
+  """
+
+  class RelocationError(Exception): pass
+
+  _metadata_filename = 'pants-prebuilt-toolchain.json'
+
+  def __init__(self, archive_path):
+    self._archive_path = archive_path
+
+  @property
+  def path(self):
+    return self._archive_path
+
+  def exists(self):
+    return os.path.isfile(self._archive_path)
+
+  def create(self, root_dir, relpaths):
+    """Archive each of the dirs at `relpaths` within `root_dir`."""
+    metadata_path = os.path.join(root_dir, self._metadata_filename)
+    with open(metadata_path, 'w') as f:
+      json.dump({'prefix': root_dir, 'relpaths': list(relpaths)}, f)
+
+    safe_mkdir(os.path.dirname(self._archive_path))
+    # NB: Other machines may be reading from the same (shared) dir, so only complete archives
+    # are ever visible under the final name.
+    tmp_archive_path = '{}.tmp-{}'.format(self._archive_path, os.getpid())
+    try:
+      with tarfile.open(tmp_archive_path, 'w:gz') as archive:
+        archive.add(metadata_path, arcname=self._metadata_filename)
+        for relpath in relpaths:
+          archive.add(os.path.join(root_dir, relpath), arcname=relpath)
+      os.rename(tmp_archive_path, self._archive_path)
+    finally:
+      if os.path.exists(tmp_archive_path):
+        os.unlink(tmp_archive_path)
+      os.unlink(metadata_path)
+
+  def extract_into(self, root_dir):
+    """Extract the archived dirs into `root_dir`, skipping any which already exist there.
+
+    :raises: :class:`PrebuiltToolchainArchive.RelocationError` if the archive can't be relocated
+             to `root_dir`.
+    """
+    staging_dir = os.path.join(root_dir, '.pants-prebuilt-{}'.format(os.getpid()))
+    safe_rmtree(staging_dir)
+    try:
+      with tarfile.open(self._archive_path, 'r:gz') as archive:
+        archive.extractall(staging_dir)
+      with open(os.path.join(staging_dir, self._metadata_filename), 'r') as f:
+        metadata = json.load(f)
+
+      for relpath in metadata['relpaths']:
+        self.relocate_tree(os.path.join(staging_dir, relpath), metadata['prefix'], root_dir)
+      for relpath in metadata['relpaths']:
+        dest = os.path.join(root_dir, relpath)
+        if not os.path.exists(dest):
+          os.rename(os.path.join(staging_dir, relpath), dest)
+    finally:
+      safe_rmtree(staging_dir)
+
+  @classmethod
+  def relocate_tree(cls, tree_dir, old_prefix, new_prefix):
+    """Rewrite `old_prefix` to `new_prefix` in every regular file under `tree_dir`."""
+    if old_prefix == new_prefix:
+      return
+    old_prefix = ensure_binary(old_prefix)
+    new_prefix = ensure_binary(new_prefix)
+    for dirpath, _, filenames in os.walk(tree_dir):
+      for filename in filenames:
+        path = os.path.join(dirpath, filename)
+        if os.path.islink(path):
+          continue
+        with open(path, 'rb') as f:
+          contents = f.read()
+        if old_prefix not in contents:
+          continue
+        relocated = cls.relocate_bytes(contents, old_prefix, new_prefix, path)
+        mode = os.stat(path).st_mode
+        os.chmod(path, mode | stat.S_IWUSR)
+        with open(path, 'wb') as f:
+          f.write(relocated)
+        os.chmod(path, mode)
+
+  @classmethod
+  def relocate_bytes(cls, contents, old_prefix, new_prefix, path='<bytes>'):
+    if b'\0' not in contents:
+      return contents.replace(old_prefix, new_prefix)
+
+    # Binary files can only have the prefix replaced by one of the same length, which leaves every
+    # offset and length recorded in the file as it was.
+    if len(new_prefix) != len(old_prefix):
+      raise cls.RelocationError(
+        "Can't relocate the binary file '{}' from '{}' to '{}', a path of a different length."
+        .format(path, old_prefix, new_prefix))
+    return contents.replace(old_prefix, new_prefix)
@@ -1,12 +1,20 @@
 from __future__ import (absolute_import, division, generators, nested_scopes,
                         print_function, unicode_literals, with_statement)
 
+import logging
 import os
 
+from pants.base.workunit import WorkUnitLabel
 from pants.binaries.binary_tool import NativeTool
+from pants.goal.run_tracker import RunTracker
 from pants.util.dirutil import is_readable_dir
 from pants.util.memo import memoized_method, memoized_property
+from pants.util.strutil import ensure_binary
+from upstreamable.subsystems.prebuilt_toolchain import PrebuiltToolchainArchive
 from upstreamable.subsystems.rakudobrew import Rakudobrew
+from upstreamable.subsystems.toolchain_manifest import ToolchainManifest
+
+logger = logging.getLogger(__name__)
 
 
 class RakudoMoar(NativeTool):
@@ -20,6 +28,24 @@ class RakudoMoar(NativeTool):
 
   class RakudoMoarException(Exception): pass
 
+  @classmethod
+  def register_options(cls, register):
+    super(RakudoMoar, cls).register_options(register)
+    register('--build-jobs', type=int, default=None, advanced=True, fingerprint=False,
+             help='The number of parallel make jobs to use when building rakudo from source. '
+                  'Defaults to the --build-jobs option of the rakudobrew subsystem.')
+    register('--prebuilt-archive-dir', type=str, default=None, advanced=True, fingerprint=False,
+             help='A local or shared (e.g. network-mounted) directory of relocatable archives of '
+                  'the toolchain. If an archive for this version and platform is there, it is '
+                  'extracted instead of building rakudo from source. The compiled files of the '
+                  'toolchain can only be relocated to a path of the same length, so archives are '
+                  'kept per length of the path of the rakudobrew bootstrap dir, and machines '
+                  'only share an archive when those paths are the same length.')
+    register('--write-prebuilt-archives', type=bool, default=True, advanced=True,
+             fingerprint=False,
+             help='After building the toolchain from source, write an archive of it into '
+                  '--prebuilt-archive-dir for other machines to use.')
+
   @classmethod
   def subsystem_dependencies(cls):
     return super(RakudoMoar, cls).subsystem_dependencies() + (Rakudobrew.scoped(cls),)
@@ -40,10 +66,111 @@ class RakudoMoar(NativeTool):
 
   _expected_executable_files = frozenset(['moar', 'nqp', 'perl6'])
 
+  # NB: Zef is installed into the toolchain later than the rest of it (see Zef._bin_dir).
+  zef_exe_rel_path = 'install/share/perl6/site/bin/zef'
+
+  @memoized_property
+  def _toolchain_manifest(self):
+    rakudobrew_dir = self._rakudobrew.select()
+    version = self.version()
+    return ToolchainManifest(
+      path=os.path.join(rakudobrew_dir, 'pants-toolchain-{}.json'.format(version)),
+      root_dir=rakudobrew_dir,
+      key={
+        'rakudobrew': self._rakudobrew.version(),
+        self.moar_tool_name: version,
+      })
+
+  def _toolchain_relpaths(self):
+    tool_dirname = self._rakudobrew.tool_dirname(self.moar_tool_name, self.version())
+    relpaths = [self._rakudobrew.script_relpath, self._rakudobrew.current_config_relpath]
+    relpaths.extend(os.path.join(tool_dirname, self._install_bin_rel_path, exe)
+                    for exe in sorted(self._expected_executable_files))
+    relpaths.append(os.path.join(tool_dirname, self.zef_exe_rel_path))
+    return relpaths
+
+  def record_toolchain_manifest(self):
+    """Record the current layout of the toolchain, once it has been validated."""
+    self._verified_relpaths = self._toolchain_manifest.write(self._toolchain_relpaths())
+
+  def is_verified(self, rel_path):
+    """Whether `rel_path`, relative to the dir returned by `select()`, was verified to exist."""
+    self.select()
+    tool_dirname = self._rakudobrew.tool_dirname(self.moar_tool_name, self.version())
+    return os.path.join(tool_dirname, rel_path) in self._verified_relpaths
+
+  @memoized_property
+  def _prebuilt_archive(self):
+    archive_dir = self.get_options().prebuilt_archive_dir
+    if not archive_dir:
+      return None
+    # NB: An archive can only be extracted to a path of the same length as the one it was built in
+    # (see PrebuiltToolchainArchive), so that length is part of its name.
+    archive_name = 'rakudo-{}-{}-{}-prefix{}.tar.gz'.format(
+      self.version(), self._rakudobrew.version(), '-'.join(self._binary_util._host_platform()),
+      len(ensure_binary(self._rakudobrew.select())))
+    return PrebuiltToolchainArchive(os.path.join(archive_dir, archive_name))
+
+  _prebuilt_archive_unusable = False
+
+  def _archived_relpaths(self):
+    rakudobrew_dir = self._rakudobrew.select()
+    relpaths = [self._rakudobrew.tool_dirname(self.moar_tool_name, self.version()),
+                self._rakudobrew.zef_checkout_relpath]
+    return [p for p in relpaths if os.path.isdir(os.path.join(rakudobrew_dir, p))]
+
+  def write_prebuilt_archive(self):
+    """Archive the toolchain as it was built on this machine, if configured to."""
+    archive = self._prebuilt_archive
+    if archive is None or not self.get_options().write_prebuilt_archives:
+      return
+    # NB: Never replace an archive which couldn't be used here, since it still works for the
+    # machines it was built for.
+    if self._prebuilt_archive_unusable:
+      return
+    logger.info("writing prebuilt toolchain archive to '{}'...".format(archive.path))
+    archive.create(self._rakudobrew.select(), self._archived_relpaths())
+
+  def _extract_prebuilt_archive(self, moar_build_output_dir):
+    """Returns True if the toolchain was extracted from a prebuilt archive."""
+    archive = self._prebuilt_archive
+    if archive is None or os.path.isdir(moar_build_output_dir) or not archive.exists():
+      return False
+    logger.info("extracting prebuilt toolchain archive from '{}'...".format(archive.path))
+    try:
+      archive.extract_into(self._rakudobrew.select())
+    except PrebuiltToolchainArchive.RelocationError as e:
+      self._prebuilt_archive_unusable = True
+      logger.warn("could not use the prebuilt toolchain, building from source instead: {}"
+                  .format(e))
+      return False
+    return True
+
+  # NB: Bootstrapping the toolchain, warm or cold, is timed in a workunit of this name, wherever it
+  # first happens to be needed (see upstreamable.bench.pipeline_benchmark).
+  toolchain_workunit_name = 'perl6-toolchain'
+
   @memoized_method
   def select(self, *args, **kwargs):
     version = self.version()
-    moar_build_output_dir = self._rakudobrew.build_tool_into(self.moar_tool_name, version)
+    with RunTracker.global_instance().new_workunit(name=self.toolchain_workunit_name,
+                                                   labels=[WorkUnitLabel.BOOTSTRAP]):
+      moar_build_output_dir = os.path.join(
+        self._rakudobrew.select(), self._rakudobrew.tool_dirname(self.moar_tool_name, version))
+      # The warm path: the whole toolchain was already validated, and nothing has changed since.
+      self._verified_relpaths = self._toolchain_manifest.read_verified()
+      if self._verified_relpaths is None:
+        extracted = self._extract_prebuilt_archive(moar_build_output_dir)
+        built = not extracted and not os.path.isdir(moar_build_output_dir)
+        self._build_and_validate(version)
+        if built:
+          self.write_prebuilt_archive()
+        self.record_toolchain_manifest()
+    return moar_build_output_dir
+
+  def _build_and_validate(self, version):
+    moar_build_output_dir = self._rakudobrew.build_tool_into(
+      self.moar_tool_name, version, build_jobs=self.get_options().build_jobs)
     expected_bin_dir = os.path.join(moar_build_output_dir, self._install_bin_rel_path)
     if not is_readable_dir(expected_bin_dir):
       raise self.RakudoMoarException(
@@ -62,6 +189,3 @@ class RakudoMoar(NativeTool):
       else:
         # Default to this version of MoarVM -- tools like Zef use this implicitly.
         self._rakudobrew.switch_tool(self.moar_tool_name, version)
-        # Return the top-level containing directory -- `self._bin_dir` contains the path to the
-        # binaries.
-        return moar_build_output_dir
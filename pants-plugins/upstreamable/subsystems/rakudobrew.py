@@ -3,17 +3,21 @@ from __future__ import (absolute_import, division, generators, nested_scopes,
 
 import logging
 import os
+import re
 
+from pants.base.workunit import WorkUnit, WorkUnitLabel
 from pants.binaries.binary_tool import Script
 from pants.binaries.binary_util import BinaryRequest
+from pants.goal.run_tracker import RunTracker
 from pants.scm.git import Git
 from pants.scm.scm import Scm
-from pants.util.dirutil import is_readable_dir, safe_mkdir
+from pants.util.dirutil import is_readable_dir, safe_mkdir, safe_rmtree
 from pants.util.memo import memoized_method, memoized_property
-from pants.util.process_handler import subprocess
 from pants.util.strutil import create_path_env_var, safe_shlex_join
 from upstreamable.subsystems.perl5 import Perl5
+from upstreamable.subsystems.subprocess_trace import SubprocessTrace
 from upstreamable.subsystems.virtual_script_tool import VirtualScriptTool
+from upstreamable.util.parallel import default_parallelism
 
 logger = logging.getLogger(__name__)
 
@@ -25,14 +29,25 @@ class Rakudobrew(VirtualScriptTool):
 
   class RakudoBrewBootstrapError(Exception): pass
 
+  @classmethod
+  def register_options(cls, register):
+    super(Rakudobrew, cls).register_options(register)
+    register('--build-jobs', type=int, default=default_parallelism(), advanced=True,
+             fingerprint=False,
+             help='The number of parallel make jobs to use when building tools from source.')
+
   @classmethod
   def subsystem_dependencies(cls):
-    return super(Rakudobrew, cls).subsystem_dependencies() + (Perl5.scoped(cls),)
+    return super(Rakudobrew, cls).subsystem_dependencies() + (Perl5.scoped(cls), SubprocessTrace)
 
   @memoized_property
   def _perl5(self):
     return Perl5.scoped_instance(self)
 
+  @memoized_property
+  def _subprocess_trace(self):
+    return SubprocessTrace.global_instance()
+
   @memoized_property
   def path_entries(self):
     return [
@@ -40,43 +55,109 @@ class Rakudobrew(VirtualScriptTool):
       self._perl5.bin_dir,
     ]
 
-  def _run_rakudobrew_command(self, argv):
+  def _get_subproc_env(self, build_jobs=None):
     subproc_env = os.environ.copy()
     subproc_env['PATH'] = create_path_env_var(self.path_entries, subproc_env, prepend=True)
-
+    if build_jobs is not None:
+      # NB: rakudobrew runs make several times over (for MoarVM, NQP, and then rakudo itself), and
+      # each of those picks this up from the environment.
+      subproc_env['MAKEFLAGS'] = '-j{}'.format(build_jobs)
+    return subproc_env
+
+  # `rakudobrew build moar` builds each of these in order. The output of the build is split into a
+  # workunit for each phase, starting at the first line matching that phase's pattern.
+  _moar_build_phases = (
+    ('moarvm', re.compile(r'\bMoarVM\b')),
+    ('nqp', re.compile(r'\bNQP\b')),
+    ('rakudo', re.compile(r'blib/Perl6/|to build Rakudo')),
+  )
+
+  def _run_rakudobrew_command(self, argv, workunit_name='rakudobrew', build_jobs=None, phases=()):
+    """Run a rakudobrew command, streaming its output to a log file and to a workunit.
+
+    Builds can take several minutes, so the output is written out line by line as it arrives, and
+    each of `phases` is timed in a nested workunit. Phases are only ever entered in order, so lines
+    matching an earlier phase's pattern (or no pattern at all) are attributed to the phase
+    currently running. If the command fails, the error includes the last lines of its output.
+    """
     all_argv = ['rakudobrew'] + argv
     pretty_printed_argv = safe_shlex_join(all_argv)
-    try:
-      return subprocess.check_output(
-        all_argv,
-        env=subproc_env)
-    except (OSError, subprocess.CalledProcessError) as e:
-      raise self.RakudoBrewBootstrapError(
-        "Error with rakudobrew command '{}': {}"
-        .format(pretty_printed_argv, e),
-        e)
+    run_tracker = RunTracker.global_instance()
+    log = self._subprocess_trace.log('-'.join(['rakudobrew'] + argv[:2]))
+
+    with run_tracker.new_workunit(name=workunit_name, labels=[WorkUnitLabel.BOOTSTRAP],
+                                  cmd=pretty_printed_argv) as workunit, log:
+      # NB: These are lists so that `on_line` can replace their contents, as python 2 has no
+      # `nonlocal`.
+      output_stream = [workunit.output('stdout')]
+      remaining_phases = list(phases)
+      phase_workunit_cm = []
+
+      def on_line(line):
+        decoded_line = line.decode('utf-8', 'replace')
+        for i, (phase_name, pattern) in enumerate(remaining_phases):
+          if pattern.search(decoded_line):
+            if phase_workunit_cm:
+              phase_workunit_cm.pop().__exit__(None, None, None)
+            logger.info("'{}': building {}...".format(pretty_printed_argv, phase_name))
+            phase_workunit_cm.append(run_tracker.new_workunit(name=phase_name,
+                                                              labels=[WorkUnitLabel.BOOTSTRAP]))
+            output_stream[0] = phase_workunit_cm[-1].__enter__().output('stdout')
+            del remaining_phases[:i + 1]
+            break
+        output_stream[0].write(line)
+
+      try:
+        returncode = self._subprocess_trace.stream(all_argv, 'bootstrap', log, on_line=on_line,
+                                                   env=self._get_subproc_env(build_jobs))
+      except OSError as e:
+        raise self.RakudoBrewBootstrapError(
+          "Error with rakudobrew command '{}': {}"
+          .format(pretty_printed_argv, e),
+          e)
+      finally:
+        if phase_workunit_cm:
+          phase_workunit_cm.pop().__exit__(None, None, None)
+
+      if returncode != 0:
+        workunit.set_outcome(WorkUnit.FAILURE)
+        raise self.RakudoBrewBootstrapError(
+          "Error with rakudobrew command '{}': exited non-zero ({}). {}"
+          .format(pretty_printed_argv, returncode, log.describe_failure()))
+    logger.debug("output from rakudobrew command '{}' is in {}"
+                 .format(pretty_printed_argv, log.path))
+
+  # NB: `rakudobrew build zef` clones zef into this directory before installing it.
+  zef_checkout_relpath = 'zef'
 
   def install_zef(self):
-    output = self._run_rakudobrew_command(['build', 'zef'])
-    logger.info("output from installing zef:\n{}".format(output))
+    self._run_rakudobrew_command(['build', 'zef'], workunit_name='zef')
+
+  # NB: rakudobrew records the configuration selected with `rakudobrew switch` in this file.
+  current_config_relpath = 'CURRENT'
 
   def switch_tool(self, tool_name, version):
     """We'll want to do this for our moar subsystem."""
-    known_dirname = '{}-{}'.format(tool_name, version)
+    known_dirname = self.tool_dirname(tool_name, version)
     # This is a fast command to run on no-op.
-    output = self._run_rakudobrew_command(['switch', known_dirname])
-    logger.debug("output from switching to configuration '{}':\n{}"
-                 .format(known_dirname, output))
+    self._run_rakudobrew_command(['switch', known_dirname])
+
+  @staticmethod
+  def tool_dirname(tool_name, version):
+    return '{}-{}'.format(tool_name, version)
 
-  def build_tool_into(self, tool_name, version):
-    known_dirname = '{}-{}'.format(tool_name, version)
+  def build_tool_into(self, tool_name, version, build_jobs=None):
+    """Build the tool unless it already exists, with `build_jobs` (or --build-jobs) make jobs."""
+    known_dirname = self.tool_dirname(tool_name, version)
     expected_dir = os.path.join(self.select(), known_dirname)
     # Build it.
     if not os.path.isdir(expected_dir):
       logger.info("building tool '{}' at version '{}'...".format(tool_name, version))
-      output = self._run_rakudobrew_command(['build', tool_name, version])
-      logger.info("output from building tool '{}' at version '{}':\n{}"
-                  .format(tool_name, version, output))
+      self._run_rakudobrew_command(
+        ['build', tool_name, version],
+        workunit_name='build-{}'.format(tool_name),
+        build_jobs=build_jobs or self.get_options().build_jobs,
+        phases=(self._moar_build_phases if tool_name == 'moar' else ()))
       if not is_readable_dir(expected_dir):
         raise self.RakudoBrewBootstrapError(
           "The expected directory after building tool '{}' at version '{}' is '{}', but that path "
@@ -85,13 +166,17 @@ class Rakudobrew(VirtualScriptTool):
 
     return expected_dir
 
+  script_relpath = 'bin/rakudobrew'
+
   @memoized_method
   def select(self, *args, **kwargs):
     """Returns a directory which can be added to the PATH to use the rakudobrew tools."""
     download_path = self.safe_get_download_dir_path()
-    # If the directory is empty, clone into it (this is allowed for empty existing
-    # directories). Otherwise, assume the clone was already performed.
-    if len(os.listdir(download_path)) == 0:
+    # If the script isn't there, the clone never happened or was interrupted, so start over.
+    # Otherwise, assume the clone was already performed.
+    if not os.path.isfile(os.path.join(download_path, self.script_relpath)):
+      safe_rmtree(download_path)
+      safe_mkdir(download_path)
       self._do_clone_and_checkout(download_path)
     return download_path
 
@@ -0,0 +1,188 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from pants.subsystem.subsystem import Subsystem
+from pants.util.dirutil import safe_mkdir
+from pants.util.process_handler import subprocess
+from upstreamable.util.rotating_log import RotatingLog
+
+logger = logging.getLogger(__name__)
+
+
+class SubprocessTrace(Subsystem):
+  """Records every toolchain subprocess, with its wall time and resource usage.
+
+  Subprocesses are reaped with `os.wait4`, which reports the user and system cpu time and the
+  peak resident set size of exactly that process (and the children it waited for). With
+  --chrome-trace-file, each subprocess is appended there as it exits, in the Chrome trace event
+  format: load it in chrome://tracing or https://ui.perfetto.dev to see which ran when, and on
+  which thread.
+
+  NB: The file is written as it goes, rather than when pants exits, because a run in pantsd ends
+  with `os._exit` and never runs `atexit` hooks. It uses the "JSON Array Format", whose closing
+  `]` is optional for exactly this reason.
+
+  The output of long-running toolchain commands is streamed line by line through `stream()`, into
+  a RotatingLog under the workdir, rather than being held in memory until they exit.
+  """
+  options_scope = 'subprocess-trace'
+
+  @classmethod
+  def register_options(cls, register):
+    super(SubprocessTrace, cls).register_options(register)
+    register('--chrome-trace-file', type=str, default=None, fingerprint=False,
+             help='Write a Chrome trace event json file of every rakudobrew, zef and perl6 '
+                  'subprocess run by this pants run to this path, as each one exits.')
+    register('--log-max-bytes', type=int, default=16 * 1024 * 1024, advanced=True,
+             fingerprint=False,
+             help="Start a new log file of a toolchain command's output once it reaches this "
+                  "size, keeping the previous one as a backup.")
+    register('--log-backups', type=int, default=2, advanced=True, fingerprint=False,
+             help="Keep at most this many full log files of each toolchain command's output, "
+                  "besides the current one.")
+    register('--error-tail-lines', type=int, default=40, advanced=True, fingerprint=False,
+             help='Show this many of the last lines of output of a failed toolchain command in '
+                  'its error.')
+
+  def __init__(self, *args, **kwargs):
+    super(SubprocessTrace, self).__init__(*args, **kwargs)
+    self._lock = threading.Lock()
+    self._started = {}
+    self._thread_names = {}
+    self._trace_file = None
+
+  # NB: ru_maxrss is in kilobytes on linux, but bytes on macOS.
+  _max_rss_divisor = 1024 if sys.platform == 'darwin' else 1
+
+  def popen(self, argv, **kwargs):
+    """Start a subprocess.Popen, which must then be reaped with `wait()` to be recorded."""
+    start = time.time()
+    process = subprocess.Popen(argv, **kwargs)
+    with self._lock:
+      self._started[process.pid] = (start, list(argv))
+    return process
+
+  def wait(self, process, category):
+    """Wait for `process`, started with `popen()`, to exit, record it, and return its exit code.
+
+    :param category: What the subprocess is for, e.g. 'bootstrap' or 'resolve'.
+    """
+    _, status, rusage = os.wait4(process.pid, 0)
+    end = time.time()
+    if os.WIFSIGNALED(status):
+      process.returncode = -os.WTERMSIG(status)
+    else:
+      process.returncode = os.WEXITSTATUS(status)
+    self._record(process, category, end, rusage)
+    return process.returncode
+
+  def check_call(self, argv, category, **kwargs):
+    """Like subprocess.check_call, but recorded."""
+    process = self.popen(argv, **kwargs)
+    returncode = self.wait(process, category)
+    if returncode != 0:
+      raise subprocess.CalledProcessError(returncode, argv)
+    return returncode
+
+  def check_output(self, argv, category, **kwargs):
+    """Like subprocess.check_output, but recorded."""
+    process = self.popen(argv, stdout=subprocess.PIPE, **kwargs)
+    try:
+      output = process.stdout.read()
+    finally:
+      process.stdout.close()
+    returncode = self.wait(process, category)
+    if returncode != 0:
+      raise subprocess.CalledProcessError(returncode, argv, output=output)
+    return output
+
+  def log(self, name):
+    """Return a RotatingLog to `stream()` a command's output into, named `name` in the workdir.
+
+    Commands which may run concurrently must use different names.
+    """
+    options = self.get_options()
+    path = os.path.join(options.pants_workdir, 'toolchain-logs', '{}.log'.format(name))
+    return RotatingLog(path,
+                       max_bytes=options.log_max_bytes,
+                       backups=options.log_backups,
+                       tail_lines=options.error_tail_lines)
+
+  def stream(self, argv, category, log, on_line=None, **kwargs):
+    """Run a subprocess, writing each line of its stdout and stderr to `log` as it arrives.
+
+    :param log: An open RotatingLog, from `log()`, or None to not log the output.
+    :param on_line: If given, called with each line of output (as bytes) after it is logged.
+    :returns: The exit code of the subprocess.
+    """
+    process = self.popen(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, **kwargs)
+    try:
+      for line in iter(process.stdout.readline, b''):
+        if log is not None:
+          log.write(line)
+        if on_line is not None:
+          on_line(line)
+    except BaseException:
+      # NB: Don't leave the subprocess running (and blocking `wait()`) if e.g. we're interrupted.
+      process.kill()
+      raise
+    finally:
+      process.stdout.close()
+      returncode = self.wait(process, category)
+    return returncode
+
+  def _record(self, process, category, end, rusage):
+    with self._lock:
+      start, argv = self._started.pop(process.pid)
+    thread = threading.current_thread()
+    event = {
+      'name': os.path.basename(argv[0]),
+      'cat': category,
+      'ph': 'X',
+      'ts': int(start * 1000000),
+      'dur': int((end - start) * 1000000),
+      'pid': os.getpid(),
+      'tid': thread.ident,
+      'args': {
+        'argv': argv,
+        'exit_code': process.returncode,
+        'user_cpu_s': rusage.ru_utime,
+        'sys_cpu_s': rusage.ru_stime,
+        'max_rss_kb': rusage.ru_maxrss // self._max_rss_divisor,
+      },
+    }
+    logger.debug('subprocess {argv!r} exited {exit_code} after {wall:.3f}s '
+                 '({user_cpu_s:.3f}s user, {sys_cpu_s:.3f}s sys, {max_rss_kb}KB max rss)'
+                 .format(wall=end - start, **event['args']))
+    with self._lock:
+      new_events = [event]
+      if thread.ident not in self._thread_names:
+        self._thread_names[thread.ident] = thread.name
+        new_events.insert(0, self._thread_name_event(thread.ident, thread.name))
+      self._append_to_trace_file(new_events)
+
+  @staticmethod
+  def _thread_name_event(tid, name):
+    return {'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid,
+            'args': {'name': name}}
+
+  def _append_to_trace_file(self, events):
+    # NB: Must be called with the lock held.
+    path = self.get_options().chrome_trace_file
+    if not path:
+      return
+    if self._trace_file is None:
+      path = os.path.abspath(path)
+      safe_mkdir(os.path.dirname(path))
+      self._trace_file = open(path, 'w')
+      self._trace_file.write('[\n')
+    for event in events:
+      self._trace_file.write('{},\n'.format(json.dumps(event, sort_keys=True)))
+    self._trace_file.flush()
@@ -0,0 +1,65 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import os
+
+from pants.base.hash_utils import stable_json_hash
+from upstreamable.util.json_files import read_json, write_json_atomic
+
+
+class ToolchainManifest(object):
+  """A persisted record of the verified layout of a bootstrapped toolchain.
+
+  The manifest lists files relative to a root dir along with their size and modification time at
+  the point they were verified, so that later runs can trust the toolchain after just reading the
+  manifest and stat-ing those files. It carries a checksum of its own contents, so a truncated or
+  hand-edited manifest is treated the same as a missing one.
+  """
+
+  def __init__(self, path, root_dir, key):
+    """
+    :param path: Where the manifest is stored.
+    :param root_dir: The dir the recorded files are relative to.
+    :param key: A json-serializable dict (e.g. of tool versions) the manifest must match.
+    """
+    self._path = path
+    self._root_dir = root_dir
+    self._key = key
+
+  def _stat_entry(self, relpath):
+    stat = os.stat(os.path.join(self._root_dir, relpath))
+    return [stat.st_size, stat.st_mtime]
+
+  @staticmethod
+  def _checksum(key, files):
+    return stable_json_hash({'key': key, 'files': files})
+
+  def read_verified(self):
+    """Return the set of recorded relpaths if the manifest is present and accurate, or None."""
+    manifest = read_json(self._path)
+    if manifest is None:
+      return None
+    try:
+      files = manifest['files']
+      if manifest['checksum'] != self._checksum(manifest['key'], files):
+        return None
+      if manifest['key'] != self._key:
+        return None
+      for relpath, entry in files.items():
+        if self._stat_entry(relpath) != entry:
+          return None
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+      return None
+    return frozenset(files.keys())
+
+  def write(self, relpaths):
+    """Record the current state of each of `relpaths` which exists."""
+    files = {relpath: self._stat_entry(relpath)
+             for relpath in relpaths
+             if os.path.exists(os.path.join(self._root_dir, relpath))}
+    write_json_atomic(self._path, {
+      'key': self._key,
+      'files': files,
+      'checksum': self._checksum(self._key, files),
+    })
+    return frozenset(files.keys())
@@ -3,22 +3,32 @@ from __future__ import (absolute_import, division, generators, nested_scopes,
 
 import logging
 import os
-
-from future.utils import binary_type
-from pants.base.workunit import WorkUnitLabel
+import re
+import tarfile
+from collections import OrderedDict
+
+from future.utils import binary_type, text_type
+from pants.base.build_environment import get_buildroot
+from pants.base.hash_utils import stable_json_hash
+from pants.base.workunit import WorkUnit, WorkUnitLabel
 from pants.binaries.binary_tool import BinaryToolBase, Script
 from pants.invalidation.cache_manager import VersionedTargetSet
 from pants.subsystem.subsystem import Subsystem
-from pants.util.dirutil import is_readable_dir, safe_mkdir
+from pants.util.dirutil import is_readable_dir, safe_mkdir, safe_rmtree
 from pants.util.memo import memoized_method, memoized_property
 from pants.util.objects import datatype
 from pants.util.process_handler import subprocess
-from pants.util.strutil import create_path_env_var, safe_shlex_join
+from pants.util.strutil import create_path_env_var, ensure_binary, safe_shlex_join
+from twitter.common.collections import OrderedSet
+from upstreamable.subsystems.perl6 import Perl6
 from upstreamable.subsystems.rakudo_moar import RakudoMoar
 from upstreamable.subsystems.rakudobrew import Rakudobrew
+from upstreamable.subsystems.subprocess_trace import SubprocessTrace
 from upstreamable.subsystems.virtual_script_tool import VirtualScriptTool
 from upstreamable.targets.zef_requirement_library import (PERL6_INSTALL_DIR_PREFIX,
                                                           ZefRequirement)
+from upstreamable.util.json_files import read_json, write_json_atomic
+from upstreamable.util.parallel import default_parallelism, parallel_map
 
 logger = logging.getLogger(__name__)
 
@@ -30,11 +40,26 @@ class Zef(Script):
   def register_options(cls, register):
     # NB: We don't use any of the options that BinaryToolBase does, so we bypass them all here.
     super(BinaryToolBase, cls).register_options(register)
+    register('--install-parallelism', type=int, default=default_parallelism(), advanced=True,
+             help='Install at most this many distributions concurrently when resolving. '
+                  'Distributions which depend on each other are always installed in order. '
+                  'Set to 1 to install one distribution at a time.')
+    register('--install-tests', type=bool, default=True, advanced=True,
+             help="Run each distribution's own test suite when installing it. Turning this off "
+                  "is safe for requirements pinned to a version which is already known to work.")
+    register('--install-build', type=bool, default=True, advanced=True, fingerprint=True,
+             help="Run each distribution's build step (e.g. Build.pm) when installing it. Only "
+                  "turn this off if none of the requirements need to compile anything.")
+    register('--mirror-dir', type=str, default=None, advanced=True,
+             help='Resolve only from the distributions in this local mirror of the ecosystem, '
+                  'without any network access. Relative paths are relative to the buildroot. '
+                  'Populate the mirror with `./pants mirror ::`.')
 
   class ZefException(Exception):
 
-    def __init__(self, msg, exit_code=None, *args, **kwargs):
-      self.exit_code = exit_code
+    def __init__(self, msg, *args, **kwargs):
+      # NB: `exit_code` is keyword-only, so the causing exception can be passed positionally.
+      self.exit_code = kwargs.pop('exit_code', None)
       super(Zef.ZefException, self).__init__(msg, *args, **kwargs)
 
   @classmethod
@@ -42,8 +67,13 @@ class Zef(Script):
     return super(Zef, cls).subsystem_dependencies() + (
       RakudoMoar.scoped(cls),
       Rakudobrew.scoped(cls),
+      SubprocessTrace,
     )
 
+  @memoized_property
+  def _subprocess_trace(self):
+    return SubprocessTrace.global_instance()
+
   @memoized_property
   def _rakudobrew(self):
     return Rakudobrew.scoped_instance(self)
@@ -56,16 +86,23 @@ class Zef(Script):
 
   @memoized_property
   def _bin_dir(self):
-    maybe_bin_install_dir = os.path.join(self._rakudo_moar.select(), 'install/share/perl6/site/bin')
+    zef_exe_path = os.path.join(self._rakudo_moar.select(), self._rakudo_moar.zef_exe_rel_path)
+    maybe_bin_install_dir = os.path.dirname(zef_exe_path)
+    if self._rakudo_moar.is_verified(self._rakudo_moar.zef_exe_rel_path):
+      return maybe_bin_install_dir
+
     if 0 == len(os.listdir(maybe_bin_install_dir)):
       # This is an empty directory -- we need to bootstrap zef.
       self._rakudobrew.install_zef()
+      # Make the next prebuilt toolchain extraction come with zef as well.
+      self._rakudo_moar.write_prebuilt_archive()
     exe_filenames = os.listdir(maybe_bin_install_dir)
     if self._executable_filename not in exe_filenames:
       raise self.ZefException(
         "Error: '{}' not found in '{}' with contents {!r}."
         .format(self._executable_filename, maybe_bin_install_dir, exe_filenames))
 
+    self._rakudo_moar.record_toolchain_manifest()
     return maybe_bin_install_dir
 
   class ZefInstallRequest(datatype([
@@ -94,61 +131,417 @@ class Zef(Script):
       # NB: See https://github.com/ugexe/zef for more info.
       return '{}{}'.format(PERL6_INSTALL_DIR_PREFIX, self.into_dir)
 
-  class ZefInstallResult(datatype([('install_spec', binary_type)])):
+  class ZefInstallResult(datatype([('install_specs', tuple)])):
+    """The composed set of `inst#` repositories which together satisfy some requirements."""
+
+    def __new__(cls, install_specs):
+      return super(Zef.ZefInstallResult, cls).__new__(
+        cls, tuple(binary_type(spec) for spec in install_specs))
+
+    @memoized_property
+    def install_dirs(self):
+      return [spec[len(PERL6_INSTALL_DIR_PREFIX):] for spec in self.install_specs]
+
+  class ZefStoreEntry(datatype([
+      ('identity', text_type),
+      ('dependency_identities', tuple),
+      ('into_dir', binary_type),
+  ])):
+    """A single distribution installed into its own directory in the zef install store.
 
-    def __new__(cls, install_spec):
-      return super(Zef.ZefInstallResult, cls).__new__(cls, binary_type(install_spec))
+    The entry only contains the distribution named by `identity`: each of its
+    `dependency_identities` is installed into its own entry beforehand.
+    """
+
+    @memoized_property
+    def as_install_spec(self):
+      return '{}{}'.format(PERL6_INSTALL_DIR_PREFIX, self.into_dir)
 
   @memoized_property
   def path_entries(self):
     return [self._bin_dir] + self._rakudo_moar.path_entries
 
+  # NB: Written into each store entry only after a successful install, so that an interrupted
+  # install is detected and redone instead of being reused.
+  _store_entry_manifest_filename = 'pants-zef-store-entry.json'
+  _resolve_manifest_filename = 'pants-zef-resolve.json'
+
+  @staticmethod
+  def resolve_results_dir(workdir, resolve_vts):
+    """The dir recording the result of the resolve for the targets in `resolve_vts`."""
+    return os.path.join(workdir, resolve_vts.cache_key.hash)
+
   def resolve(self, workdir, invalidation_check, workunit_factory):
-    # Install all of the resolve specs at once, into a single dir which has a name determined by
-    # the fingerprint of all the relevant targets in the transitive closure.
-    # NB: Obtaining the dir name is currently our only use of the VersionedTargetSet.
+    # Each distribution is installed once into a content-addressed store shared by every resolve
+    # using this workdir. A resolve then only records which store entries it is composed of, in a
+    # dir which has a name determined by the fingerprint of all the relevant targets in the
+    # transitive closure.
     resolve_vts = VersionedTargetSet.from_versioned_targets(invalidation_check.all_vts)
-    vts_results_dir = os.path.join(workdir, resolve_vts.cache_key.hash)
+    vts_results_dir = self.resolve_results_dir(workdir, resolve_vts)
     safe_mkdir(vts_results_dir)
+    resolve_manifest_path = os.path.join(vts_results_dir, self._resolve_manifest_filename)
+
+    if resolve_vts.valid and not invalidation_check.invalid_vts:
+      entry_dirs = self._read_resolve_manifest(workdir, resolve_manifest_path)
+      if entry_dirs is not None:
+        # No-op -- every store entry this resolve refers to is still there (possibly having just
+        # been extracted from the artifact cache).
+        return self._install_result_for_dirs(entry_dirs)
 
     all_zef_reqs = []
     for zef_vt in invalidation_check.all_vts:
       all_zef_reqs.extend(zef_vt.target.requirements)
-    install_request = self.ZefInstallRequest(
-      zef_requirements=all_zef_reqs,
-      into_dir=vts_results_dir)
-
-    if invalidation_check.invalid_vts or not resolve_vts.valid:
-      install_result = self.install_requirements(install_request, workunit_factory=workunit_factory)
-    else:
-      # No-op -- we have a (hopefully) well-formed install dir at this location already.
-      install_result = self.ZefInstallResult(install_request.as_install_spec)
-
-    return install_result
+    store_dir = os.path.join(workdir, 'store')
+    store_entries = self.install_into_store(all_zef_reqs, store_dir,
+                                            workunit_factory=workunit_factory)
+    # NB: Paths are recorded relative to the workdir, so that the resolve can be extracted from the
+    # artifact cache into a different buildroot.
+    write_json_atomic(resolve_manifest_path, {
+      'store_entries': [os.path.relpath(entry.into_dir, workdir) for entry in store_entries],
+    })
+    return self._install_result_for_dirs([entry.into_dir for entry in store_entries])
+
+  def _install_result_for_dirs(self, entry_dirs):
+    return self.ZefInstallResult(['{}{}'.format(PERL6_INSTALL_DIR_PREFIX, entry_dir)
+                                  for entry_dir in entry_dirs])
+
+  def _read_resolve_manifest(self, workdir, resolve_manifest_path):
+    manifest = read_json(resolve_manifest_path)
+    if manifest is None:
+      return None
+    entry_dirs = [os.path.join(workdir, relpath) for relpath in manifest['store_entries']]
+    for entry_dir in entry_dirs:
+      if not os.path.isfile(os.path.join(entry_dir, self._store_entry_manifest_filename)):
+        return None
+    return entry_dirs
+
+  def install_into_store(self, zef_requirements, store_dir, workunit_factory=None):
+    """Install each distribution required by `zef_requirements` into its own store entry.
+
+    Entries are keyed by the identity spec of the distribution, the identities of its transitive
+    dependencies, and the version of the toolchain. Entries which already exist are reused as-is.
+
+    :return: list of `ZefStoreEntry`, with the requested distributions first, followed by their
+             dependencies.
+    """
+    requested_identities = OrderedSet(req.zef_identity_spec for req in zef_requirements)
+    parallelism = self.get_options().install_parallelism
+    # NB: Bootstrap the toolchain (and zef itself) and write the zef config for the mirror up
+    # front, so that worker threads don't race to.
+    self._get_zef_subproc_env()
+    self._resolve_config_path
+
+    closures = self._dependency_closures(requested_identities, store_dir, parallelism)
+    entries = OrderedDict(
+      (identity, self.ZefStoreEntry(
+        identity=identity,
+        dependency_identities=tuple(closure),
+        into_dir=os.path.join(store_dir, self._store_entry_key(identity, closure))))
+      for identity, closure in closures.items())
+
+    for group in self._independent_install_groups(entries):
+      parallel_map(
+        lambda entry: self._ensure_store_entry(
+          entry, [entries[dep] for dep in entry.dependency_identities], workunit_factory),
+        group,
+        parallelism)
+
+    all_identities = OrderedSet(requested_identities)
+    for identity in requested_identities:
+      all_identities.update(closures[identity])
+    return [entries[identity] for identity in all_identities]
+
+  def _dependency_closures(self, identities, store_dir, parallelism, config_path=None):
+    """Map each of `identities`, and each of their dependencies, to its dependency closure."""
+    closures = OrderedDict()
+    to_visit = OrderedSet(identities)
+    while to_visit:
+      frontier = list(to_visit)
+      frontier_closures = parallel_map(
+        lambda identity: self._dependency_closure(identity, store_dir, config_path=config_path),
+        frontier,
+        parallelism)
+      closures.update(zip(frontier, frontier_closures))
+      to_visit = OrderedSet(dep
+                            for closure in frontier_closures
+                            for dep in closure
+                            if dep not in closures)
+    return closures
+
+  @staticmethod
+  def _independent_install_groups(entries):
+    """Split `entries` into groups which can each be installed concurrently, in order.
+
+    Each entry is placed in the first group after all of the groups containing its dependencies.
+    """
+    depths = {}
+    # NB: The closure of each dependency is strictly contained in the closure of its dependents, so
+    # this visits every entry after all of the entries it depends on.
+    for entry in sorted(entries.values(), key=lambda e: len(e.dependency_identities)):
+      depths[entry.identity] = 1 + max([depths[dep] for dep in entry.dependency_identities] or [-1])
+
+    groups = [[] for _ in range(1 + max(list(depths.values()) or [-1]))]
+    for entry in entries.values():
+      groups[depths[entry.identity]].append(entry)
+    return groups
+
+  def _store_entry_key(self, identity, dependency_identities):
+    return stable_json_hash({
+      'identity': identity,
+      'dependencies': sorted(dependency_identities),
+      'toolchain': self._rakudo_moar.version(),
+      'build': self.get_options().install_build,
+    })
+
+  # NB: `zef depends` also emits progress lines such as '===> Searching for: ...'.
+  _identity_line_pattern = re.compile(
+    r'\A[A-Za-z][\w\-\']*(::[A-Za-z][\w\-\']*)*(:\w+<[^>]*>)*\Z')
+
+  def _dependency_closure(self, identity, store_dir, config_path=None):
+    """Return the identities of the transitive dependencies of `identity`.
+
+    Asking the ecosystem is slow, so the answer is persisted in the store.
+    """
+    closure_path = os.path.join(store_dir, 'closures', '{}.json'.format(stable_json_hash(identity)))
+    cached = read_json(closure_path)
+    if cached is not None:
+      return cached['dependencies']
+
+    output = self._zef_command_output(['depends', identity], config_path=config_path)
+    dependencies = []
+    for line in output.decode('utf-8').splitlines():
+      line = line.strip()
+      if line != identity and self._identity_line_pattern.match(line):
+        dependencies.append(line)
+    write_json_atomic(closure_path, {
+      'identity': identity,
+      'dependencies': dependencies,
+    })
+    return dependencies
+
+  def _ensure_store_entry(self, entry, dep_entries, workunit_factory):
+    entry_manifest_path = os.path.join(entry.into_dir, self._store_entry_manifest_filename)
+    if os.path.isfile(entry_manifest_path):
+      return
+    # Anything left over at this path is from an interrupted install.
+    safe_rmtree(entry.into_dir)
+    safe_mkdir(entry.into_dir)
+    # NB: zef will see the dependencies as already installed and install only this distribution.
+    self._run_zef_command(workunit_factory, [
+      '--install-to={}'.format(entry.as_install_spec),
+      'install',
+    ] + self._install_policy_args + [
+      entry.identity,
+    ], lib_specs=[dep.as_install_spec for dep in dep_entries])
+    write_json_atomic(entry_manifest_path, {
+      'identity': entry.identity,
+      'dependencies': list(entry.dependency_identities),
+    })
 
-  def _run_zef_command(self, workunit_factory, argv):
+  @memoized_property
+  def _install_policy_args(self):
+    args = []
+    if not self.get_options().install_tests:
+      args.append('--/test')
+    if not self.get_options().install_build:
+      args.append('--/build')
+    return args
+
+  def _get_zef_subproc_env(self, lib_specs=()):
     subproc_env = os.environ.copy()
     subproc_env['PATH'] = create_path_env_var(self.path_entries, subproc_env, prepend=True)
+    if lib_specs:
+      subproc_env['PERL6LIB'] = ensure_binary(Perl6.PERL6LIB_SEP.join(lib_specs))
+    return subproc_env
+
+  def _zef_argv(self, argv, config_path=None):
+    config_path = config_path or self._resolve_config_path
+    if config_path:
+      argv = ['--config-path={}'.format(config_path)] + argv
+    return ['zef'] + argv
+
+  def _zef_command_output(self, argv, config_path=None):
+    subproc_env = self._get_zef_subproc_env()
+    all_argv = self._zef_argv(argv, config_path=config_path)
+    try:
+      return self._subprocess_trace.check_output(all_argv, 'resolve', env=subproc_env)
+    except (OSError, subprocess.CalledProcessError) as e:
+      raise self.ZefException(
+        "Error with zef command '{}': {}".format(safe_shlex_join(all_argv), e),
+        e,
+        exit_code=getattr(e, 'returncode', None))
+
+  def _run_zef_command(self, workunit_factory, argv, lib_specs=(), config_path=None):
+    """Run a zef command, streaming its output to a log file (and the workunit, if given).
+
+    If the command fails, the error includes the last lines of its output.
+    """
+    subproc_env = self._get_zef_subproc_env(lib_specs)
 
-    all_argv = ['zef'] + argv
+    all_argv = self._zef_argv(argv, config_path=config_path)
     pretty_printed_argv = safe_shlex_join(all_argv)
+    # NB: Installs run concurrently, so each distinct command gets its own log.
+    log = self._subprocess_trace.log('zef-{}-{}'.format(argv[0], stable_json_hash(all_argv)[:12]))
     try:
-      if workunit_factory:
-        with workunit_factory(cmd=pretty_printed_argv) as workunit:
-          return subprocess.check_call(
-            all_argv,
-            env=subproc_env,
-            stdout=workunit.output('stdout'),
-            stderr=workunit.output('stderr'))
-      else:
-        output = subprocess.check_output(all_argv, env=subproc_env)
-        logger.debug("output from running zef command {!r} with env {!r}:\n{}"
-                     .format(all_argv, subproc_env, output))
-    except (OSError, subprocess.CalledProcessError) as e:
+      with log:
+        if workunit_factory:
+          with workunit_factory(cmd=pretty_printed_argv) as workunit:
+            returncode = self._subprocess_trace.stream(
+              all_argv, 'resolve', log, on_line=workunit.output('stdout').write, env=subproc_env)
+            if returncode != 0:
+              workunit.set_outcome(WorkUnit.FAILURE)
+        else:
+          returncode = self._subprocess_trace.stream(all_argv, 'resolve', log, env=subproc_env)
+    except OSError as e:
       raise self.ZefException(
         "Error with zef command '{}': {}".format(pretty_printed_argv, e),
-        e,
-        exit_code=e.returncode)
+        e)
+    if returncode != 0:
+      raise self.ZefException(
+        "Error with zef command '{}': exited non-zero ({}). {}"
+        .format(pretty_printed_argv, returncode, log.describe_failure()),
+        exit_code=returncode)
+    logger.debug("output from zef command '{}' is in {}".format(pretty_printed_argv, log.path))
+
+  # NB: This is the file format of the ecosystem metadata served at e.g.
+  # http://ecosystem-api.p6c.org/projects.json.
+  _mirror_index_filename = 'packages.json'
+  _mirror_dists_dirname = 'dists'
+
+  @memoized_property
+  def _mirror_dir(self):
+    mirror_dir = self.get_options().mirror_dir
+    if not mirror_dir:
+      return None
+    return os.path.normpath(os.path.join(get_buildroot(), mirror_dir))
+
+  @memoized_property
+  def _zef_config_dir(self):
+    return os.path.join(self.get_options().pants_workdir, 'zef', 'config')
+
+  @memoized_property
+  def _base_config(self):
+    # NB: `rakudobrew build zef` clones zef into its own directory, which has the default config.
+    base_config_path = os.path.join(
+      self._rakudobrew.select(), self._rakudobrew.zef_checkout_relpath, 'resources', 'config.json')
+    base_config = read_json(base_config_path)
+    if base_config is None:
+      raise self.ZefException(
+        "Error: could not read the default zef config from '{}'.".format(base_config_path))
+    return base_config
+
+  def _write_config(self, name, repositories=None, store_dir=None):
+    config = dict(self._base_config)
+    if repositories is not None:
+      config['Repository'] = repositories
+    if store_dir is not None:
+      config['StoreDir'] = store_dir
+    config_path = os.path.join(self._zef_config_dir, name, 'config.json')
+    write_json_atomic(config_path, config)
+    return config_path
+
+  @memoized_property
+  def _resolve_config_path(self):
+    """A zef config which only knows about the distributions in the local mirror, if there is one.
+
+    The mirror's index refers to tarballs relative to the mirror dir, so that the mirror can be
+    moved or shared. zef needs absolute paths, so a copy of the index is made with those.
+    """
+    mirror_dir = self._mirror_dir
+    if mirror_dir is None:
+      return None
+
+    index_path = os.path.join(mirror_dir, self._mirror_index_filename)
+    index = read_json(index_path)
+    if index is None:
+      raise self.ZefException(
+        "Error: no zef mirror index was found at '{}'. Populate the mirror with `./pants mirror` "
+        "first.".format(index_path))
+    for dist_meta in index:
+      dist_meta['source-url'] = os.path.join(mirror_dir, dist_meta['source-url'])
+
+    config_name = 'mirror-{}'.format(stable_json_hash(index))
+    absolute_index_path = os.path.join(self._zef_config_dir, config_name,
+                                       self._mirror_index_filename)
+    write_json_atomic(absolute_index_path, index)
+    return self._write_config(config_name, repositories=[{
+      'short-name': 'pants-mirror',
+      'enabled': 1,
+      'module': 'Zef::Repository::Ecosystems',
+      'options': {
+        'name': 'pants-mirror',
+        'auto-update': 1,
+        'mirrors': [absolute_index_path],
+      },
+    }])
+
+  def prefetch_into_mirror(self, zef_requirements, staging_dir, workunit_factory=None):
+    """Fetch every distribution needed for `zef_requirements` into the local mirror at once.
+
+    This always uses the network, even if the mirror is also used to resolve.
+    """
+    mirror_dir = self._mirror_dir
+    if mirror_dir is None:
+      raise self.ZefException(
+        'Error: --{}-mirror-dir must be set to prefetch into a mirror.'.format(self.options_scope))
+
+    self._get_zef_subproc_env()
+    fetched_dir = os.path.join(staging_dir, 'fetched')
+    safe_rmtree(fetched_dir)
+    online_config_path = self._write_config('prefetch', store_dir=fetched_dir)
+
+    requested_identities = OrderedSet(req.zef_identity_spec for req in zef_requirements)
+    closures = self._dependency_closures(
+      requested_identities, os.path.join(staging_dir, 'store'),
+      self.get_options().install_parallelism, config_path=online_config_path)
+    self._run_zef_command(workunit_factory, ['fetch'] + list(closures.keys()),
+                          config_path=online_config_path)
+
+    dist_dirs = []
+    for dirpath, dirnames, filenames in os.walk(fetched_dir):
+      if 'META6.json' in filenames:
+        dist_dirs.append(dirpath)
+        # Don't pick up any distributions vendored inside this one.
+        del dirnames[:]
+    return self.add_dists_to_mirror(dist_dirs, mirror_dir)
+
+  @classmethod
+  def add_dists_to_mirror(cls, dist_dirs, mirror_dir):
+    """Pack each of the unpacked distributions in `dist_dirs` into the mirror and index them.
+
+    :return: the identities of the distributions added to the mirror.
+    """
+    index_path = os.path.join(mirror_dir, cls._mirror_index_filename)
+    index = OrderedDict()
+    for dist_meta in read_json(index_path) or []:
+      index[cls._mirror_dist_basename(dist_meta)] = dist_meta
+
+    added = []
+    for dist_dir in dist_dirs:
+      dist_meta = read_json(os.path.join(dist_dir, 'META6.json'))
+      if dist_meta is None:
+        raise cls.ZefException(
+          "Error: the distribution at '{}' has no readable META6.json.".format(dist_dir))
+      basename = cls._mirror_dist_basename(dist_meta)
+      tarball_relpath = os.path.join(cls._mirror_dists_dirname, '{}.tar.gz'.format(basename))
+      tarball_path = os.path.join(mirror_dir, tarball_relpath)
+      safe_mkdir(os.path.dirname(tarball_path))
+      tmp_tarball_path = '{}.tmp-{}'.format(tarball_path, os.getpid())
+      with tarfile.open(tmp_tarball_path, 'w:gz') as tarball:
+        tarball.add(dist_dir, arcname=basename)
+      os.rename(tmp_tarball_path, tarball_path)
+
+      dist_meta['source-url'] = tarball_relpath
+      index[basename] = dist_meta
+      added.append(basename)
+
+    write_json_atomic(index_path, list(index.values()))
+    return added
+
+  @staticmethod
+  def _mirror_dist_basename(dist_meta):
+    version = dist_meta.get('version', dist_meta.get('ver', '*'))
+    return '{}-{}'.format(dist_meta['name'].replace('::', '-'), version)
 
   def install_requirements(self, install_request, workunit_factory=None):
     # NB: See https://github.com/ugexe/zef for more info.
@@ -159,9 +552,9 @@ class Zef(Script):
       '--install-to={}'.format(install_spec),
       # TODO: do we need to run update beforehand? Check https://github.com/ugexe/zef!
       'install',
-    ] + identities)
+    ] + self._install_policy_args + identities)
 
-    return self.ZefInstallResult(install_spec)
+    return self.ZefInstallResult([install_spec])
 
 
 class ZefReplBootstrap(VirtualScriptTool):
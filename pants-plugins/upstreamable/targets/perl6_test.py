@@ -0,0 +1,26 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+from pants.base.payload import Payload
+from pants.build_graph.target import Target
+
+
+class Perl6Test(Target):
+  """Perl 6 test files, each run as a separate perl6 process with the Perl6Env of the target."""
+
+  default_sources_globs = ('*.t', '*.rakutest')
+
+  @classmethod
+  def alias(cls):
+    return 'perl6_test'
+
+  def __init__(self,
+               address=None,
+               payload=None,
+               sources=None,
+               **kwargs):
+    payload = payload or Payload()
+    payload.add_fields({
+      'sources': self.create_sources_field(sources, address.spec_path, key_arg='sources'),
+    })
+    super(Perl6Test, self).__init__(address=address, payload=payload, **kwargs)
@@ -47,7 +47,7 @@ class ZefRequirement(datatype([
     if self.version_spec is not None:
       return '{}:ver<{}>'.format(self.module_name, self.version_spec)
     else:
-      return module_name
+      return self.module_name
 
 
 class ZefRequirementsField(frozenset, PayloadField):
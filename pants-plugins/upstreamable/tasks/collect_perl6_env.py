@@ -13,6 +13,8 @@ from upstreamable.targets.perl6_library import Perl6Library
 from upstreamable.targets.zef_requirement_library import ZefRequirementLibrary
 from upstreamable.tasks.gather_perl6_source_lib_entries import \
     GatherPerl6SourceLibEntries
+from upstreamable.tasks.perl6_consolidate_repo import Perl6ConsolidateRepo
+from upstreamable.tasks.perl6_precompile import Perl6Precompile
 from upstreamable.tasks.zef_resolve import ZefResolve
 
 
@@ -23,10 +25,13 @@ class CollectPerl6Env(Task):
     super(CollectPerl6Env, cls).prepare(options, round_manager)
     round_manager.require_data(GatherPerl6SourceLibEntries.Entries)
     round_manager.require_data(Zef.ZefInstallResult)
+    round_manager.optional_data(Perl6Precompile.PrecompiledEntries)
+    round_manager.optional_data(Perl6ConsolidateRepo.ConsolidatedRepo)
+    round_manager.optional_data(ZefResolve.ScopedInstallResults)
 
   @classmethod
   def product_types(cls):
-    return [cls.Perl6Env]
+    return [cls.Perl6Env, cls.ScopedPerl6Envs]
 
   class Perl6Env(datatype([
       ('source_lib_entries', GatherPerl6SourceLibEntries.Entries),
@@ -37,8 +42,47 @@ class CollectPerl6Env(Task):
       assert(isinstance(install_result, Zef.ZefInstallResult))
       return self.copy(zef_resolve_results=self.zef_resolve_results + (install_result,))
 
+  class ScopedPerl6Envs(datatype([('default_env', Perl6Env), ('envs_by_root', dict)])):
+    """A Perl6Env for each target root, with only the zef resolve for that root's closure."""
+
+    def for_target(self, target):
+      """The env for `target` if it's a target root, or else the env for the whole run."""
+      return self.envs_by_root.get(target, self.default_env)
+
   def execute(self):
+    # NB: The consolidated repository contains every module from the source dirs and the zef
+    # resolve, so when it's available it is the only entry, for every target root.
+    consolidated = self.context.products.get_data(Perl6ConsolidateRepo.ConsolidatedRepo)
+    if consolidated:
+      env = self.Perl6Env(
+        source_lib_entries=GatherPerl6SourceLibEntries.Entries(containing_lib_dirs=()),
+        zef_resolve_results=(Zef.ZefInstallResult(install_specs=(consolidated.install_spec,)),))
+      self._register_envs(env, {})
+      return
+
+    # NB: The precompilation stores contain the same modules as the source dirs, so they are used
+    # instead whenever they are available.
+    precompiled = self.context.products.get_data(Perl6Precompile.PrecompiledEntries)
+    if precompiled:
+      source_lib_entries = precompiled.entries
+    else:
+      source_lib_entries = self.context.products.get_data(GatherPerl6SourceLibEntries.Entries)
+
+    # NB: ZefResolve doesn't register a result when there are no zef requirements in play.
+    zef_install_result = self.context.products.get_data(Zef.ZefInstallResult)
     env = self.Perl6Env(
-      source_lib_entries=self.context.products.get_data(GatherPerl6SourceLibEntries.Entries),
-      zef_resolve_results=(self.context.products.get_data(Zef.ZefInstallResult),))
+      source_lib_entries=source_lib_entries,
+      zef_resolve_results=(zef_install_result,) if zef_install_result else ())
+
+    scoped_results = self.context.products.get_data(ZefResolve.ScopedInstallResults)
+    envs_by_root = {}
+    if scoped_results:
+      for root in self.context.target_roots:
+        root_result = scoped_results.for_root(root)
+        envs_by_root[root] = env.copy(zef_resolve_results=(root_result,) if root_result else ())
+    self._register_envs(env, envs_by_root)
+
+  def _register_envs(self, env, envs_by_root):
     self.context.products.register_data(self.Perl6Env, env)
+    self.context.products.register_data(self.ScopedPerl6Envs,
+                                        self.ScopedPerl6Envs(env, envs_by_root))
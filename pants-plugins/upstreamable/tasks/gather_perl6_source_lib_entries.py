@@ -11,6 +11,7 @@ from twitter.common.collections import OrderedSet
 from upstreamable.targets.perl6_library import Perl6Library
 from upstreamable.targets.zef_requirement_library import \
     PERL6_INSTALL_DIR_PREFIX
+from upstreamable.util.json_files import read_json, write_json_atomic
 
 
 class GatherPerl6SourceLibEntries(Task):
@@ -25,16 +26,43 @@ class GatherPerl6SourceLibEntries(Task):
   def product_types(cls):
     return [cls.Entries]
 
+  _lib_dirs_filename = 'lib-dirs.json'
+
+  def _target_lib_dirs(self, targets):
+    """Return the lib dirs of each target, in the order of `targets`.
+
+    The lib dirs of every target are persisted (relative to the buildroot) in a single file in the
+    workdir, keyed by target id, and only recomputed for invalidated targets.
+    """
+    lib_dirs_path = os.path.join(self.workdir, self._lib_dirs_filename)
+    persisted = read_json(lib_dirs_path) or {}
+    buildroot = get_buildroot()
+
+    lib_dirs_by_target = {}
+    # NB: The sources of a target only affect the lib dirs of that target.
+    with self.invalidated(targets, invalidate_dependents=False) as invalidation_check:
+      for vt in invalidation_check.all_vts:
+        target_id = vt.target.id
+        cached = persisted.get(target_id)
+        if vt.valid and cached and cached['hash'] == vt.cache_key.hash:
+          rel_lib_dirs = cached['lib_dirs']
+        else:
+          rel_lib_dirs = [os.path.relpath(d, buildroot) for d in vt.target.lib_dirs]
+          persisted[target_id] = {'hash': vt.cache_key.hash, 'lib_dirs': rel_lib_dirs}
+        lib_dirs_by_target[vt.target] = [os.path.join(buildroot, d) for d in rel_lib_dirs]
+      if invalidation_check.invalid_vts:
+        write_json_atomic(lib_dirs_path, persisted)
+
+    return [lib_dirs_by_target[t] for t in targets]
+
   def execute(self):
     # TODO: figure out if using an OrderedSet here breaks anyone's assumptions about PERL6LIB
     # entries!
     # TODO: figure out if using an OrderedSet here is necessary!
     all_lib_dirs = OrderedSet()
     source_lib_targets = self.context.targets(self.source_target_constraint.satisfied_by)
-    for lib_tgt in source_lib_targets:
-      all_lib_dirs.update(
-        os.path.normpath(os.path.join(get_buildroot(), os.path.dirname(s)))
-        for s in lib_tgt.sources_relative_to_buildroot())
+    for lib_dirs in self._target_lib_dirs(source_lib_targets):
+      all_lib_dirs.update(lib_dirs)
     if source_lib_targets and (not all_lib_dirs):
       raise self.GatherEntriesError(
         "No containing directories found for source_lib_targets {!r}. "
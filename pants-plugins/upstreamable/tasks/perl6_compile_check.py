@@ -0,0 +1,124 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import functools
+
+from pants.base.exceptions import TaskError
+from pants.base.workunit import WorkUnitLabel
+from pants.task.task import Task
+from pants.util.memo import memoized_property
+from pants.util.objects import Exactly, datatype
+from upstreamable.subsystems.perl6 import Perl6
+from upstreamable.subsystems.zef import Zef
+from upstreamable.targets.perl6_binary import Perl6Binary
+from upstreamable.targets.perl6_library import Perl6Library
+from upstreamable.tasks.collect_perl6_env import CollectPerl6Env
+from upstreamable.tasks.gather_perl6_source_lib_entries import \
+    GatherPerl6SourceLibEntries
+from upstreamable.tasks.zef_resolve import ZefResolve
+from upstreamable.util.parallel import default_parallelism, parallel_map
+
+
+class Perl6CompileCheck(Task):
+  """Check that the sources of perl6_library and perl6_binary targets compile, with `perl6 -c`.
+
+  Targets are checked again only when they or their dependencies change, so on a warm tree this
+  doesn't run perl6 at all.
+  """
+
+  source_target_constraint = Exactly(Perl6Library, Perl6Binary)
+
+  class Perl6CompileCheckError(TaskError): pass
+
+  class CheckResult(datatype(['target', 'source', 'passed'])): pass
+
+  @classmethod
+  def register_options(cls, register):
+    super(Perl6CompileCheck, cls).register_options(register)
+    register('--skip', type=bool, default=False,
+             help='Skip checking that perl6 sources compile.')
+    register('--parallelism', type=int, default=default_parallelism(), advanced=True,
+             help='Check at most this many source files concurrently.')
+
+  @classmethod
+  def subsystem_dependencies(cls):
+    return super(Perl6CompileCheck, cls).subsystem_dependencies() + (Perl6.scoped(cls),)
+
+  @memoized_property
+  def _perl6(self):
+    return Perl6.scoped_instance(self)
+
+  @classmethod
+  def prepare(cls, options, round_manager):
+    super(Perl6CompileCheck, cls).prepare(options, round_manager)
+    # NB: Requiring the resolve schedules ZefResolve, which installs into the store shared with
+    # every other task and is a no-op on a warm tree.
+    round_manager.require_data(GatherPerl6SourceLibEntries.Entries)
+    round_manager.require_data(ZefResolve.ScopedInstallResults)
+    round_manager.optional_data(Zef.ZefInstallResult)
+
+  def _check_workunit_factory(self, parent_workunit, *args, **kwargs):
+    # NB: Files are checked from threads which have no current workunit of their own.
+    return self.context.run_tracker.new_workunit_under_parent(
+      name='perl6-c',
+      parent=parent_workunit,
+      labels=[WorkUnitLabel.COMPILER],
+      *args, **kwargs)
+
+  def _perl6_env(self, target):
+    """The env to check `target` in: the source lib dirs of the run, and the zef resolve for the
+    closure of `target` if it's a target root, or else the resolve for the whole run."""
+    env = CollectPerl6Env.Perl6Env(
+      source_lib_entries=self.context.products.get_data(GatherPerl6SourceLibEntries.Entries),
+      zef_resolve_results=())
+    scoped_results = self.context.products.get_data(ZefResolve.ScopedInstallResults)
+    if target in scoped_results.results_by_root:
+      install_result = scoped_results.for_root(target)
+    else:
+      install_result = self.context.products.get_data(Zef.ZefInstallResult)
+    return env.add_install_result(install_result) if install_result else env
+
+  def execute(self):
+    if self.get_options().skip:
+      return
+
+    targets = self.context.targets(self.source_target_constraint.satisfied_by)
+    # NB: A module can fail to compile because of a change to a module it uses, so dependents of
+    # changed targets are checked again too.
+    with self.invalidated(targets, invalidate_dependents=True) as invalidation_check:
+      invalid_vts_by_target = {vt.target: vt for vt in invalidation_check.invalid_vts}
+      source_files = [(vt.target, source) for vt in invalidation_check.invalid_vts
+                      for source in vt.target.sources_relative_to_buildroot()]
+      if not source_files:
+        return
+
+      envs_by_target = {target: self._perl6_env(target) for target in invalid_vts_by_target}
+      with self.context.new_workunit(name='perl6-compile-check',
+                                     labels=[WorkUnitLabel.MULTITOOL]) as workunit:
+        results = self._check_source_files(
+          source_files, envs_by_target, functools.partial(self._check_workunit_factory, workunit))
+
+      failed_targets = {r.target for r in results if not r.passed}
+      for target, vt in invalid_vts_by_target.items():
+        if target not in failed_targets:
+          vt.update()
+
+      failures = [r for r in results if not r.passed]
+      if failures:
+        raise self.Perl6CompileCheckError(
+          '{} perl6 source files failed to compile:\n{}'
+          .format(len(failures), '\n'.join('  {}'.format(r.source) for r in failures)),
+          failed_targets=sorted(failed_targets, key=lambda t: t.address.spec))
+
+  def _check_source_files(self, source_files, envs_by_target, workunit_factory):
+    def check_source_file(source_file):
+      target, source = source_file
+      try:
+        self._perl6.invoke_perl6(['-c', source], envs_by_target[target],
+                                 workunit_factory=workunit_factory)
+        passed = True
+      except Perl6.Perl6InvocationError:
+        passed = False
+      return self.CheckResult(target=target, source=source, passed=passed)
+
+    return parallel_map(check_source_file, source_files, self.get_options().parallelism)
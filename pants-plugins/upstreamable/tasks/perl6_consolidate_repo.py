@@ -0,0 +1,147 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import functools
+import os
+import pkgutil
+from collections import OrderedDict
+
+from pants.base.build_environment import get_buildroot
+from pants.base.exceptions import TaskError
+from pants.base.workunit import WorkUnitLabel
+from pants.invalidation.cache_manager import VersionedTargetSet
+from pants.task.task import Task
+from pants.util.dirutil import safe_mkdir, safe_rmtree
+from pants.util.memo import memoized_property
+from pants.util.objects import Exactly, datatype
+from upstreamable.subsystems.perl6 import Perl6
+from upstreamable.subsystems.zef import Zef
+from upstreamable.targets.perl6_library import Perl6Library
+from upstreamable.targets.zef_requirement_library import (PERL6_INSTALL_DIR_PREFIX,
+                                                          ZefRequirementLibrary)
+from upstreamable.util.json_files import read_json, write_json_atomic
+
+
+class Perl6ConsolidateRepo(Task):
+  """Install every first-party module and resolved zef dist into a single module repository.
+
+  Rakudo probes each entry of PERL6LIB in turn on every `use`, so the cost of loading modules grows
+  with the number of libraries. A CompUnit::Repository::Installation indexes all of its modules, so
+  with one of those in PERL6LIB each module is found with a single lookup. The repository is built
+  once for each fingerprint of all the perl6_library and zef_requirement_library targets in play.
+  """
+
+  source_target_constraint = Exactly(Perl6Library, ZefRequirementLibrary)
+
+  class ConsolidatedRepo(datatype(['install_spec'])): pass
+
+  class Perl6ConsolidateRepoError(TaskError): pass
+
+  @classmethod
+  def register_options(cls, register):
+    super(Perl6ConsolidateRepo, cls).register_options(register)
+    register('--enable', type=bool, default=False,
+             help='Put a single consolidated module repository in PERL6LIB instead of a source '
+                  'or precompilation dir for each library and an install dir for each zef dist. '
+                  'The repository is precompiled as it is built, so the precompile task can be '
+                  'skipped when this is enabled.')
+
+  @classmethod
+  def subsystem_dependencies(cls):
+    return super(Perl6ConsolidateRepo, cls).subsystem_dependencies() + (Perl6.scoped(cls),)
+
+  @memoized_property
+  def _perl6(self):
+    return Perl6.scoped_instance(self)
+
+  @classmethod
+  def prepare(cls, options, round_manager):
+    super(Perl6ConsolidateRepo, cls).prepare(options, round_manager)
+    round_manager.optional_data(Zef.ZefInstallResult)
+
+  @classmethod
+  def product_types(cls):
+    return [cls.ConsolidatedRepo]
+
+  _script_name = 'consolidate_repo.p6'
+
+  _complete_marker_filename = 'pants-consolidated-repo.json'
+
+  def execute(self):
+    if not self.get_options().enable:
+      return
+
+    targets = self.context.targets(self.source_target_constraint.satisfied_by)
+    with self.invalidated(targets, invalidate_dependents=True) as invalidation_check:
+      if not invalidation_check.all_vts:
+        return
+      repo_vts = VersionedTargetSet.from_versioned_targets(invalidation_check.all_vts)
+      repo_dir = os.path.join(self.workdir, repo_vts.cache_key.hash)
+      if read_json(os.path.join(repo_dir, self._complete_marker_filename)) is None:
+        self._consolidate(repo_dir)
+
+    self.context.products.register_data(
+      self.ConsolidatedRepo,
+      self.ConsolidatedRepo(install_spec='{}{}'.format(PERL6_INSTALL_DIR_PREFIX, repo_dir)))
+
+  def _dependency_ordered_libraries(self):
+    """Return the perl6_library targets in play, each after the libraries it depends on."""
+    ordered = []
+    self.context.build_graph.walk_transitive_dependency_graph(
+      [t.address for t in self.context.target_roots],
+      ordered.append,
+      postorder=True)
+    return [t for t in ordered if isinstance(t, Perl6Library)]
+
+  def _consolidate(self, repo_dir):
+    buildroot = get_buildroot()
+    distributions = []
+    for lib_tgt in self._dependency_ordered_libraries():
+      # NB: Modules are named after their file, relative to the dir containing it (see
+      # Perl6Library.lib_dirs).
+      provides = OrderedDict(
+        (os.path.splitext(os.path.basename(source))[0], source)
+        for source in lib_tgt.sources_relative_to_buildroot())
+      if provides:
+        distributions.append({
+          'name': lib_tgt.address.spec,
+          'prefix': buildroot,
+          'provides': provides,
+        })
+    zef_install_result = self.context.products.get_data(Zef.ZefInstallResult)
+    repositories = list(zef_install_result.install_specs) if zef_install_result else []
+
+    # Build the repository in a staging dir, so that an interrupted install is never mistaken for
+    # a complete one.
+    staging_dir = '{}.tmp-{}'.format(repo_dir, os.getpid())
+    safe_rmtree(staging_dir)
+    safe_mkdir(staging_dir)
+    input_path = os.path.join(self.workdir, 'input-{}.json'.format(os.getpid()))
+    write_json_atomic(input_path, {
+      'distributions': distributions,
+      'repositories': repositories,
+    })
+    script_path = os.path.join(self.workdir, self._script_name)
+    with open(script_path, 'wb') as f:
+      f.write(pkgutil.get_data(__name__, self._script_name))
+
+    try:
+      self._perl6.invoke_perl6_with_lib_entries(
+        [script_path, staging_dir, input_path], [],
+        workunit_factory=functools.partial(self.context.new_workunit, name='consolidate',
+                                           labels=[WorkUnitLabel.TOOL]))
+    except Perl6.Perl6InvocationError as e:
+      safe_rmtree(staging_dir)
+      raise self.Perl6ConsolidateRepoError(
+        "Error consolidating the module repository: {}".format(e),
+        e,
+        exit_code=e.exit_code)
+    finally:
+      os.unlink(input_path)
+
+    write_json_atomic(os.path.join(staging_dir, self._complete_marker_filename), {
+      'distributions': [d['name'] for d in distributions],
+      'repositories': repositories,
+    })
+    safe_rmtree(repo_dir)
+    os.rename(staging_dir, repo_dir)
@@ -0,0 +1,96 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import hashlib
+import io
+import os
+
+from pants.base.build_environment import get_buildroot
+from pants.base.workunit import WorkUnitLabel
+from pants.task.task import Task
+from pants.util.objects import Exactly, datatype
+from upstreamable.index.incremental_index import IncrementalSymbolIndex
+from upstreamable.index.lexer_grammar import tokenize_path
+from upstreamable.index.perl6_lexer import extract_symbols
+from upstreamable.targets.perl6_binary import Perl6Binary
+from upstreamable.targets.perl6_library import Perl6Library
+from upstreamable.targets.perl6_test import Perl6Test
+
+
+class Perl6Index(Task):
+  """Maintain a memory-mapped index of the symbols defined and referenced in perl6 sources.
+
+  The index records the file, line and column of each class, role, grammar, module, sub and
+  method declaration, each `my`/`our`/`has` variable declaration, each `use` of a module, and each
+  other occurrence of an identifier or variable. See upstreamable.index.symbol_index for the
+  format, which is looked up in place without reading the whole file.
+
+  Updates are incremental: the sources of targets which are still valid aren't read at all, and of
+  the rest only files with new content are lexed (see
+  upstreamable.index.incremental_index.IncrementalSymbolIndex).
+  """
+
+  source_target_constraint = Exactly(Perl6Library, Perl6Binary, Perl6Test)
+
+  class SymbolIndexDir(datatype(['path'])): pass
+
+  @classmethod
+  def register_options(cls, register):
+    super(Perl6Index, cls).register_options(register)
+    register('--compact-ratio', type=float, default=0.25, advanced=True,
+             help='Rewrite the whole index once the files changed since it was last rewritten '
+                  'amount to this fraction of it. Until then, each update only rewrites an index '
+                  'of the changed files.')
+
+  # NB: Bump this when the lexer changes. It invalidates every target, and is part of the content
+  # hash the index keys each file's symbols by, so that every file is lexed again.
+  _lexer_version = 1
+
+  @classmethod
+  def implementation_version(cls):
+    return super(Perl6Index, cls).implementation_version() + [('Perl6Index', cls._lexer_version)]
+
+  @classmethod
+  def product_types(cls):
+    return [cls.SymbolIndexDir]
+
+  @property
+  def index_dir(self):
+    return os.path.join(self.workdir, 'index')
+
+  @classmethod
+  def _content_hash(cls, path):
+    hasher = hashlib.sha1('lexer-{}\0'.format(cls._lexer_version).encode('ascii'))
+    with open(path, 'rb') as f:
+      hasher.update(f.read())
+    return hasher.hexdigest()
+
+  def execute(self):
+    buildroot = get_buildroot()
+    index = IncrementalSymbolIndex(self.index_dir)
+    targets = self.context.targets(self.source_target_constraint.satisfied_by)
+
+    # NB: A target's sources are all that determine its entries in the index.
+    with self.invalidated(targets, invalidate_dependents=False) as invalidation_check:
+      indexed_hashes = index.content_hashes()
+      content_hashes = {}
+      for vt in invalidation_check.all_vts:
+        for source in vt.target.sources_relative_to_buildroot():
+          content_hash = indexed_hashes.get(source) if vt.valid else None
+          content_hashes[source] = content_hash or self._content_hash(
+            os.path.join(buildroot, source))
+
+      def lex_file(source):
+        with io.open(os.path.join(buildroot, source), 'r', encoding='utf-8',
+                     errors='replace') as f:
+          return list(extract_symbols(tokenize_path(source, f.read())))
+
+      with self.context.new_workunit(name='perl6-index', labels=[WorkUnitLabel.TOOL]):
+        stats = index.update(content_hashes, lex_file,
+                             compact_ratio=self.get_options().compact_ratio)
+
+    self.context.log.info(
+      'Indexed {} perl6 files into {}: {} changed, {} removed, {} lexed{}.'
+      .format(len(content_hashes), self.index_dir, stats.changed, stats.removed, stats.lexed,
+              ', compacted' if stats.compacted else ''))
+    self.context.products.register_data(self.SymbolIndexDir, self.SymbolIndexDir(self.index_dir))
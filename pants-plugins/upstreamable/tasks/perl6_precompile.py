@@ -0,0 +1,163 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import functools
+import os
+import shutil
+from collections import OrderedDict
+
+from pants.base.build_environment import get_buildroot
+from pants.base.exceptions import TaskError
+from pants.base.workunit import WorkUnitLabel
+from pants.task.task import Task
+from pants.util.dirutil import safe_mkdir
+from pants.util.memo import memoized_property
+from pants.util.objects import Exactly, datatype
+from twitter.common.collections import OrderedSet
+from upstreamable.subsystems.perl6 import Perl6
+from upstreamable.subsystems.zef import Zef
+from upstreamable.targets.perl6_library import Perl6Library
+from upstreamable.tasks.gather_perl6_source_lib_entries import \
+    GatherPerl6SourceLibEntries
+from upstreamable.util.parallel import default_parallelism, parallel_map
+
+
+class Perl6Precompile(Task):
+  """Precompile the modules of each perl6_library into a precompilation store for its fingerprint.
+
+  Rakudo keeps precompiled modules in a `.precomp` dir next to the sources of a
+  CompUnit::Repository::FileSystem. Each target's sources are copied into its results dir, which is
+  specific to the target's fingerprint, so the precompiled modules there are never stale and are
+  only rebuilt when the target or one of its dependencies changes.
+  """
+
+  source_target_constraint = Exactly(Perl6Library)
+
+  class PrecompiledEntries(datatype([('entries', GatherPerl6SourceLibEntries.Entries)])): pass
+
+  class Perl6PrecompileError(TaskError): pass
+
+  @classmethod
+  def register_options(cls, register):
+    super(Perl6Precompile, cls).register_options(register)
+    register('--skip', type=bool, default=False,
+             help='Point PERL6LIB at the raw source dirs instead of a precompilation store.')
+    register('--parallelism', type=int, default=default_parallelism(), advanced=True,
+             help='Precompile at most this many targets concurrently.')
+
+  @classmethod
+  def subsystem_dependencies(cls):
+    return super(Perl6Precompile, cls).subsystem_dependencies() + (Perl6.scoped(cls),)
+
+  @memoized_property
+  def _perl6(self):
+    return Perl6.scoped_instance(self)
+
+  @classmethod
+  def prepare(cls, options, round_manager):
+    super(Perl6Precompile, cls).prepare(options, round_manager)
+    round_manager.optional_data(Zef.ZefInstallResult)
+
+  @classmethod
+  def product_types(cls):
+    return [cls.PrecompiledEntries]
+
+  @property
+  def create_target_dirs(self):
+    return True
+
+  def _precompile_workunit_factory(self, parent_workunit, *args, **kwargs):
+    return self.context.run_tracker.new_workunit_under_parent(
+      name='perl6-precompile',
+      parent=parent_workunit,
+      labels=[WorkUnitLabel.COMPILER],
+      *args, **kwargs)
+
+  @staticmethod
+  def _precomp_lib_dirs(vt):
+    """Map each of the target's source lib dirs to the copy of it within the results dir."""
+    buildroot = get_buildroot()
+    return OrderedDict(
+      (lib_dir, os.path.join(vt.current_results_dir, os.path.relpath(lib_dir, buildroot)))
+      for lib_dir in OrderedSet(vt.target.lib_dirs))
+
+  def execute(self):
+    if self.get_options().skip:
+      return
+
+    lib_targets = self.context.targets(self.source_target_constraint.satisfied_by)
+    zef_install_result = self.context.products.get_data(Zef.ZefInstallResult)
+    zef_install_specs = list(zef_install_result.install_specs) if zef_install_result else []
+
+    with self.invalidated(lib_targets, invalidate_dependents=True) as invalidation_check:
+      precomp_lib_dirs = {vt.target: self._precomp_lib_dirs(vt)
+                          for vt in invalidation_check.all_vts}
+      if invalidation_check.invalid_vts:
+        with self.context.new_workunit(name='perl6-precompile',
+                                       labels=[WorkUnitLabel.MULTITOOL]) as workunit:
+          self._precompile(invalidation_check.invalid_vts, precomp_lib_dirs, zef_install_specs,
+                           functools.partial(self._precompile_workunit_factory, workunit))
+
+    # NB: This keeps the same order as the source lib dirs they replace.
+    all_precomp_lib_dirs = OrderedSet()
+    for lib_tgt in lib_targets:
+      all_precomp_lib_dirs.update(precomp_lib_dirs[lib_tgt].values())
+    self.context.products.register_data(
+      self.PrecompiledEntries,
+      self.PrecompiledEntries(GatherPerl6SourceLibEntries.Entries(
+        containing_lib_dirs=tuple(all_precomp_lib_dirs))))
+
+  def _precompile(self, invalid_vts, precomp_lib_dirs, zef_install_specs, workunit_factory):
+    buildroot = get_buildroot()
+    for vt in invalid_vts:
+      for source_relpath in vt.target.sources_relative_to_buildroot():
+        dest = os.path.join(vt.current_results_dir, source_relpath)
+        safe_mkdir(os.path.dirname(dest))
+        shutil.copy2(os.path.join(buildroot, source_relpath), dest)
+
+    def precompile_target(vt):
+      lib_entries = OrderedSet()
+      # NB: Dependencies are already precompiled into their own stores by this point, and rakudo
+      # will load them from there.
+      for dep in vt.target.closure():
+        if dep in precomp_lib_dirs:
+          lib_entries.update(precomp_lib_dirs[dep].values())
+      lib_entries.update(zef_install_specs)
+      module_names = [os.path.splitext(os.path.basename(source))[0]
+                      for source in vt.target.sources_relative_to_buildroot()]
+      if not module_names:
+        return
+      # NB: `-c` stops after compiling the -e program, which loads (and so precompiles) each module.
+      program = ' '.join('need {};'.format(name) for name in module_names)
+      try:
+        self._perl6.invoke_perl6_with_lib_entries(
+          ['-c', '-e', program], list(lib_entries), workunit_factory=workunit_factory)
+      except Perl6.Perl6InvocationError as e:
+        raise self.Perl6PrecompileError(
+          "Error precompiling {}: {}".format(vt.target.address.spec, e),
+          e,
+          exit_code=e.exit_code)
+
+    for group in self._dependency_ordered_groups(invalid_vts):
+      parallel_map(precompile_target, group, self.get_options().parallelism)
+
+  @staticmethod
+  def _dependency_ordered_groups(vts):
+    """Split `vts` into groups with no dependencies within a group, each after its dependencies."""
+    invalid_targets = {vt.target for vt in vts}
+    depths = {}
+
+    def depth(target):
+      if target not in depths:
+        dep_depths = [depth(dep) for dep in target.closure()
+                      if dep != target and dep in invalid_targets]
+        depths[target] = 1 + max(dep_depths or [-1])
+      return depths[target]
+
+    groups = []
+    for vt in vts:
+      target_depth = depth(vt.target)
+      while len(groups) <= target_depth:
+        groups.append([])
+      groups[target_depth].append(vt)
+    return groups
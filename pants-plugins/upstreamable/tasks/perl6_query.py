@@ -0,0 +1,68 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import io
+import os
+
+from pants.base.build_environment import get_buildroot
+from pants.base.exceptions import TaskError
+from pants.task.console_task import ConsoleTask
+from pants.util.memo import memoized_property
+from pants.util.objects import Exactly
+from upstreamable.index.lexer_grammar import tokenize_path
+from upstreamable.index.token_query import CompiledTokenQueries, TokenQuerySyntaxError
+from upstreamable.targets.perl6_binary import Perl6Binary
+from upstreamable.targets.perl6_library import Perl6Library
+from upstreamable.targets.perl6_test import Perl6Test
+
+
+class Perl6Query(ConsoleTask):
+  """Print each match of a set of token queries in perl6 sources.
+
+  Each query is a pattern over tokens, e.g. "`class` IDENT ... `method` IDENT" (see
+  upstreamable.index.token_query). All the queries are compiled into a single automaton which
+  reads each source file's tokens once, so adding queries doesn't add passes over the sources.
+  """
+
+  source_target_constraint = Exactly(Perl6Library, Perl6Binary, Perl6Test)
+
+  class InvalidQueryError(TaskError): pass
+
+  @classmethod
+  def register_options(cls, register):
+    super(Perl6Query, cls).register_options(register)
+    register('--query', type=list, default=[],
+             help='Token queries to search for, each either a query or NAME=QUERY. Matches are '
+                  'printed with the query name, which defaults to the query itself.')
+
+  @memoized_property
+  def _compiled_queries(self):
+    named_queries = []
+    for query in self.get_options().query:
+      name, sep, pattern = query.partition('=')
+      if not sep or ' ' in name:
+        name, pattern = query, query
+      named_queries.append((name, pattern))
+    if not named_queries:
+      raise self.InvalidQueryError('No --query given.', exit_code=2)
+    try:
+      return CompiledTokenQueries(named_queries)
+    except TokenQuerySyntaxError as e:
+      raise self.InvalidQueryError('Invalid token query: {}'.format(e), exit_code=2)
+
+  def console_output(self, targets):
+    queries = self._compiled_queries
+    buildroot = get_buildroot()
+    sources = set()
+    for target in targets:
+      if self.source_target_constraint.satisfied_by(target):
+        sources.update(target.sources_relative_to_buildroot())
+
+    for source in sorted(sources):
+      with io.open(os.path.join(buildroot, source), 'r', encoding='utf-8', errors='replace') as f:
+        tokens = list(tokenize_path(source, f.read()))
+      for match in queries.search(tokens):
+        matched = tokens[match.start:match.end]
+        first = matched[0]
+        text = ' '.join(t.text for t in matched)
+        yield '{}:{}:{}: {}: {}'.format(source, first.line, first.col, match.query, text)
@@ -15,6 +15,7 @@ from upstreamable.subsystems.perl6 import Perl6
 from upstreamable.subsystems.zef import Zef, ZefReplBootstrap
 from upstreamable.targets.perl6_binary import Perl6Binary
 from upstreamable.tasks.collect_perl6_env import CollectPerl6Env
+from upstreamable.util.parallel import default_parallelism
 
 
 class Perl6Run(Task):
@@ -25,6 +26,13 @@ class Perl6Run(Task):
   def register_options(cls, register):
     super(Perl6Run, cls).register_options(register)
     register('--args', type=list, help='Run with these extra args to the main script.')
+    register('--batch', type=bool, default=False,
+             help='Run every perl6_binary target root concurrently in this one pants run, '
+                  'instead of requiring a single target. Each line of output is prefixed with '
+                  'the address of the target which wrote it, and the run fails with the highest '
+                  'exit code of any of them.')
+    register('--batch-parallelism', type=int, default=default_parallelism(),
+             help='With --batch, run at most this many binaries at a time.')
 
   @classmethod
   def supports_passthru_args(cls):
@@ -41,7 +49,7 @@ class Perl6Run(Task):
   @classmethod
   def prepare(cls, options, round_manager):
     super(Perl6Run, cls).prepare(options, round_manager)
-    round_manager.require_data(CollectPerl6Env.Perl6Env)
+    round_manager.require_data(CollectPerl6Env.ScopedPerl6Envs)
 
   def _run_workunit_factory(self, *args, **kwargs):
     return self.context.new_workunit(
@@ -52,28 +60,84 @@ class Perl6Run(Task):
 
   source_target_constraint = Exactly(Perl6Binary)
 
+  def _extra_args(self):
+    extra_args = []
+    for arg in self.get_options().args:
+      extra_args.extend(safe_shlex_split(arg))
+    return extra_args
+
   def execute(self):
+    if self.get_options().batch:
+      return self._execute_batch()
+
     binary = self.require_single_root_target()
     if not self.source_target_constraint.satisfied_by(binary):
       return
 
-    extra_args = []
-    for arg in self.get_options().args:
-      extra_args.extend(safe_shlex_split(arg))
+    extra_args = self._extra_args()
     passthru_args = self.get_passthru_args()
-    full_argv = extra_args + [binary.script_path, '--'] + passthru_args
 
-    perl6_env = self.context.products.get_data(CollectPerl6Env.Perl6Env)
+    # NB: The binary only needs the zef dists in its own closure.
+    perl6_env = self.context.products.get_data(CollectPerl6Env.ScopedPerl6Envs).for_target(binary)
 
     self.context.release_lock()
 
     try:
-      self._perl6.invoke_perl6(
-        full_argv,
+      self._perl6.run_script(
+        binary.script_path,
+        ['--'] + passthru_args,
         perl6_env,
+        interpreter_args=extra_args,
         workunit_factory=self._run_workunit_factory)
     except Perl6.Perl6InvocationError as e:
       raise self.Perl6RunError(
         "Error running perl 6: {}".format(e),
         e,
         exit_code=e.exit_code)
+
+  @staticmethod
+  def _shell_exit_code(exit_code):
+    # NB: As a shell reports it: a process killed by signal N exits with 128 + N.
+    return exit_code if exit_code >= 0 else 128 - exit_code
+
+  def _execute_batch(self):
+    binaries = [t for t in self.context.target_roots
+                if self.source_target_constraint.satisfied_by(t)]
+    if not binaries:
+      return
+
+    extra_args = self._extra_args()
+    passthru_args = self.get_passthru_args()
+    scoped_envs = self.context.products.get_data(CollectPerl6Env.ScopedPerl6Envs)
+    script_runs = [
+      Perl6.ScriptRun(name=binary.address.spec,
+                      script_path=binary.script_path,
+                      args=['--'] + passthru_args,
+                      perl6_env=scoped_envs.for_target(binary),
+                      interpreter_args=extra_args)
+      for binary in binaries
+    ]
+
+    self.context.release_lock()
+
+    with self._run_workunit_factory() as workunit:
+      try:
+        exit_codes = self._perl6.run_scripts_concurrently(
+          script_runs, self.get_options().batch_parallelism, workunit.output('stdout'))
+      except Perl6.Perl6InvocationError as e:
+        raise self.Perl6RunError(
+          "Error running perl 6: {}".format(e),
+          e,
+          exit_code=e.exit_code)
+
+    for name, exit_code in exit_codes.items():
+      outcome = 'PASS' if exit_code == 0 else 'FAIL ({})'.format(exit_code)
+      self.context.log.info('{} {}'.format(outcome, name))
+    failures = [(name, exit_code) for name, exit_code in exit_codes.items() if exit_code != 0]
+    if failures:
+      raise self.Perl6RunError(
+        '{} of {} perl6 binaries exited non-zero:\n{}'
+        .format(len(failures), len(exit_codes),
+                '\n'.join('  {} ({})'.format(name, exit_code) for name, exit_code in failures)),
+        exit_code=max(self._shell_exit_code(exit_code) for _, exit_code in failures),
+        failed_targets=[b for b in binaries if exit_codes[b.address.spec] != 0])
@@ -0,0 +1,227 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import functools
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+
+from pants.base.exceptions import TaskError
+from pants.base.fingerprint_strategy import FingerprintStrategy
+from pants.base.workunit import WorkUnitLabel
+from pants.task.task import Task
+from pants.util.memo import memoized_property
+from pants.util.objects import Exactly, datatype
+from pants.util.strutil import ensure_binary
+from upstreamable.subsystems.perl6 import Perl6
+from upstreamable.targets.perl6_test import Perl6Test
+from upstreamable.tasks.collect_perl6_env import CollectPerl6Env
+from upstreamable.util.json_files import read_json, write_json_atomic
+from upstreamable.util.parallel import default_parallelism, parallel_map
+
+
+class Perl6TestFingerprintStrategy(FingerprintStrategy):
+  """Fingerprint targets by their payload, and test targets also by the zef resolve they use.
+
+  The zef resolve is computed from the closure of the target root rather than being part of each
+  test's dependencies, so it has to be mixed into the fingerprint of each test target separately.
+  """
+
+  def __init__(self, zef_install_specs_by_test_target):
+    self._zef_install_specs_by_test_target = {
+      t: tuple(sorted(specs)) for t, specs in zef_install_specs_by_test_target.items()}
+
+  def compute_fingerprint(self, target):
+    hasher = hashlib.sha1()
+    hasher.update(ensure_binary(target.payload.fingerprint() or ''))
+    for spec in self._zef_install_specs_by_test_target.get(target, ()):
+      hasher.update(ensure_binary(spec))
+    return hasher.hexdigest()
+
+  def __hash__(self):
+    return hash(type(self))
+
+  def __eq__(self, other):
+    return (type(self) == type(other) and
+            self._zef_install_specs_by_test_target == other._zef_install_specs_by_test_target)
+
+
+class Perl6TestRun(Task):
+  """Run the test files of perl6_test targets, in parallel and optionally sharded.
+
+  The results of each target are cached by the fingerprint of the target, its transitive
+  dependencies, the zef resolve and the toolchain (via the options of this task's subsystems).
+  Only targets whose test files all passed are recorded as valid, so failing tests always rerun.
+  """
+
+  source_target_constraint = Exactly(Perl6Test)
+
+  class Perl6TestFailure(TaskError): pass
+
+  class TestFileResult(datatype(['target', 'source', 'exit_code', 'seconds'])):
+
+    @property
+    def passed(self):
+      return self.exit_code == 0
+
+  @classmethod
+  def register_options(cls, register):
+    super(Perl6TestRun, cls).register_options(register)
+    register('--parallelism', type=int, default=default_parallelism(),
+             help='Run at most this many test files concurrently.')
+    register('--shard', type=str, default=None,
+             help='Only run the test files in shard k of n, given as "k/n" with 0 <= k < n. Test '
+                  'files are assigned to shards round-robin, in order of their paths.')
+
+  @classmethod
+  def subsystem_dependencies(cls):
+    return super(Perl6TestRun, cls).subsystem_dependencies() + (Perl6.scoped(cls),)
+
+  @memoized_property
+  def _perl6(self):
+    return Perl6.scoped_instance(self)
+
+  @classmethod
+  def prepare(cls, options, round_manager):
+    super(Perl6TestRun, cls).prepare(options, round_manager)
+    round_manager.require_data(CollectPerl6Env.ScopedPerl6Envs)
+
+  @property
+  def cache_target_dirs(self):
+    return True
+
+  def _test_workunit_factory(self, parent_workunit, *args, **kwargs):
+    # NB: Test files are run from threads which have no current workunit of their own.
+    return self.context.run_tracker.new_workunit_under_parent(
+      name='perl6-test',
+      parent=parent_workunit,
+      labels=[WorkUnitLabel.TOOL, WorkUnitLabel.TEST],
+      *args, **kwargs)
+
+  _shard_pattern = re.compile(r'^([0-9]+)/([0-9]+)$')
+
+  @memoized_property
+  def _shard(self):
+    """Return (k, n) for the shard to run, or None to run every test file."""
+    shard = self.get_options().shard
+    if shard is None:
+      return None
+    match = self._shard_pattern.match(shard)
+    if match:
+      k, n = int(match.group(1)), int(match.group(2))
+      if 0 <= k < n:
+        return k, n
+    raise self.Perl6TestFailure(
+      "--shard must be of the form k/n with 0 <= k < n: was '{}'.".format(shard))
+
+  def _test_files(self, targets):
+    """Return the (target, source) pairs to run in this shard, in order of their paths."""
+    all_test_files = sorted(((t, s) for t in targets for s in t.sources_relative_to_buildroot()),
+                            key=lambda pair: pair[1])
+    if self._shard is None:
+      return all_test_files
+    k, n = self._shard
+    return all_test_files[k::n]
+
+  _results_filename = 'results.json'
+
+  def execute(self):
+    test_targets = self.context.targets(self.source_target_constraint.satisfied_by)
+    test_files = self._test_files(test_targets)
+    if not test_files:
+      return
+    scoped_envs = self.context.products.get_data(CollectPerl6Env.ScopedPerl6Envs)
+
+    shard_files_by_target = OrderedDict()
+    for target, source in test_files:
+      shard_files_by_target.setdefault(target, []).append(source)
+    # NB: Targets with test files in other shards never run completely here, so their results are
+    # neither read from nor written to the cache.
+    cacheable_targets = [t for t, sources in shard_files_by_target.items()
+                         if len(sources) == len(t.sources_relative_to_buildroot())]
+    uncacheable_targets = [t for t in shard_files_by_target if t not in cacheable_targets]
+
+    fingerprint_strategy = Perl6TestFingerprintStrategy({
+      t: [spec for result in scoped_envs.for_target(t).zef_resolve_results
+          for spec in result.install_specs]
+      for t in cacheable_targets})
+    with self.invalidated(cacheable_targets,
+                          invalidate_dependents=True,
+                          fingerprint_strategy=fingerprint_strategy) as invalidation_check:
+      cached_results = []
+      for vt in invalidation_check.all_vts:
+        if vt.valid:
+          cached_results.extend(self._read_results(vt))
+      invalid_vts_by_target = {vt.target: vt for vt in invalidation_check.invalid_vts}
+
+      files_to_run = [(t, s) for t, s in test_files
+                      if t in invalid_vts_by_target or t in uncacheable_targets]
+      if files_to_run:
+        with self.context.new_workunit(name='perl6-tests',
+                                       labels=[WorkUnitLabel.MULTITOOL]) as workunit:
+          results = self._run_test_files(files_to_run, scoped_envs,
+                                         functools.partial(self._test_workunit_factory, workunit))
+      else:
+        results = []
+
+      results_by_target = OrderedDict()
+      for result in results:
+        results_by_target.setdefault(result.target, []).append(result)
+      passed_vts = []
+      for target, vt in invalid_vts_by_target.items():
+        target_results = results_by_target.get(target, [])
+        self._write_results(vt, target_results)
+        if all(r.passed for r in target_results):
+          passed_vts.append(vt)
+          vt.update()
+
+      # NB: Raising from within the invalidated() block keeps the targets which failed invalid,
+      # but also skips writing the artifacts of the ones which passed, so do that here first.
+      failures = [r for r in results if not r.passed]
+      if failures and passed_vts and self.artifact_cache_writes_enabled():
+        self.update_artifact_cache([(vt, [vt.results_dir]) for vt in passed_vts])
+      self._report(cached_results, results)
+
+  def _write_results(self, vt, results):
+    write_json_atomic(os.path.join(vt.results_dir, self._results_filename), {
+      'files': [{'source': r.source, 'exit_code': r.exit_code, 'seconds': r.seconds}
+                for r in results],
+    })
+
+  def _read_results(self, vt):
+    recorded = read_json(os.path.join(vt.results_dir, self._results_filename)) or {'files': []}
+    return [self.TestFileResult(target=vt.target, source=f['source'], exit_code=f['exit_code'],
+                                seconds=f['seconds'])
+            for f in recorded['files']]
+
+  def _run_test_files(self, test_files, scoped_envs, workunit_factory):
+    def run_test_file(test_file):
+      target, source = test_file
+      start = time.time()
+      try:
+        self._perl6.invoke_perl6([source], scoped_envs.for_target(target),
+                                 workunit_factory=workunit_factory)
+        exit_code = 0
+      except Perl6.Perl6InvocationError as e:
+        exit_code = e.exit_code if e.exit_code else 1
+      return self.TestFileResult(target=target, source=source, exit_code=exit_code,
+                                 seconds=time.time() - start)
+
+    return parallel_map(run_test_file, test_files, self.get_options().parallelism)
+
+  def _report(self, cached_results, results):
+    for result in sorted(cached_results, key=lambda r: r.source):
+      self.context.log.info('{:>8.3f}s CACHED PASS {}'.format(result.seconds, result.source))
+    for result in sorted(results, key=lambda r: r.seconds, reverse=True):
+      self.context.log.info('{:>8.3f}s {} {}'.format(
+        result.seconds, 'PASS' if result.passed else 'FAIL', result.source))
+
+    failures = [r for r in results if not r.passed]
+    if failures:
+      raise self.Perl6TestFailure(
+        '{} of {} perl6 test files failed:\n{}'
+        .format(len(failures), len(results),
+                '\n'.join('  {} ({})'.format(r.source, r.target.address.spec) for r in failures)),
+        failed_targets=sorted({r.target for r in failures}, key=lambda t: t.address.spec))
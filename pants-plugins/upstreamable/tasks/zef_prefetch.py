@@ -0,0 +1,56 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import functools
+
+from pants.base.exceptions import TaskError
+from pants.base.workunit import WorkUnitLabel
+from pants.task.task import Task
+from pants.util.memo import memoized_property
+from pants.util.objects import Exactly
+from upstreamable.subsystems.zef import Zef
+from upstreamable.targets.zef_requirement_library import ZefRequirementLibrary
+
+
+class ZefPrefetch(Task):
+  """Fetch every zef requirement in play, and its dependencies, into the local zef mirror."""
+
+  source_target_constraint = Exactly(ZefRequirementLibrary)
+
+  class ZefPrefetchError(TaskError): pass
+
+  @classmethod
+  def subsystem_dependencies(cls):
+    return super(ZefPrefetch, cls).subsystem_dependencies() + (Zef.scoped(cls),)
+
+  @memoized_property
+  def _zef(self):
+    return Zef.scoped_instance(self)
+
+  def _fetch_workunit_factory(self, parent_workunit, *args, **kwargs):
+    return self.context.run_tracker.new_workunit_under_parent(
+      name='zef-fetch',
+      parent=parent_workunit,
+      labels=[WorkUnitLabel.TOOL],
+      *args, **kwargs)
+
+  def execute(self):
+    zef_req_libs = self.context.targets(self.source_target_constraint.satisfied_by)
+    all_zef_reqs = []
+    for zef_req_lib in zef_req_libs:
+      all_zef_reqs.extend(zef_req_lib.requirements)
+    if not all_zef_reqs:
+      return
+
+    try:
+      with self.context.new_workunit(name='zef-prefetch',
+                                     labels=[WorkUnitLabel.MULTITOOL]) as workunit:
+        added = self._zef.prefetch_into_mirror(
+          all_zef_reqs, self.workdir, functools.partial(self._fetch_workunit_factory, workunit))
+    except Zef.ZefException as e:
+      raise self.ZefPrefetchError(
+        "Error prefetching zef req libs: {}".format(e),
+        e,
+        exit_code=e.exit_code)
+    self.context.log.info('Added {} distributions to the zef mirror: {}.'
+                          .format(len(added), ', '.join(added)))
@@ -1,26 +1,41 @@
 from __future__ import (absolute_import, division, generators, nested_scopes,
                         print_function, unicode_literals, with_statement)
 
+import functools
 import os
+from collections import OrderedDict
 
 from pants.base.exceptions import TaskError
 from pants.base.workunit import WorkUnitLabel
-from pants.invalidation.cache_manager import VersionedTargetSet
+from pants.invalidation.cache_manager import InvalidationCheck, VersionedTargetSet
 from pants.task.task import Task
-from pants.util.dirutil import safe_mkdir
 from pants.util.memo import memoized_property
-from pants.util.objects import Exactly
+from pants.util.objects import Exactly, datatype
+from twitter.common.collections import OrderedSet
 from upstreamable.subsystems.zef import Zef
 from upstreamable.targets.zef_requirement_library import ZefRequirementLibrary
 
 
 class ZefResolve(Task):
+  """Resolve the zef requirements of each target root.
+
+  Each target root gets a resolve of just the zef_requirement_library targets in its own
+  transitive closure, and roots with the same requirement libraries share a single resolve. The
+  union of all of those resolves (which are made of the same content-addressed store entries) is
+  also provided, for tasks which operate on the whole run, like the REPL.
+  """
 
   source_target_constraint = Exactly(ZefRequirementLibrary)
 
+  class ScopedInstallResults(datatype([('results_by_root', dict)])):
+
+    def for_root(self, target):
+      """The install result for the closure of `target`, or None if it has no zef requirements."""
+      return self.results_by_root.get(target)
+
   @classmethod
   def product_types(cls):
-    return [Zef.ZefInstallResult]
+    return [Zef.ZefInstallResult, cls.ScopedInstallResults]
 
   class ZefResolveError(TaskError): pass
 
@@ -32,27 +47,94 @@ class ZefResolve(Task):
   def _zef(self):
     return Zef.scoped_instance(self)
 
-  def _resolve_workunit_factory(self, *args, **kwargs):
-    return self.context.new_workunit(
-      name='zef-resolve',
+  def _install_workunit_factory(self, parent_workunit, *args, **kwargs):
+    # NB: Distributions may be installed concurrently, from threads which have no current workunit
+    # of their own, so the parent must be explicit.
+    return self.context.run_tracker.new_workunit_under_parent(
+      name='zef-install',
+      parent=parent_workunit,
       labels=[WorkUnitLabel.TOOL],
       *args, **kwargs)
 
+  # Set in execute() before invalidating: the requirement libraries of each distinct resolve.
+  _resolve_req_libs = ()
+
+  @staticmethod
+  def _resolve_vts(all_vts, req_libs):
+    vts_by_target = {vt.target: vt for vt in all_vts}
+    return [vts_by_target[t] for t in req_libs]
+
+  def check_artifact_cache_for(self, invalidation_check):
+    # Each resolve is an output of the entire set of its requirement libraries, and is not divisible
+    # by target, so it can only be cached keyed by that set.
+    return [VersionedTargetSet.from_versioned_targets(
+              self._resolve_vts(invalidation_check.all_vts, req_libs))
+            for req_libs in self._resolve_req_libs]
+
   # NB: Manually manage cache target dirs with VersionedTargetSet!
-  # TODO: This is one of those resolves (like python, jvm, ???) which uses all the relevant targets
-  # in the current run (i.e. all transitive deps of target roots) to form the resolve. This can be
-  # confusing!
   def execute(self):
-    zef_req_libs = self.context.targets(self.source_target_constraint.satisfied_by)
-    with self.invalidated(zef_req_libs, invalidate_dependents=True) as zef_invalidation_check:
-      # If there are no targets in play, don't do the resolve.
-      if zef_invalidation_check.all_vts:
-        try:
-          install_result = self._zef.resolve(
-            self.workdir, zef_invalidation_check, self._resolve_workunit_factory)
-          self.context.products.register_data(Zef.ZefInstallResult, install_result)
-        except Zef.ZefException as e:
-          raise self.ZefResolveError(
-            "Error resolving zef req libs: {}".format(e),
-            e,
-            exit_code=e.exit_code)
+    req_libs_by_root = OrderedDict(
+      (root, [t for t in root.closure() if self.source_target_constraint.satisfied_by(t)])
+      for root in self.context.target_roots)
+
+    # Roots with the same requirement libraries in their closure (e.g. several binaries using the
+    # same third-party libraries) share a single resolve.
+    self._resolve_req_libs = list(OrderedDict(
+      (frozenset(req_libs), req_libs) for req_libs in req_libs_by_root.values() if req_libs
+    ).values())
+    all_req_libs = OrderedSet(t for req_libs in self._resolve_req_libs for t in req_libs)
+
+    # NB: The closures of different roots overlap, so the requirement libraries are invalidated
+    # once, all together. Invalidating each root's separately would mark the libraries shared
+    # with a later root valid, so the later root's resolve would never be written to the cache.
+    results_by_req_libs = OrderedDict()
+    if all_req_libs:
+      with self.invalidated(list(all_req_libs),
+                            invalidate_dependents=True) as invalidation_check:
+        for req_libs in self._resolve_req_libs:
+          results_by_req_libs[frozenset(req_libs)] = self._resolve(
+            self._resolve_vts(invalidation_check.all_vts, req_libs))
+
+    results_by_root = {root: results_by_req_libs.get(frozenset(req_libs))
+                       for root, req_libs in req_libs_by_root.items()}
+    self.context.products.register_data(self.ScopedInstallResults,
+                                        self.ScopedInstallResults(results_by_root))
+
+    # If there are no targets in play, don't register a resolve.
+    if results_by_req_libs:
+      all_install_specs = OrderedSet(spec for result in results_by_req_libs.values()
+                                     for spec in result.install_specs)
+      self.context.products.register_data(Zef.ZefInstallResult,
+                                          Zef.ZefInstallResult(tuple(all_install_specs)))
+
+  def _resolve(self, resolve_vts):
+    zef_invalidation_check = InvalidationCheck(
+      all_vts=resolve_vts, invalid_vts=[vt for vt in resolve_vts if not vt.valid])
+    # NB: A hit in the artifact cache for another resolve marks the libraries it shares with this
+    # one valid, so this resolve is also written to the cache if its results dir is new.
+    results_dir = self._zef.resolve_results_dir(
+      self.workdir, VersionedTargetSet.from_versioned_targets(resolve_vts))
+    freshly_resolved = bool(zef_invalidation_check.invalid_vts) or not os.path.isdir(results_dir)
+    try:
+      with self.context.new_workunit(name='zef-resolve',
+                                     labels=[WorkUnitLabel.MULTITOOL]) as workunit:
+        install_result = self._zef.resolve(
+          self.workdir, zef_invalidation_check,
+          functools.partial(self._install_workunit_factory, workunit))
+    except Zef.ZefException as e:
+      raise self.ZefResolveError(
+        "Error resolving zef req libs: {}".format(e),
+        e,
+        exit_code=e.exit_code)
+
+    if freshly_resolved and self.artifact_cache_writes_enabled():
+      self._write_resolve_to_artifact_cache(zef_invalidation_check, install_result)
+    return install_result
+
+  def _write_resolve_to_artifact_cache(self, invalidation_check, install_result):
+    # NB: The artifact contains the store entries the resolve is composed of as well as the record
+    # of the resolve itself, so that a cache hit is a single extraction.
+    resolve_vts = VersionedTargetSet.from_versioned_targets(invalidation_check.all_vts)
+    artifact_paths = [self._zef.resolve_results_dir(self.workdir, resolve_vts)]
+    artifact_paths.extend(install_result.install_dirs)
+    self.update_artifact_cache([(resolve_vts, artifact_paths)])
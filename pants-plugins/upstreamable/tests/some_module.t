@@ -0,0 +1,8 @@
+use Test;
+
+use some_module;
+
+plan 2;
+
+is $foo, 3, 'exported variables are visible';
+is Foo::Bar.baz, 'Þor is mighty', 'nested classes are visible';
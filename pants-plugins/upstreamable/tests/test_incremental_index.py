@@ -0,0 +1,69 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import os
+import unittest
+
+from pants.util.contextutil import temporary_dir
+from upstreamable.index.incremental_index import IncrementalSymbolIndex
+from upstreamable.index.perl6_lexer import lex_symbols
+from upstreamable.index.symbol_index import Posting
+
+
+class IncrementalSymbolIndexTest(unittest.TestCase):
+
+  def _update(self, index, sources, compact_ratio=10.0):
+    """Update `index` with `sources` (a dict of path to content), and return the lexed files."""
+    lexed = []
+
+    def lex_file(path):
+      lexed.append(path)
+      return lex_symbols(sources[path])
+
+    # The content doubles as its own fingerprint here.
+    stats = index.update({p: '{:x}'.format(abs(hash(c))) for p, c in sources.items()}, lex_file,
+                         compact_ratio=compact_ratio)
+    return stats, sorted(lexed)
+
+  def test_only_changed_files_are_lexed(self):
+    with temporary_dir() as index_dir:
+      index = IncrementalSymbolIndex(index_dir)
+      sources = {'a.pm6': 'class A {}\n', 'b.pm6': 'class B { A.new }\n'}
+      stats, lexed = self._update(index, sources)
+      self.assertTrue(stats.compacted)
+      self.assertEqual(['a.pm6', 'b.pm6'], lexed)
+
+      stats, lexed = self._update(index, sources)
+      self.assertEqual((0, 0, 0, False), tuple(stats))
+
+      sources['a.pm6'] = '\nclass A {}\nsub a() {}\n'
+      stats, lexed = self._update(index, sources)
+      self.assertEqual(['a.pm6'], lexed)
+      self.assertFalse(stats.compacted)
+      with index.open() as layered:
+        self.assertEqual([Posting('a.pm6', 2, 6, 'class'), Posting('b.pm6', 1, 10, 'reference')],
+                         layered.lookup('A'))
+        self.assertEqual(['A', 'B', 'a', 'new'], list(layered.names_with_prefix('')))
+
+  def test_removed_files_are_tombstoned(self):
+    with temporary_dir() as index_dir:
+      index = IncrementalSymbolIndex(index_dir)
+      self._update(index, {'a.pm6': 'class A {}\n', 'b.pm6': 'class B {}\n'})
+      stats, lexed = self._update(index, {'a.pm6': 'class A {}\n'})
+      self.assertEqual(([], 1), (lexed, stats.removed))
+      with index.open() as layered:
+        self.assertEqual([], layered.lookup('B'))
+        self.assertEqual(['A'], list(layered.names_with_prefix('')))
+
+  def test_compaction(self):
+    with temporary_dir() as index_dir:
+      index = IncrementalSymbolIndex(index_dir)
+      self._update(index, {'a.pm6': 'class A {}\n', 'b.pm6': 'class B {}\n'})
+      stats, _ = self._update(index, {'a.pm6': 'class A2 {}\n', 'b.pm6': 'class B {}\n'},
+                              compact_ratio=0.1)
+      self.assertTrue(stats.compacted)
+      self.assertEqual(['base-2.idx', 'delta-2.idx', 'manifest.json', 'segments'],
+                       sorted(os.listdir(index_dir)))
+      with index.open() as layered:
+        self.assertEqual([Posting('a.pm6', 1, 6, 'class')], layered.lookup('A2'))
+        self.assertEqual([], layered.lookup('A'))
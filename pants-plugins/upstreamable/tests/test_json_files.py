@@ -0,0 +1,27 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import os
+import unittest
+
+from pants.util.contextutil import temporary_dir
+from upstreamable.util.json_files import read_json, write_json_atomic
+from upstreamable.util.parallel import parallel_map
+
+
+class JsonFilesTest(unittest.TestCase):
+
+  def test_round_trip(self):
+    with temporary_dir() as tmpdir:
+      path = os.path.join(tmpdir, 'a', 'b.json')
+      self.assertIsNone(read_json(path))
+      write_json_atomic(path, {'x': [1, 2]})
+      self.assertEqual({'x': [1, 2]}, read_json(path))
+      self.assertEqual(['b.json'], os.listdir(os.path.dirname(path)))
+
+  def test_concurrent_writers_of_one_path(self):
+    with temporary_dir() as tmpdir:
+      path = os.path.join(tmpdir, 'shared.json')
+      parallel_map(lambda i: write_json_atomic(path, {'writer': i}), list(range(64)), 8)
+      self.assertIn(read_json(path)['writer'], range(64))
+      self.assertEqual(['shared.json'], os.listdir(tmpdir))
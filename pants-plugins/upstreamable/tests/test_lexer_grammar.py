@@ -0,0 +1,97 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import io
+import os
+import unittest
+
+from pants.base.build_environment import get_buildroot
+from upstreamable.index.lexer_grammar import LexerGrammar, LexerGrammarError, tokenize_path
+from upstreamable.index.perl6_lexer import tokenize
+
+
+class LexerGrammarTest(unittest.TestCase):
+
+  _fixtures = ('cli/run.p6', 'cli/some_module.pm6')
+
+  def setUp(self):
+    self.grammar = LexerGrammar.bundled('perl6')
+
+  def _tokens(self, text, **kwargs):
+    return [(t.kind, t.text) for t in self.grammar.tokenize(text, **kwargs)]
+
+  def test_fixtures_agree_with_regex_lexer(self):
+    for fixture in self._fixtures:
+      self.assertIs(self.grammar, LexerGrammar.for_path(fixture))
+      with io.open(os.path.join(get_buildroot(), fixture), 'r', encoding='utf-8') as f:
+        text = f.read()
+      tokens = list(self.grammar.tokenize(text))
+      self.assertNotIn(LexerGrammar.ERROR_KIND, [t.kind for t in tokens])
+      # Outside of strings, which the grammar splits up to find interpolations, the tokens are the
+      # same.
+      self.assertEqual([tuple(t) for t in tokenize(text) if t.kind != 'str'],
+                       [tuple(t) for t in tokens if t.kind != 'str'])
+
+  def test_string_interpolation(self):
+    self.assertEqual([
+      ('word', 'say'), ('str', '"'), ('str', 'a '), ('var', '$x'), ('str', ' '),
+      ('punct', '{'), ('var', '$y'), ('punct', '+'), ('str', "'}'"), ('punct', '}'),
+      ('str', ' '), ('str', '\\"'), ('str', ' b'), ('str', '"'), ('punct', ';'),
+    ], self._tokens('say "a $x {$y + \'}\'} \\" b";'))
+
+  def test_regexes(self):
+    self.assertEqual([
+      ('var', '$r'), ('punct', '='), ('regex', 'rx/'), ('regex', ' '), ('regex', '\\d'),
+      ('regex', '+ '), ('regex', "'/'"), ('regex', ' '), ('regex', '/'), ('punct', ';'),
+    ], self._tokens("$r = rx/ \\d+ '/' /;"))
+    self.assertEqual([
+      ('word', 'token'), ('word', 'TOP'), ('regex', '{'), ('regex', ' <foo> '),
+      ('punct', '{'), ('word', 'say'), ('num', '1'), ('punct', '}'), ('regex', ' '),
+      ('regex', '}'), ('word', 'method'),
+    ], self._tokens('token TOP { <foo> { say 1 } } method'))
+
+  def test_heredocs_and_pod(self):
+    text = ('my $h = q:to/END/;\n'
+            '  "body" $x\n'
+            '  END\n'
+            '=begin pod\n'
+            '=begin code\n'
+            'class Nope {}\n'
+            '=end code\n'
+            '=end pod\n'
+            'say 1;\n')
+    self.assertEqual([
+      ('word', 'my', 1, 0), ('var', '$h', 1, 3), ('punct', '=', 1, 6), ('str', 'q:to/END/', 1, 8),
+      ('punct', ';', 1, 17),
+      ('heredoc', '  "body" $x\n  END', 2, 0),
+      ('word', 'say', 9, 0), ('num', '1', 9, 4), ('punct', ';', 9, 5),
+    ], [tuple(t) for t in self.grammar.tokenize(text)])
+    self.assertEqual(text, ''.join(t for _, t in self._tokens(text, keep_skipped=True)))
+
+  def test_longest_match_then_first_rule(self):
+    grammar = LexerGrammar.from_json({
+      'name': 'test',
+      'start': 'code',
+      'definitions': {'WORD': '[a-z]+'},
+      'states': {'code': [
+        {'match': 'if', 'kind': 'keyword'},
+        {'match': '{WORD}', 'kind': 'word'},
+        {'match': '[\\s\\S]', 'kind': 'punct'},
+      ]},
+    })
+    self.assertEqual(['keyword', 'punct', 'word', 'punct'],
+                     [t.kind for t in grammar.tokenize('if iffy!')])
+
+  def test_invalid_grammars(self):
+    for states in ({'code': [{'match': 'a', 'kind': 'a', 'push': 'nowhere'}]},
+                   {'code': [{'include': 'code'}]},
+                   {'code': [{'match': '(a', 'kind': 'a'}]},
+                   {'code': [{'match': '{UNDEFINED}', 'kind': 'a'}]},
+                   {'code': [{'match': 'a', 'kind': 'a', 'bogus': True}]}):
+      with self.assertRaises(LexerGrammarError):
+        LexerGrammar.from_json({'name': 'test', 'start': 'code', 'states': states})
+
+  def test_tokenize_path(self):
+    text = 'say "a $x b";\n'
+    self.assertEqual(list(self.grammar.tokenize(text)), list(tokenize_path('lib/Foo.pm6', text)))
+    self.assertEqual(list(tokenize(text)), list(tokenize_path('notes.txt', text)))
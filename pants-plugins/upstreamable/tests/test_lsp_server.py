@@ -0,0 +1,127 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import io
+import os
+import threading
+import time
+import unittest
+
+from pants.util.contextutil import temporary_dir
+from pants.util.dirutil import safe_file_dump
+from upstreamable.index.incremental_index import IncrementalSymbolIndex
+from upstreamable.index.lsp_server import (LspError, LspServer, _IndexHolder, read_message,
+                                           write_message)
+from upstreamable.index.perl6_lexer import lex_symbols
+
+
+class LspServerTest(unittest.TestCase):
+
+  _sources = {
+    'lib/Foo.pm6': 'class Foo {\n  method bar() { 1 }\n}\n',
+    'bin/run.p6': 'use Foo;\nsay Foo.new.bar;\n',
+  }
+
+  def _write_index(self, root_dir):
+    for relpath, content in self._sources.items():
+      safe_file_dump(os.path.join(root_dir, relpath), content, mode='w')
+    index_dir = os.path.join(root_dir, 'index')
+    IncrementalSymbolIndex(index_dir).update(
+      {p: str(i) for i, p in enumerate(sorted(self._sources))},
+      lambda p: lex_symbols(self._sources[p]))
+    return index_dir
+
+  def _read_responses(self, out_stream):
+    out_stream.seek(0)
+    responses = {}
+    while True:
+      response = read_message(out_stream)
+      if response is None:
+        return responses
+      responses[response['id']] = response
+
+  def _serve(self, root_dir, messages):
+    index_dir = self._write_index(root_dir)
+    in_stream = io.BytesIO()
+    for message in messages + [{'jsonrpc': '2.0', 'method': 'exit'}]:
+      write_message(in_stream, message)
+    in_stream.seek(0)
+    out_stream = io.BytesIO()
+    LspServer(root_dir, index_dir, in_stream, out_stream).serve()
+    return self._read_responses(out_stream)
+
+  def _position(self, root_dir, relpath, line, character):
+    return {
+      'textDocument': {'uri': 'file://{}'.format(os.path.join(root_dir, relpath))},
+      'position': {'line': line, 'character': character},
+    }
+
+  def test_definition_and_references(self):
+    with temporary_dir() as root_dir:
+      root_dir = os.path.realpath(root_dir)
+      responses = self._serve(root_dir, [
+        {'jsonrpc': '2.0', 'id': 1, 'method': 'textDocument/definition',
+         'params': self._position(root_dir, 'bin/run.p6', 1, 5)},
+        {'jsonrpc': '2.0', 'id': 2, 'method': 'textDocument/references',
+         'params': self._position(root_dir, 'lib/Foo.pm6', 1, 10)},
+        {'jsonrpc': '2.0', 'id': 3, 'method': 'workspace/symbol', 'params': {'query': 'ba'}},
+      ])
+      self.assertEqual([{
+        'uri': 'file://{}/lib/Foo.pm6'.format(root_dir),
+        'range': {'start': {'line': 0, 'character': 6}, 'end': {'line': 0, 'character': 9}},
+      }], responses[1]['result'])
+      self.assertEqual(['file://{}/bin/run.p6'.format(root_dir)],
+                       [location['uri'] for location in responses[2]['result']])
+      self.assertEqual([('bar', 6)], [(s['name'], s['kind']) for s in responses[3]['result']])
+
+  def test_cancelled_request(self):
+    with temporary_dir() as root_dir:
+      out_stream = io.BytesIO()
+      server = LspServer(root_dir, self._write_index(root_dir), io.BytesIO(), out_stream)
+      answering = threading.Event()
+      cancelled = threading.Event()
+
+      def slow_workspace_symbol(params):
+        answering.set()
+        cancelled.wait()
+        return []
+
+      server._handlers['workspace/symbol'] = slow_workspace_symbol
+      server._dispatch({'jsonrpc': '2.0', 'id': 1, 'method': 'workspace/symbol', 'params': {}})
+      answering.wait()
+      server._dispatch({'jsonrpc': '2.0', 'method': '$/cancelRequest', 'params': {'id': 1}})
+      cancelled.set()
+      server.serve()
+      self.assertEqual(LspError.REQUEST_CANCELLED,
+                       self._read_responses(out_stream)[1]['error']['code'])
+
+      # A cancellation which arrives after its request was answered isn't kept.
+      server._dispatch({'jsonrpc': '2.0', 'method': '$/cancelRequest', 'params': {'id': 1}})
+      self.assertEqual(set(), server._cancelled)
+
+  def test_replaced_index_is_closed_once_unused(self):
+    with temporary_dir() as root_dir:
+      index_dir = self._write_index(root_dir)
+      holder = _IndexHolder(index_dir)
+
+      def wait_for_reload(previous):
+        manifest_path = os.path.join(index_dir, 'manifest.json')
+        mtime = os.stat(manifest_path).st_mtime + 10
+        os.utime(manifest_path, (mtime, mtime))
+        holder.maybe_reload()
+        deadline = time.time() + 10
+        while holder._generation.index is previous and time.time() < deadline:
+          time.sleep(0.01)
+
+      with holder.get(10) as first:
+        wait_for_reload(first)
+        # NB: The first generation is still in use here, so it's still open.
+        self.assertEqual(1, len(first.definitions('Foo')))
+      with self.assertRaises(ValueError):
+        first.definitions('Foo')
+
+      with holder.get(10) as second:
+        self.assertIsNot(first, second)
+      holder.close()
+      with self.assertRaises(ValueError):
+        second.definitions('Foo')
@@ -0,0 +1,19 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+from pants_test.pants_run_integration_test import PantsRunIntegrationTest
+
+
+class TestPerl6CompileCheckIntegrationTest(PantsRunIntegrationTest):
+
+  _p6_bin_target = 'pants-plugins/upstreamable/tests:perl6-test-bin'
+
+  def test_compile_check_is_incremental(self):
+    with self.temporary_workdir() as workdir:
+      first_run = self.run_pants_with_workdir(['lint', self._p6_bin_target], workdir)
+      self.assert_success(first_run)
+      self.assertIn('perl6-c', first_run.stdout_data)
+
+      second_run = self.run_pants_with_workdir(['lint', self._p6_bin_target], workdir)
+      self.assert_success(second_run)
+      self.assertNotIn('perl6-c', second_run.stdout_data)
@@ -0,0 +1,51 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import unittest
+
+from upstreamable.index.perl6_lexer import Symbol, lex_symbols, tokenize
+
+
+class Perl6LexerTest(unittest.TestCase):
+
+  def _definitions(self, text):
+    return [(s.name, s.kind, s.line, s.col) for s in lex_symbols(text) if s.is_definition]
+
+  def test_tokenize_positions(self):
+    tokens = list(tokenize('my $x = 3;\n  say $x; # done\n'))
+    self.assertEqual(('var', '$x', 1, 3), tuple(tokens[1]))
+    self.assertEqual(('word', 'say', 2, 2), tuple(tokens[5]))
+    self.assertNotIn('# done', [t.text for t in tokens])
+
+  def test_skips_pod_and_strings(self):
+    text = '=begin pod\nclass NotAClass {}\n=end pod\nsay "class Nope {}";\nclass Yes {}\n'
+    self.assertEqual([('Yes', 'class', 5, 6)], self._definitions(text))
+
+  def test_declarations(self):
+    text = ('unit module My::Module;\n'
+            'class Foo::Bar is Baz {\n'
+            '  has Int $.count;\n'
+            '  method !secret() {}\n'
+            '  multi method go() {}\n'
+            '}\n'
+            'multi frob($x) {}\n'
+            'our ($a, @b) = 1, 2;\n'
+            'constant PI = 3;\n')
+    self.assertEqual([
+      ('My::Module', 'module', 1, 12),
+      ('Foo::Bar', 'class', 2, 6),
+      ('$.count', 'has', 3, 10),
+      ('secret', 'method', 4, 10),
+      ('go', 'method', 5, 15),
+      ('frob', 'sub', 7, 6),
+      ('$a', 'our', 8, 5),
+      ('@b', 'our', 8, 9),
+      ('PI', 'constant', 9, 9),
+    ], self._definitions(text))
+
+  def test_imports_and_references(self):
+    symbols = lex_symbols('use v6;\nuse lib "lib";\nuse CSV::Parser;\nsay CSV::Parser.new;\n')
+    self.assertEqual([('CSV::Parser', Symbol.IMPORT, 3, 4)],
+                     [(s.name, s.kind, s.line, s.col) for s in symbols if s.kind == Symbol.IMPORT])
+    self.assertIn(('CSV::Parser', Symbol.REFERENCE, 4, 4),
+                  [(s.name, s.kind, s.line, s.col) for s in symbols])
@@ -1,12 +1,54 @@
 from __future__ import (absolute_import, division, generators, nested_scopes,
                         print_function, unicode_literals, with_statement)
 
+import os
+import shutil
+from contextlib import contextmanager
+
+from pants.base.build_environment import get_buildroot
+from pants.util.contextutil import temporary_dir
 from pants_test.pants_run_integration_test import PantsRunIntegrationTest
+from upstreamable.subsystems.zef import Zef
 
 
 class TestPerl6RunIntegrationTest(PantsRunIntegrationTest):
 
   _p6_run_target = 'pants-plugins/upstreamable/tests:perl6-test-bin'
+  _fixture_dists_dir = 'pants-plugins/upstreamable/tests/fixtures/zef-mirror-dists'
+  _mirror_bin_dir = 'pants-plugins/upstreamable/tests/fixtures/mirror-bin'
+
+  # NB: Fixture::Dist is only in the mirror these tests build, so a target requiring it can't be
+  # checked in: `./pants test ::` would try to resolve it from the ecosystem. The BUILD file is
+  # written for the duration of the test instead.
+  _mirror_bin_build_file = """\
+zef_requirement_library(
+  name='fixture-dist',
+  requirements=[
+    zef_requirement('Fixture::Dist', '0.0.1'),
+  ],
+)
+
+perl6_binary(
+  name='perl6-mirror-bin',
+  dependencies=[
+    ':fixture-dist',
+  ],
+  script='run_mirror.p6',
+)
+"""
+
+  @contextmanager
+  def _mirror(self):
+    """Yield the path to a zef mirror of the fixture dists, and a binary requiring one of them."""
+    buildroot = get_buildroot()
+    with temporary_dir() as mirror_dir, temporary_dir(root_dir=buildroot) as bin_dir:
+      Zef.add_dists_to_mirror(
+        [os.path.join(self._fixture_dists_dir, d) for d in os.listdir(self._fixture_dists_dir)],
+        mirror_dir)
+      shutil.copy(os.path.join(self._mirror_bin_dir, 'run_mirror.p6'), bin_dir)
+      with open(os.path.join(bin_dir, 'BUILD'), 'w') as f:
+        f.write(self._mirror_bin_build_file)
+      yield mirror_dir, '{}:perl6-mirror-bin'.format(os.path.relpath(bin_dir, buildroot))
 
   def test_perl6_run(self):
     pants_run = self.run_pants(['run', self._p6_run_target])
@@ -19,3 +61,27 @@ file.dat
 24
 False
 """, pants_run.stdout_data)
+
+  def test_perl6_run_from_zef_mirror(self):
+    with self._mirror() as (mirror_dir, mirror_run_target):
+      pants_run = self.run_pants([
+        '--zef-mirror-dir={}'.format(mirror_dir),
+        'run',
+        mirror_run_target,
+      ])
+      self.assert_success(pants_run)
+      self.assertIn('hello from the mirror\n', pants_run.stdout_data)
+
+  def test_perl6_run_batch(self):
+    with self._mirror() as (mirror_dir, mirror_run_target):
+      pants_run = self.run_pants([
+        '--zef-mirror-dir={}'.format(mirror_dir),
+        'run',
+        '--run-perl6-batch',
+        self._p6_run_target,
+        mirror_run_target,
+      ])
+      self.assert_success(pants_run)
+      self.assertIn('[{}] hey\n'.format(self._p6_run_target), pants_run.stdout_data)
+      self.assertIn('[{}] hello from the mirror\n'.format(mirror_run_target),
+                    pants_run.stdout_data)
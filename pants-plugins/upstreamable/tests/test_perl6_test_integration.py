@@ -0,0 +1,30 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+from pants_test.pants_run_integration_test import PantsRunIntegrationTest
+
+
+class TestPerl6TestIntegrationTest(PantsRunIntegrationTest):
+
+  _p6_test_target = 'pants-plugins/upstreamable/tests:perl6-tests'
+
+  def test_perl6_test(self):
+    pants_run = self.run_pants(['test', self._p6_test_target])
+    self.assert_success(pants_run)
+    self.assertIn('PASS pants-plugins/upstreamable/tests/some_module.t', pants_run.stdout_data)
+
+  def test_perl6_test_results_cached(self):
+    with self.temporary_workdir() as workdir:
+      first_run = self.run_pants_with_workdir(['test', self._p6_test_target], workdir)
+      self.assert_success(first_run)
+      self.assertNotIn('CACHED PASS', first_run.stdout_data)
+
+      second_run = self.run_pants_with_workdir(['test', self._p6_test_target], workdir)
+      self.assert_success(second_run)
+      self.assertIn('CACHED PASS pants-plugins/upstreamable/tests/some_module.t',
+                    second_run.stdout_data)
+
+  def test_perl6_test_empty_shard(self):
+    pants_run = self.run_pants(['test.perl6', '--shard=1/2', self._p6_test_target])
+    self.assert_success(pants_run)
+    self.assertNotIn('some_module.t', pants_run.stdout_data)
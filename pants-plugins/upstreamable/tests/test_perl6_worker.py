@@ -0,0 +1,33 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import os
+import stat
+import unittest
+
+from pants.util.contextutil import temporary_dir
+from upstreamable.subsystems.perl6_worker import Perl6Worker, Perl6WorkerError
+
+
+class Perl6WorkerTest(unittest.TestCase):
+
+  def test_secret_is_private(self):
+    with temporary_dir() as workers_dir:
+      worker = Perl6Worker(workers_dir, 'fingerprint', connect_timeout=1)
+      os.makedirs(os.path.join(workers_dir, 'fingerprint'))
+      path = worker._write_secret()
+      self.assertEqual(0o600, stat.S_IMODE(os.stat(path).st_mode))
+      secret = worker._read_secret()
+      self.assertEqual(64, len(secret))
+
+      other = Perl6Worker(workers_dir, 'other', connect_timeout=1)
+      self.assertIsNone(other._read_secret())
+      os.makedirs(os.path.join(workers_dir, 'other'))
+      other._write_secret()
+      self.assertNotEqual(secret, other._read_secret())
+
+  def test_run_script_requires_secret(self):
+    with temporary_dir() as workers_dir:
+      worker = Perl6Worker(workers_dir, 'fingerprint', connect_timeout=1)
+      with self.assertRaises(Perl6WorkerError):
+        worker.run_script(1, 'script.p6', [], workers_dir, None, None)
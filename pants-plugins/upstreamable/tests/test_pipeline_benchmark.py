@@ -0,0 +1,69 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import os
+import unittest
+
+from pants.util.contextutil import temporary_dir
+from upstreamable.bench.pipeline_benchmark import (SyntheticRepo, baseline_mismatch,
+                                                   compare_to_baseline, stage_timings)
+from upstreamable.util.json_files import read_json
+
+
+class PipelineBenchmarkTest(unittest.TestCase):
+
+  def test_stage_timings(self):
+    timings = stage_timings([
+      {'label': 'main', 'timing': 20.0},
+      {'label': 'main:resolve:requirements', 'timing': 10.0},
+      {'label': 'main:resolve:requirements:perl6-toolchain', 'timing': 6.0},
+      {'label': 'main:resolve:requirements:perl6-toolchain:build-moar', 'timing': 5.0},
+      {'label': 'main:resolve:requirements:zef-resolve:zef', 'timing': 1.0},
+      {'label': 'main:perl6-prep:sources', 'timing': 0.5},
+      {'label': 'main:perl6-prep:perl6-env', 'timing': 0.25},
+      {'label': 'main:run:perl6', 'timing': 2.0},
+      {'label': 'main:run:perl6', 'timing': 1.0},
+    ])
+    self.assertEqual({
+      'toolchain': 7.0,
+      'zef_resolve': 3.0,
+      'gather_sources': 0.5,
+      'collect_env': 0.25,
+      'run': 3.0,
+    }, timings)
+
+  def test_compare_to_baseline(self):
+    baseline = {'modes': {'warm': {'stages': {'run': 2.0, 'collect_env': 0.1, 'toolchain': 1.0}}}}
+    results = {'modes': {
+      'cold': {'stages': {'run': 100.0}},
+      'warm': {'stages': {'run': 3.0, 'collect_env': 0.3, 'toolchain': 1.1}},
+    }}
+    self.assertEqual(['warm run: 2.000s -> 3.000s (+50%)'],
+                     compare_to_baseline(results, baseline, threshold=0.2, min_seconds=0.25))
+
+  def test_baseline_mismatch(self):
+    config = {'libraries': 20, 'repeats': 3}
+    self.assertIsNone(baseline_mismatch({'config': dict(config), 'modes': {}}, config))
+    self.assertEqual('there is no baseline there', baseline_mismatch(None, config))
+    self.assertIn('was measured with', baseline_mismatch({'config': {'libraries': 5}}, config))
+
+  def test_synthetic_repo(self):
+    with temporary_dir() as buildroot, temporary_dir() as root_dir:
+      with open(os.path.join(buildroot, 'pants'), 'w') as f:
+        f.write('#!/bin/bash\n')
+      repo = SyntheticRepo(root_dir, num_libraries=4, modules_per_library=2, num_dists=2)
+      repo.generate(buildroot, '1.11.0rc1')
+
+      self.assertEqual(['Bench::Dist0', 'Bench::Dist1'],
+                       sorted(d['name'] for d in read_json(os.path.join(repo.mirror_dir,
+                                                                        'packages.json'))))
+      with open(os.path.join(root_dir, 'libs', 'l0003', 'BUILD')) as f:
+        build_file = f.read()
+      for dependency in ('libs/l0001', 'libs/l0002', '3rdparty/perl6:dist1'):
+        self.assertIn("'{}'".format(dependency), build_file)
+      with open(os.path.join(root_dir, 'libs', 'l0003', 'BenchL0003M1.pm6')) as f:
+        self.assertEqual(['use BenchL0001M0;', 'use BenchL0002M0;', 'use BenchL0003M0;',
+                          'use Bench::Dist1;'],
+                         [l for l in f.read().splitlines() if l.startswith('use ')])
+      with open(os.path.join(root_dir, 'bin', 'main.p6')) as f:
+        self.assertEqual(8, f.read().count('use '))
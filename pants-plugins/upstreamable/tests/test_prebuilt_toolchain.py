@@ -0,0 +1,56 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import os
+import unittest
+
+from pants.util.contextutil import temporary_dir
+from pants.util.dirutil import read_file, safe_file_dump
+from upstreamable.subsystems.prebuilt_toolchain import PrebuiltToolchainArchive
+
+
+class PrebuiltToolchainArchiveTest(unittest.TestCase):
+
+  def test_relocate_text(self):
+    relocated = PrebuiltToolchainArchive.relocate_bytes(
+      b'exec /old/prefix/bin/moar /old/prefix/lib', b'/old/prefix', b'/a/much/longer/prefix')
+    self.assertEqual(b'exec /a/much/longer/prefix/bin/moar /a/much/longer/prefix/lib', relocated)
+
+  def test_relocate_binary_to_same_length_prefix(self):
+    contents = b'\x7fELF\0/old/prefix/lib:/old/prefix/x\0\x0b/old/prefix'
+    relocated = PrebuiltToolchainArchive.relocate_bytes(contents, b'/old/prefix', b'/new/prefix')
+    self.assertEqual(b'\x7fELF\0/new/prefix/lib:/new/prefix/x\0\x0b/new/prefix', relocated)
+
+  def test_relocate_binary_to_different_length_prefix_fails(self):
+    for new_prefix in (b'/new', b'/longer'):
+      with self.assertRaises(PrebuiltToolchainArchive.RelocationError):
+        PrebuiltToolchainArchive.relocate_bytes(b'\0/old/\0', b'/old/', new_prefix)
+
+  def test_extract_relocates(self):
+    with temporary_dir() as build_root, temporary_dir() as other_root, \
+         temporary_dir() as archive_dir:
+      safe_file_dump(os.path.join(build_root, 'moar-v', 'bin', 'perl6'),
+                     'exec {}/moar-v/bin/moar'.format(build_root))
+      archive = PrebuiltToolchainArchive(os.path.join(archive_dir, 'toolchain.tar.gz'))
+      archive.create(build_root, ['moar-v'])
+      self.assertEqual(['moar-v'], os.listdir(build_root))
+
+      archive.extract_into(other_root)
+      self.assertEqual(['moar-v'], os.listdir(other_root))
+      self.assertEqual('exec {}/moar-v/bin/moar'.format(other_root),
+                       read_file(os.path.join(other_root, 'moar-v', 'bin', 'perl6')))
+
+  def test_extract_binary_to_different_length_path_fails(self):
+    with temporary_dir() as build_root, temporary_dir() as archive_dir:
+      os.makedirs(os.path.join(build_root, 'moar-v', 'lib'))
+      with open(os.path.join(build_root, 'moar-v', 'lib', 'x.moarvm'), 'wb') as f:
+        f.write(b'\0' + build_root.encode('utf-8'))
+      archive = PrebuiltToolchainArchive(os.path.join(archive_dir, 'toolchain.tar.gz'))
+      archive.create(build_root, ['moar-v'])
+
+      with temporary_dir() as parent:
+        other_root = os.path.join(parent, 'a-longer-path-than-the-build-root')
+        os.mkdir(other_root)
+        with self.assertRaises(PrebuiltToolchainArchive.RelocationError):
+          archive.extract_into(other_root)
+        self.assertEqual([], os.listdir(other_root))
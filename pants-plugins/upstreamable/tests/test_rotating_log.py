@@ -0,0 +1,47 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import os
+import unittest
+
+from pants.util.contextutil import temporary_dir
+from upstreamable.util.rotating_log import RotatingLog
+
+
+class RotatingLogTest(unittest.TestCase):
+
+  def _read(self, path):
+    with open(path, 'rb') as f:
+      return f.read()
+
+  def test_rotates_by_size(self):
+    with temporary_dir() as tmpdir:
+      path = os.path.join(tmpdir, 'logs', 'build.log')
+      with RotatingLog(path, max_bytes=10, backups=2, tail_lines=3) as log:
+        for i in range(7):
+          log.write('line {}\n'.format(i).encode('utf-8'))
+      self.assertEqual(b'line 6\n', self._read(path))
+      self.assertEqual(b'line 5\n', self._read(path + '.1'))
+      self.assertEqual(b'line 4\n', self._read(path + '.2'))
+      self.assertFalse(os.path.exists(path + '.3'))
+      self.assertEqual(['line 4', 'line 5', 'line 6'], log.tail)
+
+  def test_rotates_previous_run(self):
+    with temporary_dir() as tmpdir:
+      path = os.path.join(tmpdir, 'build.log')
+      with RotatingLog(path, max_bytes=1024, backups=1, tail_lines=3) as log:
+        log.write(b'first\n')
+      with RotatingLog(path, max_bytes=1024, backups=1, tail_lines=3) as log:
+        log.write(b'second\n')
+      self.assertEqual(b'second\n', self._read(path))
+      self.assertEqual(b'first\n', self._read(path + '.1'))
+
+  def test_describe_failure(self):
+    with temporary_dir() as tmpdir:
+      path = os.path.join(tmpdir, 'build.log')
+      with RotatingLog(path, max_bytes=1024, backups=0, tail_lines=2) as log:
+        self.assertIn('no output', log.describe_failure())
+        for line in (b'a\n', b'b\n', b'c\n'):
+          log.write(line)
+      self.assertEqual('The full log is at {}. The last 2 lines were:\nb\nc'.format(path),
+                       log.describe_failure())
@@ -0,0 +1,81 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import json
+import os
+import unittest
+
+from pants.subsystem.subsystem import Subsystem
+from pants.util.contextutil import temporary_dir
+from pants.util.dirutil import safe_mkdtemp, safe_rmtree
+from pants.util.process_handler import subprocess
+from pants_test.subsystem.subsystem_util import global_subsystem_instance
+from upstreamable.subsystems.subprocess_trace import SubprocessTrace
+from upstreamable.util.rotating_log import RotatingLog
+
+
+class SubprocessTraceTest(unittest.TestCase):
+
+  def setUp(self):
+    # NB: The global instance is cached across tests, along with the trace file it writes to.
+    Subsystem.reset()
+    self.tmpdir = safe_mkdtemp()
+    self.trace_path = os.path.join(self.tmpdir, 'trace', 'trace.json')
+    self.trace = global_subsystem_instance(
+      SubprocessTrace, options={'subprocess-trace': {'chrome_trace_file': self.trace_path}})
+
+  def tearDown(self):
+    Subsystem.reset()
+    safe_rmtree(self.tmpdir)
+
+  def _trace_events(self):
+    # NB: Without the closing `]`, which is never written, as pants may not exit cleanly.
+    with open(self.trace_path) as f:
+      contents = f.read()
+    return json.loads(contents.rstrip().rstrip(',') + ']')
+
+  def _subprocess_events(self):
+    return [e for e in self._trace_events() if e['ph'] == 'X']
+
+  def test_records_subprocesses(self):
+    self.assertEqual(b'hello\n', self.trace.check_output(['echo', 'hello'], 'test'))
+    with self.assertRaises(subprocess.CalledProcessError) as cm:
+      self.trace.check_call(['sh', '-c', 'exit 3'], 'test')
+    self.assertEqual(3, cm.exception.returncode)
+
+    process = self.trace.popen(['sh', '-c', 'kill -9 $$'])
+    self.assertEqual(-9, self.trace.wait(process, 'other'))
+    self.assertEqual(-9, process.returncode)
+
+    events = self._subprocess_events()
+    self.assertEqual([(['echo', 'hello'], 0), (['sh', '-c', 'exit 3'], 3),
+                      (['sh', '-c', 'kill -9 $$'], -9)],
+                     [(e['args']['argv'], e['args']['exit_code']) for e in events])
+    self.assertEqual(['echo', 'sh', 'sh'], [e['name'] for e in events])
+    self.assertEqual(['test', 'test', 'other'], [e['cat'] for e in events])
+    for event in events:
+      self.assertEqual('X', event['ph'])
+      self.assertGreaterEqual(event['dur'], 0)
+      self.assertGreater(event['args']['max_rss_kb'], 0)
+      self.assertGreaterEqual(event['args']['user_cpu_s'], 0)
+
+  def test_chrome_trace(self):
+    self.trace.check_output(['true'], 'test')
+    self.trace.check_output(['echo'], 'test')
+    events = self._trace_events()
+    self.assertEqual(['M', 'X', 'X'], [e['ph'] for e in events])
+    self.assertEqual(['true', 'echo'], [e['args']['argv'][0] for e in events if e['ph'] == 'X'])
+
+  def test_stream(self):
+    lines = []
+    with temporary_dir() as tmpdir:
+      path = os.path.join(tmpdir, 'out.log')
+      with RotatingLog(path, max_bytes=1024, backups=0, tail_lines=1) as log:
+        returncode = self.trace.stream(['sh', '-c', 'echo out; echo err >&2; exit 2'], 'test',
+                                       log, on_line=lines.append)
+      with open(path, 'rb') as f:
+        self.assertEqual(b'out\nerr\n', f.read())
+    self.assertEqual(2, returncode)
+    self.assertEqual([b'out\n', b'err\n'], lines)
+    self.assertEqual(['err'], log.tail)
+    self.assertEqual(2, self._subprocess_events()[-1]['args']['exit_code'])
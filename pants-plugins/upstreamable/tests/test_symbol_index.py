@@ -0,0 +1,55 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import os
+import unittest
+
+from pants.util.contextutil import temporary_dir
+from upstreamable.index.perl6_lexer import lex_symbols
+from upstreamable.index.symbol_index import (Posting, SymbolIndex, SymbolIndexError,
+                                             SymbolQueries, write_symbol_index)
+
+
+class SymbolIndexTest(unittest.TestCase):
+
+  _sources = [
+    ('lib/Foo.pm6', 'class Foo {\n  method bar() { Baz.new }\n}\n'),
+    ('lib/Baz.pm6', 'use Foo;\nclass Baz {}\nsub ünïcode() { Foo.bar }\n'),
+  ]
+
+  def _write_index(self, tmpdir):
+    path = os.path.join(tmpdir, 'symbols.idx')
+    write_symbol_index(path, [(p, lex_symbols(text)) for p, text in self._sources])
+    return path
+
+  def test_lookup(self):
+    with temporary_dir() as tmpdir, SymbolIndex.open(self._write_index(tmpdir)) as index:
+      self.assertEqual(2, index.num_files)
+      self.assertEqual([
+        Posting('lib/Foo.pm6', 1, 6, 'class'),
+        Posting('lib/Baz.pm6', 1, 4, 'import'),
+        Posting('lib/Baz.pm6', 3, 16, 'reference'),
+      ], index.lookup('Foo'))
+      self.assertEqual([Posting('lib/Baz.pm6', 2, 6, 'class')], index.definitions('Baz'))
+      self.assertEqual([Posting('lib/Foo.pm6', 2, 17, 'reference')], index.references('Baz'))
+      self.assertEqual([Posting('lib/Baz.pm6', 3, 4, 'sub')], index.lookup('ünïcode'))
+      self.assertEqual([], index.lookup('Missing'))
+
+  def test_names_with_prefix(self):
+    with temporary_dir() as tmpdir, SymbolIndex.open(self._write_index(tmpdir)) as index:
+      self.assertEqual(['Baz'], list(index.names_with_prefix('Ba')))
+      self.assertEqual(['bar'], list(index.names_with_prefix('b')))
+
+  def test_rejects_other_files(self):
+    with temporary_dir() as tmpdir:
+      path = os.path.join(tmpdir, 'not-an-index')
+      with open(path, 'wb') as f:
+        f.write(b'\0' * 64)
+      with self.assertRaises(SymbolIndexError):
+        SymbolIndex.open(path)
+
+  def test_queries_require_lookup(self):
+    class NoLookup(SymbolQueries): pass
+
+    with self.assertRaises(TypeError):
+      NoLookup()
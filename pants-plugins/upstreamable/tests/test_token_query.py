@@ -0,0 +1,78 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import unittest
+
+from upstreamable.index.perl6_lexer import tokenize
+from upstreamable.index.token_query import CompiledTokenQueries, TokenQuerySyntaxError
+
+
+class TokenQueryTest(unittest.TestCase):
+
+  _source = ('class Foo {\n'
+             '  has $.x;\n'
+             '  method bar() { say "method nope" }\n'
+             '  method baz($y) { $y }\n'
+             '}\n'
+             'sub qux() { Foo.new.bar }\n')
+
+  def _matches(self, named_queries, text=None):
+    tokens = list(tokenize(self._source if text is None else text))
+    queries = CompiledTokenQueries(named_queries)
+    return [(m.query, ' '.join(t.text for t in tokens[m.start:m.end]))
+            for m in queries.search(tokens)]
+
+  def test_structural_query(self):
+    self.assertEqual([
+      ('methods', 'class Foo { has $.x ; method bar'),
+      ('methods', 'class Foo { has $.x ; method bar ( ) { say "method nope" } method baz'),
+    ], self._matches([('methods', '`class` IDENT ... `method` IDENT')]))
+
+  def test_multiple_queries_in_one_pass(self):
+    self.assertEqual([
+      ('vars', '$.x'),
+      ('calls', 'method bar'),
+      ('calls', 'method baz'),
+      ('vars', '$y'),
+      ('vars', '$y'),
+      ('calls', 'sub qux'),
+      ('calls', '. new'),
+      ('calls', '. bar'),
+    ], self._matches([
+      ('calls', '(method | sub | ".") IDENT'),
+      ('vars', 'VAR'),
+    ]))
+
+  def test_repetition_and_shortest_start(self):
+    self.assertEqual([('chain', 'new . bar }')],
+                     self._matches([('chain', 'IDENT ("." IDENT)+ `}`')]))
+    self.assertEqual([('opt', 'a b'), ('opt', 'c')],
+                     self._matches([('opt', '`a` b | c')], text='a b c'))
+    self.assertEqual([('nearest', 'class B { method m')],
+                     self._matches([('nearest', 'class IDENT ... method IDENT')],
+                                   text='class A { }\nclass B { method m }'))
+
+  def test_many_matches_sharing_a_start(self):
+    # NB: Each match's start is found in the same pass, rather than by scanning back to the class.
+    text = 'class Foo {\n' + ''.join('  method m{}() {{ }}\n'.format(i) for i in range(200)) + '}'
+    tokens = list(tokenize(text))
+    matches = list(CompiledTokenQueries([('q', '`class` IDENT ... `method` IDENT')]).search(tokens))
+    self.assertEqual(200, len(matches))
+    self.assertEqual({0}, {m.start for m in matches})
+    self.assertEqual(['m199'], [tokens[matches[-1].end - 1].text])
+
+  def test_literals_only_match_their_text(self):
+    self.assertEqual([], self._matches([('q', '`nope` IDENT')]))
+    self.assertEqual([('q', 'has $.x')], self._matches([('q', 'has _')]))
+
+  def test_syntax_errors(self):
+    for query in ('', '(IDENT', 'IDENT |', '* IDENT', 'IDENT )'):
+      with self.assertRaises(TokenQuerySyntaxError):
+        CompiledTokenQueries([('q', query)])
+
+  def test_queries_matching_the_empty_sequence(self):
+    for query in ('IDENT*', 'IDENT?', '...', '(`class` | IDENT*)', 'IDENT* `method`*'):
+      with self.assertRaises(TokenQuerySyntaxError):
+        CompiledTokenQueries([('q', query)])
+    self.assertEqual([('q', 'class'), ('q', 'Foo'), ('q', 'method'), ('q', 'bar')],
+                     self._matches([('q', 'IDENT+')], text='class Foo { method bar { } }'))
@@ -0,0 +1,57 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import json
+import os
+import unittest
+
+from pants.util.contextutil import temporary_dir
+from pants.util.dirutil import touch
+from upstreamable.subsystems.toolchain_manifest import ToolchainManifest
+
+
+class ToolchainManifestTest(unittest.TestCase):
+
+  _key = {'rakudobrew': 'abc', 'moar': 'def'}
+
+  def _manifest(self, root_dir, key=None):
+    return ToolchainManifest(os.path.join(root_dir, 'manifest.json'), root_dir, key or self._key)
+
+  def test_missing_manifest(self):
+    with temporary_dir() as root_dir:
+      self.assertIsNone(self._manifest(root_dir).read_verified())
+
+  def test_roundtrip_skips_missing_files(self):
+    with temporary_dir() as root_dir:
+      touch(os.path.join(root_dir, 'bin', 'perl6'))
+      written = self._manifest(root_dir).write(['bin/perl6', 'bin/zef'])
+      self.assertEqual(frozenset(['bin/perl6']), written)
+      self.assertEqual(written, self._manifest(root_dir).read_verified())
+
+  def test_stale_when_key_changes(self):
+    with temporary_dir() as root_dir:
+      touch(os.path.join(root_dir, 'bin', 'perl6'))
+      self._manifest(root_dir).write(['bin/perl6'])
+      self.assertIsNone(self._manifest(root_dir, key={'moar': 'other'}).read_verified())
+
+  def test_stale_when_file_changes(self):
+    with temporary_dir() as root_dir:
+      exe_path = os.path.join(root_dir, 'bin', 'perl6')
+      touch(exe_path)
+      self._manifest(root_dir).write(['bin/perl6'])
+      with open(exe_path, 'w') as f:
+        f.write('#!/bin/sh\n')
+      self.assertIsNone(self._manifest(root_dir).read_verified())
+
+  def test_stale_when_manifest_is_edited(self):
+    with temporary_dir() as root_dir:
+      touch(os.path.join(root_dir, 'bin', 'perl6'))
+      manifest = self._manifest(root_dir)
+      manifest.write(['bin/perl6'])
+      manifest_path = os.path.join(root_dir, 'manifest.json')
+      with open(manifest_path, 'r') as f:
+        contents = json.load(f)
+      contents['files']['bin/zef'] = [0, 0]
+      with open(manifest_path, 'w') as f:
+        json.dump(contents, f)
+      self.assertIsNone(manifest.read_verified())
@@ -0,0 +1,33 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import json
+import os
+import tempfile
+
+from pants.util.dirutil import safe_mkdir
+
+
+def read_json(path):
+  """Return the json object stored at `path`, or None if it is missing or unreadable."""
+  try:
+    with open(path, 'r') as f:
+      return json.load(f)
+  except (IOError, OSError, ValueError):
+    return None
+
+
+def write_json_atomic(path, obj):
+  """Write `obj` to `path` such that concurrent readers never see a partially written file."""
+  dirname = os.path.dirname(path)
+  safe_mkdir(dirname)
+  # NB: This is called from worker threads as well as processes, so each writer needs a temp file
+  # of its own.
+  fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix='{}.tmp-'.format(os.path.basename(path)))
+  try:
+    with os.fdopen(fd, 'w') as f:
+      json.dump(obj, f, sort_keys=True)
+    os.rename(tmp_path, path)
+  except Exception:
+    os.unlink(tmp_path)
+    raise
@@ -0,0 +1,33 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+
+def default_parallelism():
+  """The number of concurrent subprocesses to run by default: one per core."""
+  return multiprocessing.cpu_count()
+
+
+# NB: Waiting on an AsyncResult without a timeout can't be interrupted with control-c on python 2.
+_WAIT_TIMEOUT_SECONDS = 60 * 60 * 24 * 365
+
+
+def parallel_map(fn, items, parallelism):
+  """Return `[fn(item) for item in items]`, using at most `parallelism` threads.
+
+  This is meant for fanning out work which spends its time waiting on subprocesses. If any call
+  raises, the first such exception is re-raised here after the pool is torn down.
+  """
+  items = list(items)
+  num_threads = min(parallelism, len(items))
+  if num_threads <= 1:
+    return [fn(item) for item in items]
+
+  pool = ThreadPool(processes=num_threads)
+  try:
+    return pool.map_async(fn, items, chunksize=1).get(_WAIT_TIMEOUT_SECONDS)
+  finally:
+    pool.terminate()
+    pool.join()
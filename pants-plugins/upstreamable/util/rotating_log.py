@@ -0,0 +1,70 @@
+from __future__ import (absolute_import, division, generators, nested_scopes,
+                        print_function, unicode_literals, with_statement)
+
+import os
+from collections import deque
+
+from pants.util.dirutil import safe_mkdir
+
+
+class RotatingLog(object):
+  """A log file of a subprocess's output, which keeps a bounded amount of it on disk and in memory.
+
+  When the file grows past `max_bytes`, it is moved aside to `<path>.1` (and any `<path>.1` to
+  `<path>.2`, and so on, up to `backups` of them), and a new one started. The file of an earlier
+  run is moved aside the same way when the log is opened. The last `tail_lines` lines are also
+  kept in memory, to report when the subprocess fails.
+  """
+
+  def __init__(self, path, max_bytes, backups, tail_lines):
+    self.path = path
+    self._max_bytes = max_bytes
+    self._backups = backups
+    self._tail = deque(maxlen=tail_lines)
+    self._file = None
+    self._size = 0
+
+  def __enter__(self):
+    safe_mkdir(os.path.dirname(self.path))
+    if os.path.exists(self.path):
+      self._rotate()
+    self._file = open(self.path, 'wb')
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self._file.close()
+
+  def _rotate(self):
+    if self._file is not None:
+      self._file.close()
+    for i in reversed(range(1, self._backups)):
+      older = '{}.{}'.format(self.path, i)
+      if os.path.exists(older):
+        os.rename(older, '{}.{}'.format(self.path, i + 1))
+    if self._backups > 0:
+      os.rename(self.path, '{}.1'.format(self.path))
+    else:
+      os.unlink(self.path)
+    self._size = 0
+
+  def write(self, line):
+    """Append a line of output, as bytes including its newline."""
+    if self._size > 0 and self._size + len(line) > self._max_bytes:
+      self._rotate()
+      self._file = open(self.path, 'wb')
+    self._file.write(line)
+    self._file.flush()
+    self._size += len(line)
+    self._tail.append(line)
+
+  @property
+  def tail(self):
+    """The last lines of output, decoded."""
+    return [line.decode('utf-8', 'replace').rstrip('\n') for line in self._tail]
+
+  def describe_failure(self):
+    """A description of where to find the output of a failed subprocess, to add to its error."""
+    if not self._tail:
+      return 'It produced no output; see {}.'.format(self.path)
+    return 'The full log is at {}. The last {} lines were:\n{}'.format(
+      self.path, len(self._tail), '\n'.join(self.tail))